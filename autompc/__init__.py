@@ -1,11 +1,16 @@
 print("Loading AutoMPC...")
 
+__version__ = "0.0.1"
+
 from .sysid.model import Model
 from .system import System
 from .control.controller import Controller
-from .trajectory import Trajectory, zeros, empty, extend
+from .trajectory import Trajectory, TrajectoryBuilder, zeros, empty, extend
+from .trajectory_set import TrajectorySet, to_trajectory_set
+from .trajectory_store import TrajectoryStore
 from .tasks import Task
-from .utils import make_model, make_controller, simulate
+from .utils import make_model, make_controller, simulate, simulate_batch
+from .utils import EpisodeRunner
 from .pipeline import Pipeline
 
 print("Finished loading AutoMPC")
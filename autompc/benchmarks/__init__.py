@@ -1,4 +1,5 @@
 from .benchmark import Benchmark
+from .dataset_cache import DatasetCache
 from .cartpole import CartpoleSwingupBenchmark
 from .cartpole_v2 import CartpoleSwingupV2Benchmark
 from .halfcheetah import HalfcheetahBenchmark
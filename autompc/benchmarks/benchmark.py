@@ -37,8 +37,47 @@ class Benchmark(ABC):
         """
         raise NotImplementedError
 
+    def dynamics_batch(self, X, U):
+        """
+        Benchmark dynamics evaluated for a batch of observations and
+        controls.  The default implementation loops over dynamics;
+        benchmarks override it with a vectorized implementation where
+        available.
+
+        Parameters
+        ----------
+        X : np array of shape (N, self.system.obs_dim)
+            Current observations
+
+        U : np array of shape (N, self.system.ctrl_dim)
+            Control inputs
+
+        Returns
+        -------
+        Xnew : np array of shape (N, self.system.obs_dim)
+            New observations.
+        """
+        X = np.asarray(X, dtype=float)
+        U = np.asarray(U, dtype=float)
+        Xnew = np.empty_like(X)
+        for i in range(X.shape[0]):
+            Xnew[i] = self.dynamics(np.copy(X[i]), U[i])
+        return Xnew
+
+    def get_cache_params(self):
+        """
+        Returns the parameters which determine the data generated by
+        gen_trajs, used as part of the DatasetCache key.  Benchmarks with
+        additional constructor options should extend this.
+
+        Returns
+        -------
+         : dict
+        """
+        return {"data_gen_method" : self._data_gen_method}
+
     @abstractmethod
-    def gen_trajs(self, seed, n_trajs, traj_len=None):
+    def gen_trajs(self, seed, n_trajs, traj_len=None, n_workers=None):
         """
         Generate trajectories.
 
@@ -54,9 +93,15 @@ class Benchmark(ABC):
             Length of trajectories to generate. Default varies
             by benchmark.
 
+        n_workers : int
+            If given, trajectories are generated over this many worker
+            processes. Each trajectory is seeded from its own child
+            SeedSequence, also when generating serially, so the data
+            depends only on the seed and not on n_workers.
+
         Returns
         -------
-         : List of Trajectory
+         : List of Trajectory or TrajectorySet
             Benchmark training set
         """
         raise NotImplementedError
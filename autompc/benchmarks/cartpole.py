@@ -35,6 +35,71 @@ def dt_cartpole_dynamics(y,u,dt,g=9.8,m=1,L=1,b=1.0):
     y += dt * cartpole_simp_dynamics(y,u[0],g,m,L,b)
     return y
 
+def cartpole_simp_dynamics_batch(Y, U, g = 9.8, m = 1, L = 1, b = 0.1):
+    """
+    Vectorized version of cartpole_simp_dynamics.
+
+    Parameters
+    ----------
+        Y : states of shape (N, 4)
+        U : controls of shape (N, 1)
+
+    Returns
+    -------
+        Array of shape (N, 4) describing the dynamics of each cart pole
+    """
+    theta, omega, dx = Y[:,0], Y[:,1], Y[:,3]
+    u = U[:,0]
+    return np.stack([omega,
+            g * np.sin(theta)/L - b * omega / (m*L**2) + u * np.cos(theta)/L,
+            dx,
+            u], axis=1)
+
+_INTEGRATORS = ["euler", "semi_implicit", "rk4"]
+
+def dt_cartpole_dynamics_batch(Y, U, dt, g=9.8, m=1, L=1, b=1.0,
+        integrator="euler", n_substeps=1):
+    """
+    Discrete-time cartpole dynamics for a batch of states.  With the
+    default explicit Euler integrator and a single sub-step, this matches
+    dt_cartpole_dynamics row by row.
+
+    Parameters
+    ----------
+        Y : states of shape (N, 4)
+        U : controls of shape (N, 1)
+        dt : time step
+        integrator : one of "euler", "semi_implicit", or "rk4"
+        n_substeps : number of integration sub-steps per time step
+
+    Returns
+    -------
+        Next states of shape (N, 4)
+    """
+    Y = np.array(Y, dtype=float)
+    U = np.asarray(U, dtype=float)
+    f = lambda Y: cartpole_simp_dynamics_batch(Y, U, g, m, L, b)
+    h = dt / n_substeps
+    for _ in range(n_substeps):
+        if integrator == "euler":
+            Y += h * f(Y)
+        elif integrator == "semi_implicit":
+            # Update velocities first, then positions with the new velocities
+            dY = f(Y)
+            Y[:,1] += h * dY[:,1]
+            Y[:,3] += h * dY[:,3]
+            Y[:,0] += h * Y[:,1]
+            Y[:,2] += h * Y[:,3]
+        elif integrator == "rk4":
+            k1 = f(Y)
+            k2 = f(Y + h/2 * k1)
+            k3 = f(Y + h/2 * k2)
+            k4 = f(Y + h * k3)
+            Y += h/6 * (k1 + 2*k2 + 2*k3 + k4)
+        else:
+            raise ValueError("Unknown integrator {}".format(integrator))
+    return Y
+
 class CartpoleSwingupBenchmark(Benchmark):
     """
     This benchmark uses the cartpole system and is consistent with the
@@ -43,7 +108,28 @@ class CartpoleSwingupBenchmark(Benchmark):
     returns 1 for every observation which is more than 0.2 away from the goal
     in either the angle or angular velocity dimensions, and 0 otherwise.
     """
-    def __init__(self, data_gen_method="uniform_random"):
+    # Physical parameters of the cart-pole
+    physics = dict(g=9.8, m=1, L=1, b=1.0)
+
+    def __init__(self, data_gen_method="uniform_random", integrator="euler",
+            n_substeps=1):
+        """
+        Parameters
+        ----------
+        data_gen_method : string
+            Method used by gen_trajs. See data_gen_methods.
+
+        integrator : string
+            Integration scheme of the dynamics. One of "euler",
+            "semi_implicit", or "rk4". Default is "euler".
+
+        n_substeps : int
+            Number of integration sub-steps per time step. Default is 1.
+        """
+        if integrator not in _INTEGRATORS:
+            raise ValueError("Unknown integrator {}".format(integrator))
+        self._integrator = integrator
+        self._n_substeps = n_substeps
         name = "cartpole_swingup"
         system = ampc.System(["theta", "omega", "x", "dx"], ["u"])
         system.dt = 0.05
@@ -59,7 +145,20 @@ class CartpoleSwingupBenchmark(Benchmark):
         super().__init__(name, system, task, data_gen_method)
 
     def dynamics(self, x, u):
-        return dt_cartpole_dynamics(x,u,self.system.dt,g=9.8,m=1,L=1,b=1.0)
+        if self._integrator == "euler" and self._n_substeps == 1:
+            return dt_cartpole_dynamics(x,u,self.system.dt,**self.physics)
+        return self.dynamics_batch(x[np.newaxis], np.asarray(u)[np.newaxis])[0]
+
+    def get_cache_params(self):
+        params = super().get_cache_params()
+        params.update(integrator=self._integrator, n_substeps=self._n_substeps,
+                **self.physics)
+        return params
+
+    def dynamics_batch(self, X, U):
+        return dt_cartpole_dynamics_batch(X, U, self.system.dt,
+                integrator=self._integrator, n_substeps=self._n_substeps,
+                **self.physics)
 
     def visualize(self, fig, ax, traj, margin=5.0):
         """
@@ -118,29 +217,42 @@ class CartpoleSwingupBenchmark(Benchmark):
 
         return anim
 
-    def _gen_trajs(self, n_trajs, traj_len, rng):
+    def _gen_trajs(self, n_trajs, traj_len, rng, batched=False, n_workers=None):
+        dynamics_batch = self.dynamics_batch if batched else None
         init_min = np.array([-1.0, 0.0, 0.0, 0.0])
         init_max = np.array([1.0, 0.0, 0.0, 0.0])
         if self._data_gen_method == "uniform_random":
             return uniform_random_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "periodic_control":
             return periodic_control_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, U_1=np.ones(1),
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "multisine":
             return multisine_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, n_freqs=20,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "random_walk":
             return random_walk_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, walk_rate=1.0,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
 
-    def gen_trajs(self, seed, n_trajs, traj_len=200):
+    def gen_trajs(self, seed, n_trajs, traj_len=200, batched=False, n_workers=None):
+        """
+        Generate trajectories.  See Benchmark.gen_trajs.  If batched is
+        True, all trajectories are advanced together with dynamics_batch
+        and returned as a TrajectorySet.  Batched generation draws its
+        random numbers in a different order, so it produces a different
+        data set for the same seed.
+        """
         rng = np.random.default_rng(seed)
-        return self._gen_trajs(n_trajs, traj_len, rng)
+        return self._gen_trajs(n_trajs, traj_len, rng, batched=batched,
+                n_workers=n_workers)
 
 
     @staticmethod
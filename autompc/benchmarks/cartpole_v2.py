@@ -10,6 +10,7 @@ import matplotlib.animation as animation
 
 # Project includes
 from .benchmark import Benchmark
+from .cartpole import dt_cartpole_dynamics_batch, _INTEGRATORS
 from ..utils.data_generation import *
 from .. import System
 from ..tasks import Task
@@ -42,7 +43,28 @@ class CartpoleSwingupV2Benchmark(Benchmark):
     in that the performance metric requires the cartpole to stay within the [-10, 10]
     range.
     """
-    def __init__(self, data_gen_method="uniform_random"):
+    # Physical parameters of the cart-pole
+    physics = dict(g=0.8, m=1, L=1, b=1.0)
+
+    def __init__(self, data_gen_method="uniform_random", integrator="euler",
+            n_substeps=1):
+        """
+        Parameters
+        ----------
+        data_gen_method : string
+            Method used by gen_trajs. See data_gen_methods.
+
+        integrator : string
+            Integration scheme of the dynamics. One of "euler",
+            "semi_implicit", or "rk4". Default is "euler".
+
+        n_substeps : int
+            Number of integration sub-steps per time step. Default is 1.
+        """
+        if integrator not in _INTEGRATORS:
+            raise ValueError("Unknown integrator {}".format(integrator))
+        self._integrator = integrator
+        self._n_substeps = n_substeps
         name = "cartpole_swingup"
         system = ampc.System(["theta", "omega", "x", "dx"], ["u"])
         system.dt = 0.05
@@ -59,7 +81,20 @@ class CartpoleSwingupV2Benchmark(Benchmark):
         super().__init__(name, system, task, data_gen_method)
 
     def dynamics(self, x, u):
-        return dt_cartpole_dynamics(x,u,self.system.dt,g=0.8,m=1,L=1,b=1.0)
+        if self._integrator == "euler" and self._n_substeps == 1:
+            return dt_cartpole_dynamics(x,u,self.system.dt,**self.physics)
+        return self.dynamics_batch(x[np.newaxis], np.asarray(u)[np.newaxis])[0]
+
+    def get_cache_params(self):
+        params = super().get_cache_params()
+        params.update(integrator=self._integrator, n_substeps=self._n_substeps,
+                **self.physics)
+        return params
+
+    def dynamics_batch(self, X, U):
+        return dt_cartpole_dynamics_batch(X, U, self.system.dt,
+                integrator=self._integrator, n_substeps=self._n_substeps,
+                **self.physics)
 
     def visualize(self, fig, ax, traj, margin=5.0):
         """
@@ -119,29 +154,42 @@ class CartpoleSwingupV2Benchmark(Benchmark):
 
         return anim
 
-    def _gen_trajs(self, n_trajs, traj_len, rng):
+    def _gen_trajs(self, n_trajs, traj_len, rng, batched=False, n_workers=None):
+        dynamics_batch = self.dynamics_batch if batched else None
         init_min = np.array([-1.0, 0.0, 0.0, 0.0])
         init_max = np.array([1.0, 0.0, 0.0, 0.0])
         if self._data_gen_method == "uniform_random":
             return uniform_random_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "periodic_control":
             return periodic_control_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, U_1=np.ones(1),
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "multisine":
             return multisine_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, n_freqs=20,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
         elif self._data_gen_method == "random_walk":
             return random_walk_generate(self.system, self.task, self.dynamics, rng, 
                     init_min=init_min, init_max=init_max, walk_rate=1.0,
-                    traj_len=traj_len, n_trajs=n_trajs)
+                    traj_len=traj_len, n_trajs=n_trajs,
+                    dynamics_batch=dynamics_batch, n_workers=n_workers)
 
-    def gen_trajs(self, seed, n_trajs, traj_len=200):
+    def gen_trajs(self, seed, n_trajs, traj_len=200, batched=False, n_workers=None):
+        """
+        Generate trajectories.  See Benchmark.gen_trajs.  If batched is
+        True, all trajectories are advanced together with dynamics_batch
+        and returned as a TrajectorySet.  Batched generation draws its
+        random numbers in a different order, so it produces a different
+        data set for the same seed.
+        """
         rng = np.random.default_rng(seed)
-        return self._gen_trajs(n_trajs, traj_len, rng)
+        return self._gen_trajs(n_trajs, traj_len, rng, batched=batched,
+                n_workers=n_workers)
 
     def get_cached_tune_result(self):
         dirname = os.path.dirname(__file__)
@@ -0,0 +1,203 @@
+# Standard library includes
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+# Internal library includes
+from .. import __version__
+from ..trajectory_store import TrajectoryStore
+
+_ACCESS_NAME = "last_access"
+
+def _default_cache_dir():
+    return os.environ.get("AUTOMPC_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "autompc", "datasets"))
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+class DatasetCache:
+    """
+    The DatasetCache stores generated benchmark data sets on disk so that
+    repeated experiments do not re-simulate them.  Each data set is
+    addressed by a hash of the benchmark name and class, its data generation method
+    and parameters, the seed, the number and length of trajectories, and
+    the AutoMPC version.  Data sets are saved as TrajectoryStores and
+    returned memory mapped on a cache hit.
+
+    When the total size of the cache exceeds max_bytes, the least recently
+    used data sets are removed.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Parameters
+        ----------
+        cache_dir : string
+            Cache directory.  Defaults to the AUTOMPC_CACHE_DIR environment
+            variable if set, otherwise ~/.cache/autompc/datasets.
+
+        max_bytes : int
+            Maximum total size of the cache in bytes. If None, the cache
+            is not size bounded.
+        """
+        if cache_dir is None:
+            cache_dir = _default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(self, benchmark, seed, n_trajs, traj_len=None, **kwargs):
+        """
+        Returns the cache key of a data set.
+
+        Parameters
+        ----------
+        benchmark : Benchmark
+            Benchmark which generates the data set
+
+        seed : int
+            Seed for trajectory generation
+
+        n_trajs : int
+            Number of trajectories
+
+        traj_len : int
+            Length of trajectories. If None, the benchmark default is used.
+
+        kwargs : dict
+            Additional keyword arguments of gen_trajs.
+        """
+        params = dict(kwargs)
+        # The worker count does not change the data
+        params.pop("n_workers", None)
+        # Benchmarks may share a name, so the class is part of the key too
+        benchmark_class = "{}.{}".format(type(benchmark).__module__,
+                type(benchmark).__qualname__)
+        desc = {"benchmark" : benchmark.name,
+                "benchmark_class" : benchmark_class,
+                "params" : benchmark.get_cache_params(),
+                "gen_params" : params,
+                "seed" : seed,
+                "n_trajs" : n_trajs,
+                "traj_len" : traj_len,
+                "version" : __version__}
+        desc = json.dumps(desc, sort_keys=True, default=str)
+        return hashlib.sha256(desc.encode("utf-8")).hexdigest()
+
+    def _touch(self, path):
+        now = time.time()
+        with open(os.path.join(path, _ACCESS_NAME), "w") as f:
+            f.write(str(now))
+        os.utime(os.path.join(path, _ACCESS_NAME), (now, now))
+
+    def _last_access(self, path):
+        try:
+            return os.path.getmtime(os.path.join(path, _ACCESS_NAME))
+        except OSError:
+            return 0.0
+
+    def entries(self):
+        """
+        Returns the keys of all cached data sets, least recently used first.
+        """
+        keys = [name for name in os.listdir(self.cache_dir)
+                if os.path.isdir(os.path.join(self.cache_dir, name))
+                and not name.startswith(".")]
+        return sorted(keys, key=lambda key: self._last_access(
+            os.path.join(self.cache_dir, key)))
+
+    def size(self):
+        """
+        Returns the total size of the cached data sets in bytes.
+        """
+        return sum(_dir_size(os.path.join(self.cache_dir, key))
+                for key in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used data sets until the cache is within
+        max_bytes.
+
+        Parameters
+        ----------
+        keep : string
+            Key of a data set which is never evicted.
+        """
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        sizes = {key : _dir_size(os.path.join(self.cache_dir, key))
+                for key in entries}
+        total = sum(sizes.values())
+        for key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= sizes[key]
+
+    def clear(self):
+        """
+        Remove all cached data sets.
+        """
+        for key in self.entries():
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def gen_trajs(self, benchmark, seed, n_trajs, traj_len=None, **kwargs):
+        """
+        Returns the benchmark data set, generating and caching it on
+        a cache miss.
+
+        Parameters
+        ----------
+        benchmark : Benchmark
+            Benchmark which generates the data set
+
+        seed : int
+            Seed for trajectory generation
+
+        n_trajs : int
+            Number of trajectories
+
+        traj_len : int
+            Length of trajectories. If None, the benchmark default is used.
+
+        kwargs : dict
+            Additional keyword arguments passed to benchmark.gen_trajs.
+
+        Returns
+        -------
+        trajs : TrajectoryStore
+            Memory mapped data set
+        """
+        key = self.get_key(benchmark, seed, n_trajs, traj_len, **kwargs)
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(path):
+            self._touch(path)
+            return TrajectoryStore(path)
+
+        if traj_len is None:
+            trajs = benchmark.gen_trajs(seed, n_trajs, **kwargs)
+        else:
+            trajs = benchmark.gen_trajs(seed, n_trajs, traj_len, **kwargs)
+        # Write to a temporary directory first so that concurrent readers
+        # never observe a partially written data set.
+        tmp_path = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        store = TrajectoryStore(tmp_path, system=benchmark.system)
+        store.append(trajs)
+        self._touch(tmp_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process cached the same data set first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict(keep=key)
+        return TrajectoryStore(path)
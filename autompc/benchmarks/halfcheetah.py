@@ -69,23 +69,26 @@ class HalfcheetahCost(Cost):
     def eval_ctrl_cost(self):
         raise NotImplementedError
 
-def gen_trajs(env, system, num_trajs=1000, traj_len=1000, seed=42):
+def gen_trajs(env, system, num_trajs=1000, traj_len=1000, seed=42, n_workers=None):
     rng = np.random.default_rng(seed)
-    trajs = []
+    # Serial generation uses the same per-trajectory seeding as the
+    # worker pool, so the data set does not depend on n_workers
+    gen_traj = lambda i, traj_rng: _gen_traj(env, system, traj_len, traj_rng)
+    return parallel_generate(system, gen_traj, num_trajs, rng,
+            1 if n_workers is None else n_workers)
+
+def _gen_traj(env, system, traj_len, rng):
     env.seed(int(rng.integers(1 << 30)))
     env.action_space.seed(int(rng.integers(1 << 30)))
-    for i in range(num_trajs):
-        init_obs = env.reset()
-        traj = ampc.zeros(system, traj_len)
-        traj[0].obs[:] = np.concatenate([[0], init_obs])
-        for j in range(1, traj_len):
-            action = env.action_space.sample()
-            traj[j-1].ctrl[:] = action
-            #obs, reward, done, info = env.step(action)
-            obs = halfcheetah_dynamics(traj[j-1].obs[:], action)
-            traj[j].obs[:] = obs
-        trajs.append(traj)
-    return trajs
+    init_obs = env.reset()
+    traj = ampc.zeros(system, traj_len)
+    traj[0].obs[:] = np.concatenate([[0], init_obs])
+    for j in range(1, traj_len):
+        action = env.action_space.sample()
+        traj[j-1].ctrl[:] = action
+        obs = halfcheetah_dynamics(env, traj[j-1].obs[:], action)
+        traj[j].obs[:] = obs
+    return traj
 
 
 class HalfcheetahBenchmark(Benchmark):
@@ -118,8 +121,9 @@ class HalfcheetahBenchmark(Benchmark):
     def dynamics(self, x, u):
         return halfcheetah_dynamics(self.env,x,u)
 
-    def gen_trajs(self, seed, n_trajs, traj_len=200):
-        return gen_trajs(self.env, self.system, n_trajs, traj_len, seed)
+    def gen_trajs(self, seed, n_trajs, traj_len=200, n_workers=None):
+        return gen_trajs(self.env, self.system, n_trajs, traj_len, seed,
+                n_workers=n_workers)
 
     def visualize(self, traj, repeat):
         """
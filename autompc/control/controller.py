@@ -94,6 +94,47 @@ class Controller(ABC):
         """
         raise NotImplementedError
 
+    def run_batch(self, states, new_obs):
+        """
+        Run the controller for a time step of N independent episodes
+        at once.  Only implemented for controllers which support
+        batched execution, see is_batch.
+
+        Parameters
+        ----------
+            states : numpy array of shape (N, self.state_dim)
+                Current controller states
+            new_obs : numpy array of shape (N, self.system.obs_dim)
+                Current observations
+        Returns
+        -------
+            ctrls : numpy array of shape (N, self.system.ctrl_dim)
+                Next control inputs
+            newstates : numpy array of shape (N, self.state_dim)
+                New controller states
+        """
+        raise NotImplementedError
+
+    def get_plan(self):
+        """
+        Returns the controls the controller currently plans to apply
+        at the following time steps, starting with the next one.
+        Controllers which do not plan ahead return None.
+
+        Returns
+        -------
+            plan : numpy array of shape (H, self.system.ctrl_dim) or None
+                Planned future controls
+        """
+        return None
+
+    @property
+    def is_batch(self):
+        """
+        Returns true for controllers which implement run_batch.
+        """
+        return not self.run_batch.__func__ is Controller.run_batch
+
     def reset(self):
         """
         Re-initialize the controller. For controllers which
@@ -293,3 +293,8 @@ class IterativeLQR(Controller):
         self._step_count += 1
         statenew = np.concatenate([state, u])
         return u, statenew
+
+    def get_plan(self):
+        if getattr(self, "_states", None) is None:
+            return None
+        return np.copy(self._ctrls[self._step_count:])
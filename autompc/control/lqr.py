@@ -4,6 +4,7 @@ from pdb import set_trace
 
 import numpy as np
 import numpy.linalg as la
+import scipy.linalg as sla
 
 from ConfigSpace import ConfigurationSpace
 from ConfigSpace.hyperparameters import (UniformIntegerHyperparameter, 
@@ -19,16 +20,18 @@ def _dynamic_ricatti_equation(A, B, Q, R, N, Pk):
               @ (B.T @ Pk @ A + N.T)
             + Q)
 
-def _inf_horz_dt_lqr(A, B, Q, R, N, threshold=1e-3):
-    P1 = Q
-    P2 = _dynamic_ricatti_equation(A, B, Q, R, N, P1)
-    Pdiff = np.abs(P1 - P2)
-    while Pdiff.max() > threshold:
-        P1 = P2
-        P2 = _dynamic_ricatti_equation(A, B, Q, R, N, P1)
-        Pdiff = np.abs(P1 - P2)
-
-    K = -la.inv(R + B.T @ P2 @ B) @ B.T @ P2 @ A
+def _inf_horz_dt_lqr(A, B, Q, R, N, threshold=1e-3, max_iters=10000):
+    # Iterate until the gain converges. The cost-to-go of uncontrollable
+    # unit modes, such as the constant feature of ARX states, grows without
+    # bound while the gain still converges.
+    P = Q
+    K = -la.inv(R + B.T @ P @ B) @ B.T @ P @ A
+    for _ in range(max_iters):
+        P = _dynamic_ricatti_equation(A, B, Q, R, N, P)
+        Knew = -la.inv(R + B.T @ P @ B) @ B.T @ P @ A
+        if np.abs(Knew - K).max() <= threshold:
+            return Knew
+        K = Knew
 
     return K
 
@@ -41,11 +44,13 @@ def _finite_horz_dt_lqr(A, B, Q, R, N, F, horizon):
         Pdiff = np.abs(P1 - P2)
 
     K = -la.inv(R + B.T @ P2 @ B) @ B.T @ P2 @ A
-    print("P2=")
-    print(P2)
 
     return K
 
+def _relative_change(A0, B0, A, B):
+    scale = la.norm(A0) + la.norm(B0)
+    return (la.norm(A - A0) + la.norm(B - B0)) / max(scale, 1e-12)
+
 #class InfiniteHorizonLQR(Controller):
 #    def __init__(self, system, model, Q, R):
 #        if not model.is_linear:
@@ -94,17 +99,36 @@ def _finite_horz_dt_lqr(A, B, Q, R, N, F, horizon):
 #             controller = InfiniteHorizonLQR(self.system, task, model)
 
 class InfiniteHorizonLQR(Controller):
-    def __init__(self, system, task, model):
+    def __init__(self, system, task, model, gain_update_threshold=1e-2):
         super().__init__(system, task, model)
-        A, B = model.to_linear()
         state_dim = model.state_dim
         Q, R, F = task.get_cost().get_cost_matrices()
         Qp = np.zeros((state_dim, state_dim))
         Qp[:Q.shape[0], :Q.shape[1]] = Q
-        X, L, K = dare(A, B, Qp, R)
-        self.K = K
         self.Qp, self.Rp = Qp, R
         self.model = model
+        self.gain_update_threshold = gain_update_threshold
+        self._set_gain(*model.to_linear())
+
+    def _set_gain(self, A, B):
+        try:
+            P = sla.solve_discrete_are(A, B, self.Qp, self.Rp)
+            self.K = -la.solve(self.Rp + B.T @ P @ B, B.T @ P @ A)
+        except (la.LinAlgError, ValueError):
+            # The direct solver has no finite solution for states with
+            # uncontrollable unit modes, so fall back to value iteration
+            N = np.zeros((A.shape[0], B.shape[1]))
+            self.K = _inf_horz_dt_lqr(A, B, self.Qp, self.Rp, N)
+        self._A, self._B = np.copy(A), np.copy(B)
+
+    def _update_gain(self):
+        # Recompute the gain only once an online model has drifted
+        # sufficiently from the matrices it was computed for.
+        if not self.model.is_online:
+            return
+        A, B = self.model.to_linear()
+        if _relative_change(self._A, self._B, A, B) > self.gain_update_threshold:
+            self._set_gain(A, B)
 
     @property
     def state_dim(self):
@@ -127,6 +151,7 @@ class InfiniteHorizonLQR(Controller):
         # Implement control logic here
         modelstate = self.model.update_state(state[:-self.system.ctrl_dim],
                 state[-self.system.ctrl_dim:], new_obs)
+        self._update_gain()
         u = np.array(self.K @ modelstate).flatten()
         print("state={}".format(state))
         print("u={}".format(u))
@@ -135,11 +160,18 @@ class InfiniteHorizonLQR(Controller):
 
         return u, statenew
 
+    def run_batch(self, states, new_obs):
+        modelstates = self.model.update_state_batch(states[:,:-self.system.ctrl_dim],
+                states[:,-self.system.ctrl_dim:], new_obs)
+        self._update_gain()
+        us = modelstates @ np.asarray(self.K).T
+        statesnew = np.concatenate([modelstates, us], axis=1)
+
+        return us, statesnew
+
 class FiniteHorizonLQR(Controller):
-    def __init__(self, system, task, model, horizon):
+    def __init__(self, system, task, model, horizon, gain_update_threshold=1e-2):
         super().__init__(system, task, model)
-        A, B = model.to_linear()
-        N = np.zeros((A.shape[0], B.shape[1]))
         self.horizon = horizon
         state_dim = model.state_dim
         #Q, R, F = task.get_quad_cost()
@@ -148,12 +180,28 @@ class FiniteHorizonLQR(Controller):
         Qp[:Q.shape[0], :Q.shape[1]] = Q
         Fp = np.zeros((state_dim, state_dim))
         Fp[:F.shape[0], :F.shape[1]] = F
-        self.K = _finite_horz_dt_lqr(A, B, Qp, R, N, Fp, horizon)
-        self.Qp, self.Rp = Qp, R
+        self.Qp, self.Rp, self.Fp = Qp, R, Fp
         self.model = model
+        self.gain_update_threshold = gain_update_threshold
+        self._set_gain(*model.to_linear())
         self.umin = task.get_ctrl_bounds()[:,0]
         self.umax = task.get_ctrl_bounds()[:,1]
 
+    def _set_gain(self, A, B):
+        N = np.zeros((A.shape[0], B.shape[1]))
+        self.K = _finite_horz_dt_lqr(A, B, self.Qp, self.Rp, N, self.Fp,
+                self.horizon)
+        self._A, self._B = np.copy(A), np.copy(B)
+
+    def _update_gain(self):
+        # Recompute the gain only once an online model has drifted
+        # sufficiently from the matrices it was computed for.
+        if not self.model.is_online:
+            return
+        A, B = self.model.to_linear()
+        if _relative_change(self._A, self._B, A, B) > self.gain_update_threshold:
+            self._set_gain(A, B)
+
     @property
     def state_dim(self):
         return self.model.state_dim + self.system.ctrl_dim
@@ -175,6 +223,7 @@ class FiniteHorizonLQR(Controller):
         # Implement control logic here
         modelstate = self.model.update_state(state[:-self.system.ctrl_dim],
                 state[-self.system.ctrl_dim:], new_obs)
+        self._update_gain()
         x0 = self.task.get_cost().get_goal()
         if x0.size < modelstate.size:
             state0 = np.zeros(modelstate.size)
@@ -191,6 +240,20 @@ class FiniteHorizonLQR(Controller):
 
         return u, statenew
 
+    def run_batch(self, states, new_obs):
+        modelstates = self.model.update_state_batch(states[:,:-self.system.ctrl_dim],
+                states[:,-self.system.ctrl_dim:], new_obs)
+        self._update_gain()
+        x0 = self.task.get_cost().get_goal()
+        state0 = np.zeros(modelstates.shape[1])
+        state0[:x0.size] = x0[:modelstates.shape[1]]
+        us = (modelstates - state0) @ self.K.T
+        us = np.minimum(us, self.umax)
+        us = np.maximum(us, self.umin)
+        statesnew = np.concatenate([modelstates, us], axis=1)
+
+        return us, statesnew
+
 class LQRFactory(ControllerFactory):
     """
     Linear Quadratic Regulator (LQR) is some classical results from linear system theory and optimal control theory.
@@ -205,6 +268,11 @@ class LQRFactory(ControllerFactory):
     
     - *finite_horizon* (Type: str, Choices: ["true", "false"], Default: "finite"): Whether horizon is finite or infinite.
     - *horizon* (Type: int, Low: 1, High: 1000, Default: 10): Length of control horizon. (Conditioned on finite_horizon="true").
+
+    When the model has online adaptation enabled (see Model.is_online), the
+    gain is recomputed lazily once the relative change of the model A and B
+    matrices since the last gain computation exceeds the
+    *gain_update_threshold* factory keyword argument (Default: 0.01).
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -224,14 +292,17 @@ class LQRFactory(ControllerFactory):
         return cs
 
 class LQR(Controller):
-    def __init__(self, system, task, model, finite_horizon, horizon=None):
+    def __init__(self, system, task, model, finite_horizon, horizon=None,
+            gain_update_threshold=1e-2):
         super().__init__(system, task, model)
         if not isinstance(finite_horizon, bool):
             finite_horizon = True if finite_horizon == "true" else False
         if finite_horizon:
-            self._controller = FiniteHorizonLQR(system, task, model, horizon)
+            self._controller = FiniteHorizonLQR(system, task, model, horizon,
+                    gain_update_threshold=gain_update_threshold)
         else:
-            self._controller = InfiniteHorizonLQR(system, task, model)
+            self._controller = InfiniteHorizonLQR(system, task, model,
+                    gain_update_threshold=gain_update_threshold)
 
     @property
     def state_dim(self):
@@ -251,3 +322,6 @@ class LQR(Controller):
 
     def run(self, state, new_obs):
         return self._controller.run(state, new_obs)
+
+    def run_batch(self, states, new_obs):
+        return self._controller.run_batch(states, new_obs)
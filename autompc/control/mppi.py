@@ -41,6 +41,10 @@ class MPPIFactory(ControllerFactory):
     - *lmda* (Type: float, Lower: 10^-4, Upper: 2.0, Default: 1.0): Higher value increases the cost of control noise and gets more samples around current contorl sequence. 
         Generally smaller value works better.
     - *num_path* (Type: int, Lower: 100, Upper: 1000, Default: 200): Number of perturbed control sequence to sample. Generally the more the better and it scales better with vectorized and parallel computation.
+
+    If the factory is created with *sample_model=True*, the rollouts are sampled from the model's
+    get_batch_sampler instead of following its mean prediction, e.g. to spread them over the
+    members of an MLPEnsemble.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -69,6 +73,9 @@ class MPPI(Controller):
         self.kwargs = kwargs 
         self.model = model
         self.dyn_eqn = model.pred_batch
+        self.sample_model = kwargs.get('sample_model', False)
+        if self.sample_model and not hasattr(model, "get_batch_sampler"):
+            raise ValueError("sample_model requires a model with get_batch_sampler")
         cost = task.get_cost()
         def cost_eqn(path, actions):
             costs = np.zeros(path.shape[0])
@@ -130,6 +137,9 @@ class MPPI(Controller):
         path[:] = cur_state
         costs = np.zeros(self.num_path)
         action_cost = np.zeros_like(costs)
+        dyn_eqn = self.dyn_eqn
+        if self.sample_model:
+            dyn_eqn = self.model.get_batch_sampler(self.num_path, seed)
         for i in range(self.H):
             actions = eps[i] + self.act_sequence[i]
             # bound actions if necessary
@@ -141,7 +151,7 @@ class MPPI(Controller):
             # path[i + 1] = self.dyn_eqn(path[i], actions)
             costs += self.cost_eqn(path, actions*self.ctrl_scale)
             action_cost += self.lmda / self.sigma * np.einsum('ij,ij->i', actions, eps[i])
-            path = self.dyn_eqn(path, actions*self.ctrl_scale)
+            path = dyn_eqn(path, actions*self.ctrl_scale)
         # the final cost
         if self.terminal_cost:
             # costs += self.terminal_cost(path[-1])
@@ -167,6 +177,9 @@ class MPPI(Controller):
 
         return ret_action, statenew
 
+    def get_plan(self):
+        return self.act_sequence[1:] * self.ctrl_scale
+
     def traj_to_state(self, traj):
         return np.concatenate([self.model.traj_to_state(traj),
                 traj[-1].ctrl])
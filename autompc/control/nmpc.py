@@ -325,3 +325,10 @@ class DirectTranscriptionController(Controller):
         statenew = np.concatenate([x, u])
 
         return u, statenew
+
+    def get_plan(self):
+        if self._guess is None:
+            return None
+        dimu = self.problem.ctrl_dim
+        idx0 = self.problem.obs_dim * (self.horizon + 1)
+        return self._guess[idx0 + dimu : idx0 + self.horizon * dimu].reshape(-1, dimu)
@@ -44,3 +44,7 @@ class ZeroController(Controller):
     def run(self, state, new_obs):
 
         return np.zeros(self.system.ctrl_dim), state
+
+    def run_batch(self, states, new_obs):
+
+        return np.zeros((new_obs.shape[0], self.system.ctrl_dim)), states
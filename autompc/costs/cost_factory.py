@@ -44,7 +44,7 @@ class CostFactory(ABC):
         task : Task
             Input task
 
-        trajs : List of Trajectory
+        trajs : List of Trajectory or TrajectorySet
             Trajectory training set. This is mostly used
             for regularization cost terms and is not required by
             all CostFactories.  If not required, None can be
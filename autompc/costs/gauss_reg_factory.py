@@ -3,6 +3,7 @@
 # Internal library includes
 from .cost_factory import CostFactory
 from . import QuadCost
+from ..trajectory_set import to_trajectory_set
 
 # External library includes
 import numpy as np
@@ -35,7 +36,7 @@ class GaussRegFactory(CostFactory):
         return True
 
     def __call__(self, cfg, task, trajs):
-        X = np.concatenate([traj.obs[:,:] for traj in trajs])
+        X = to_trajectory_set(trajs, self.system).obs
         mean = np.mean(X, axis=0)
         cov = np.cov(X, rowvar=0)
         Q = cfg["reg_weight"] * la.inv(cov)
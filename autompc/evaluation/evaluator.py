@@ -3,6 +3,8 @@
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from .model_metrics import get_model_rmse
+from ..trajectory_set import to_trajectory_set
+from ..trajectory_store import TrajectoryStore
 
 class ModelEvaluator(ABC):
     """
@@ -14,8 +16,9 @@ class ModelEvaluator(ABC):
         ----------
         system : System
             System for which prediction accuracy is evaluated
-        trajs : List of Trajectory
-            Trajectories to be used for evaluation
+        trajs : List of Trajectory, TrajectorySet, or TrajectoryStore
+            Trajectories to be used for evaluation. Lists are converted
+            to a TrajectorySet.  A TrajectoryStore is kept on disk.
         metric : string or function (model, [Trajectory] -> float)
             Metric which evaluates the model against a set of trajectories.
             If string, one of "rmse", "rmsmens". See `model_metrics` for
@@ -26,7 +29,10 @@ class ModelEvaluator(ABC):
             Prediction horizon used in certain metrics. Default is 1.
         """
         self.system = system
-        self.trajs = trajs
+        if isinstance(trajs, TrajectoryStore):
+            self.trajs = trajs
+        else:
+            self.trajs = to_trajectory_set(trajs, system)
         self.rng = rng
         if isinstance(metric, str):
             if metric == "rmse":
@@ -17,8 +17,10 @@ class HoldoutModelEvaluator(ModelEvaluator):
         ----------
         system : System
             System for which prediction accuracy is evaluated
-        trajs : List of Trajectory
-            Trajectories to be used for evaluation
+        trajs : List of Trajectory, TrajectorySet, or TrajectoryStore
+            Trajectories to be used for evaluation.  For a TrajectoryStore,
+            the holdout and training sets are subsets which read from
+            the same files on disk.
         metric : string or function (model, [Trajectory] -> float)
             Metric which evaluates the model against a set of trajectories.
             If string, one of "rmse", "rmsmens". See `model_metrics` for
@@ -41,13 +43,15 @@ class HoldoutModelEvaluator(ModelEvaluator):
             holdout_size = round(holdout_prop * len(self.trajs))
             holdout_indices = self.rng.choice(np.arange(len(self.trajs)), 
                     holdout_size, replace=False)
-            self.holdout = [self.trajs[i] for i in sorted(holdout_indices)]
+            holdout_indices = sorted(holdout_indices)
+            self.holdout = self.trajs.subset(holdout_indices)
         else:
+            holdout_indices = [i for i, traj in enumerate(self.trajs)
+                    if traj in holdout_set]
             self.holdout = holdout_set
-        self.training_set = []
-        for traj in self.trajs:
-            if traj not in self.holdout:
-                self.training_set.append(traj)
+        holdout_indices = set(holdout_indices)
+        self.training_set = self.trajs.subset([i for i in range(len(self.trajs))
+                if i not in holdout_indices])
 
     def __call__(self, model_factory, configuration):
         if self.verbose:
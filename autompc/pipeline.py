@@ -116,7 +116,7 @@ class Pipeline:
         task : Task
             Task which the MPC will solve
 
-        trajs : List of Trajectory
+        trajs : List of Trajectory or TrajectorySet
             System ID training set
 
         model : Model
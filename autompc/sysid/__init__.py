@@ -3,5 +3,6 @@ from .koopman import Koopman, KoopmanFactory
 from .sindy import SINDy, SINDyFactory
 #from .gp import GaussianProcess
 from .mlp import MLP, MLPFactory
+from .mlp_ensemble import MLPEnsemble, MLPEnsembleFactory
 from .largegp import ApproximateGPModel, ApproximateGPModelFactory
 #from .linearize import LinearizedModel
@@ -9,6 +9,8 @@ from ConfigSpace import ConfigurationSpace
 from ConfigSpace.hyperparameters import UniformIntegerHyperparameter
 
 from .model import Model, ModelFactory
+from .rls import RecursiveLeastSquares
+from ..trajectory_set import to_trajectory_set
 #from ..hyper import IntRangeHyperparam
 
 class ARXFactory(ModelFactory):
@@ -43,6 +45,8 @@ class ARX(Model):
     def __init__(self, system, history):
         super().__init__(system)
         self.k = history
+        self._rls = None
+        self._adapt_on_update = False
 
     def _get_feature_vector(self, traj, t=None):
         k = self.k
@@ -78,26 +82,45 @@ class ARX(Model):
         return 1 + k*self.system.obs_dim + k*self.system.ctrl_dim
         
     def _get_training_matrix_and_targets(self, trajs):
-        nsamples = sum([len(traj) for traj in trajs])
-        matrix = np.zeros((nsamples, self._get_fvec_size()))
-        targets = np.zeros((nsamples, self.system.obs_dim))
-
-        i = 0
-        for traj in trajs:
-            for t in range(1, len(traj)):
-                matrix[i, :] = self._get_feature_vector(traj, t)
-                targets[i, :] = traj[t].obs
-                i += 1
+        # Gather the feature vectors of all transitions in the data set at
+        # once. History before the start of a trajectory is padded with its
+        # first time step, as in _get_all_feature_vectors.
+        trajset = to_trajectory_set(trajs, self.system)
+        obs, ctrls = trajset.obs, trajset.ctrls
+        n, m = self.system.obs_dim, self.system.ctrl_dim
+        rows = trajset.get_window_starts(1)
+        first_rows = np.repeat(trajset.offsets[:-1], trajset.lengths)[rows]
+
+        matrix = np.empty((rows.size, self._get_fvec_size()))
+        matrix[:, :n] = obs[rows]
+        j = n
+        for i in range(1, self.k):
+            hist_rows = np.maximum(rows - i, first_rows)
+            matrix[:, j:j+n] = obs[hist_rows]
+            j += n
+            matrix[:, j:j+m] = ctrls[hist_rows]
+            j += m
+        matrix[:, -(m+1)] = 1
+        matrix[:, -m:] = ctrls[rows]
+        targets = obs[rows + 1]
 
         return matrix, targets
 
     def update_state(self, state, new_ctrl, new_obs):
+        if self._adapt_on_update:
+            self.observe(state, new_ctrl, new_obs)
         # Shift the targets
         newstate = self.A @ state + self.B @ new_ctrl
         newstate[:self.system.obs_dim] = new_obs
 
         return newstate
 
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        newstates = states @ self.A.T + new_ctrls @ self.B.T
+        newstates[:, :self.system.obs_dim] = new_obs
+
+        return newstates
+
     def traj_to_state(self, traj):
         return self._get_feature_vector(traj)[:-self.system.ctrl_dim]
 
@@ -110,10 +133,13 @@ class ARX(Model):
     def train(self, trajs, silent=False):
         matrix, targets = self._get_training_matrix_and_targets(trajs)
 
-        coeffs = np.zeros((self.system.obs_dim, self._get_fvec_size()))
-        for i in range(targets.shape[1]):
-            res, _, _,  _ = la.lstsq(matrix, targets[:,i], rcond=None)
-            coeffs[i,:] = res
+        # Solve for all outputs with a single factorization
+        res, _, _, _ = la.lstsq(matrix, targets, rcond=None)
+        coeffs = res.T
+        self.coeffs = coeffs
+        self._info_matrix = matrix.T @ matrix
+        self._rls = None
+        self._adapt_on_update = False
 
         # First we construct the system matrices
         A = np.zeros((self.state_dim, self.state_dim))
@@ -142,6 +168,53 @@ class ARX(Model):
 
         self.A, self.B = A, B
 
+    def enable_online(self, forgetting=1.0, adapt_on_update=True, reg=1e-6):
+        """
+        Enable online adaptation of the trained coefficients by recursive
+        least squares.  The estimator is initialized from the information
+        matrix of the training data, so that without forgetting it
+        continues the training least-squares fit.  Each observed
+        transition costs O(d^2) for the feature vector size d.
+
+        Parameters
+        ----------
+        forgetting : float
+            Exponential forgetting factor in (0, 1]. Default is 1.0,
+            meaning no forgetting.
+
+        adapt_on_update : bool
+            If True, update_state calls observe on each transition.
+            Otherwise, transitions must be passed to observe explicitly.
+
+        reg : float
+            Ridge added to the information matrix before inversion.
+        """
+        if not hasattr(self, "_info_matrix"):
+            raise ValueError("Model must be trained before enabling online adaptation")
+        self._rls = RecursiveLeastSquares(self.coeffs.T, self._info_matrix,
+                forgetting=forgetting, reg=reg)
+        self._adapt_on_update = adapt_on_update
+
+    def disable_online(self):
+        """
+        Disable online adaptation, keeping the current coefficients.
+        """
+        self._rls = None
+        self._adapt_on_update = False
+
+    @property
+    def is_online(self):
+        return self._rls is not None
+
+    def observe(self, state, ctrl, new_obs):
+        if self._rls is None:
+            raise ValueError("Online adaptation is not enabled")
+        self._rls.update(np.concatenate([state, ctrl]), new_obs)
+        n = self.system.obs_dim
+        l = self.system.ctrl_dim
+        self.coeffs = self._rls.coeffs.T
+        self.A[0 : n, :] = self.coeffs[:, :-l]
+        self.B[0 : n, :] = self.coeffs[:, -l:]
 
     def pred(self, state, ctrl):
         statenew = self.A @ state + self.B @ ctrl
@@ -0,0 +1,366 @@
+# Standard library includes
+from itertools import combinations
+
+# External library includes
+import numpy as np
+
+_KINDS = {"pow" : 0, "sin" : 1, "cos" : 2}
+
+class BasisLibrary:
+    """
+    The BasisLibrary evaluates a fixed list of basis functions, and their
+    Jacobians, on a batch of inputs.  Each basis function is a product of
+    factors, and each factor is a power, sine or cosine of one input
+    variable.  The library is compiled once into index and parameter
+    tables, so that evaluating all basis functions on N inputs takes a
+    handful of vectorized NumPy operations.
+    """
+    def __init__(self, input_dim, terms, names=None):
+        """
+        Parameters
+        ----------
+        input_dim : int
+            Size of the input vector
+
+        terms : List of List of (int, string, number)
+            Factors of each basis function.  Each factor is a tuple
+            (var, kind, param) standing for var**param if kind is "pow",
+            sin(param*var) if kind is "sin" and cos(param*var) if kind
+            is "cos".
+
+        names : List of string
+            Name template of each basis function, formatted with the input
+            variable names as positional arguments, e.g. "{0} sin(1 {2})".
+            If None, names are generated from the factors.
+        """
+        self.input_dim = input_dim
+        self.terms = [tuple(term) for term in terms]
+        if names is None:
+            names = [_default_name(term) for term in self.terms]
+        if len(names) != len(self.terms):
+            raise ValueError("terms and names must have the same length")
+        self.names = list(names)
+        self._compile()
+
+    def _compile(self):
+        factors = []
+        factor_ids = dict()
+        n_slots = max([len(term) for term in self.terms] + [1])
+        # Slots of shorter terms point to the constant factor, which is
+        # stored after all other factors.
+        slots = np.full((len(self.terms), n_slots), -1, dtype=int)
+        for i, term in enumerate(self.terms):
+            for k, (var, kind, param) in enumerate(term):
+                if not 0 <= var < self.input_dim:
+                    raise ValueError("Basis function variable out of range")
+                if kind not in _KINDS:
+                    raise ValueError("Unknown factor kind {}".format(kind))
+                factor = (var, kind, param)
+                if factor not in factor_ids:
+                    factor_ids[factor] = len(factors)
+                    factors.append(factor)
+                slots[i, k] = factor_ids[factor]
+        n_factors = len(factors)
+        slots[slots < 0] = n_factors
+
+        self._factor_vars = np.array([f[0] for f in factors], dtype=int)
+        kinds = np.array([_KINDS[f[1]] for f in factors], dtype=int)
+        params = np.array([f[2] for f in factors], dtype=float)
+        self._pow_idx = np.flatnonzero(kinds == 0)
+        self._pow_exps = params[self._pow_idx].astype(int)
+        self._sin_idx = np.flatnonzero(kinds == 1)
+        self._sin_freqs = params[self._sin_idx]
+        self._cos_idx = np.flatnonzero(kinds == 2)
+        self._cos_freqs = params[self._cos_idx]
+        self._n_factors = n_factors
+        self._slots = slots
+        # Input variable differentiated by each slot; constant slots
+        # contribute zero derivatives, so any variable will do.
+        slot_vars = np.zeros(slots.shape, dtype=int)
+        used = slots < n_factors
+        slot_vars[used] = self._factor_vars[slots[used]]
+        self._slot_vars = slot_vars
+
+    @property
+    def n_features(self):
+        """
+        Number of basis functions.
+        """
+        return len(self.terms)
+
+    def get_names(self, input_names=None):
+        """
+        Returns the names of the basis functions.
+
+        Parameters
+        ----------
+        input_names : List of string
+            Names of the input variables. Defaults to "x0", "x1", ...
+        """
+        if input_names is None:
+            input_names = ["x{}".format(i) for i in range(self.input_dim)]
+        return [name.format(*input_names) for name in self.names]
+
+    def subset(self, indices):
+        """
+        Returns a library containing only the selected basis functions.
+
+        Parameters
+        ----------
+        indices : List of int
+            Indices of the basis functions to keep, in order.
+        """
+        return BasisLibrary(self.input_dim, [self.terms[i] for i in indices],
+                [self.names[i] for i in indices])
+
+    def _factor_values(self, X, derivs=False):
+        xv = X[:, self._factor_vars]
+        vals = np.empty((X.shape[0], self._n_factors + 1), dtype=X.dtype)
+        vals[:, -1] = 1.0
+        vals[:, self._pow_idx] = xv[:, self._pow_idx] ** self._pow_exps
+        sin_args = xv[:, self._sin_idx] * self._sin_freqs
+        cos_args = xv[:, self._cos_idx] * self._cos_freqs
+        vals[:, self._sin_idx] = np.sin(sin_args)
+        vals[:, self._cos_idx] = np.cos(cos_args)
+        if not derivs:
+            return vals, None
+        dvals = np.empty_like(vals)
+        dvals[:, -1] = 0.0
+        dvals[:, self._pow_idx] = (self._pow_exps
+                * xv[:, self._pow_idx] ** np.maximum(self._pow_exps - 1, 0))
+        dvals[:, self._sin_idx] = self._sin_freqs * np.cos(sin_args)
+        dvals[:, self._cos_idx] = -self._cos_freqs * np.sin(cos_args)
+        return vals, dvals
+
+    def evaluate(self, X):
+        """
+        Evaluate the basis functions.
+
+        Parameters
+        ----------
+        X : numpy array of shape (N, input_dim)
+            Inputs
+
+        Returns
+        -------
+        features : numpy array of shape (N, n_features)
+            Basis function values
+        """
+        X = np.asarray(X, dtype=float)
+        vals, _ = self._factor_values(X)
+        if self._slots.shape[1] == 1:
+            return vals[:, self._slots[:, 0]]
+        return np.prod(vals[:, self._slots], axis=2)
+
+    def _slot_derivatives(self, X):
+        # Returns the features and, for each slot k, the derivative of each
+        # feature with respect to the variable of its k-th factor.
+        X = np.asarray(X, dtype=float)
+        vals, dvals = self._factor_values(X, derivs=True)
+        slot_vals = vals[:, self._slots]
+        features = np.prod(slot_vals, axis=2)
+        n_slots = self._slots.shape[1]
+        dslots = np.empty((X.shape[0], n_slots, self.n_features))
+        for k in range(n_slots):
+            # Product rule: derivative of slot k times the other slots
+            others = np.prod(np.delete(slot_vals, k, axis=2), axis=2)
+            dslots[:, k, :] = dvals[:, self._slots[:, k]] * others
+        return features, dslots
+
+    def jacobian(self, X):
+        """
+        Evaluate the basis functions and their Jacobians.
+
+        Parameters
+        ----------
+        X : numpy array of shape (N, input_dim)
+            Inputs
+
+        Returns
+        -------
+        features : numpy array of shape (N, n_features)
+            Basis function values
+
+        jac : numpy array of shape (N, n_features, input_dim)
+            Derivatives of the basis functions with respect to the inputs
+        """
+        features, dslots = self._slot_derivatives(X)
+        rows = np.arange(self.n_features)
+        jac = np.zeros((features.shape[0], self.n_features, self.input_dim))
+        for k in range(dslots.shape[1]):
+            jac[:, rows, self._slot_vars[:, k]] += dslots[:, k, :]
+        return features, jac
+
+    def jacobian_table(self, coeffs):
+        """
+        Returns the table mapping the factor derivatives computed by
+        linear_jacobian to the Jacobian of a linear combination of the
+        basis functions.  Row k*n_features + i holds the coefficients of
+        basis function i, placed in the column block of the input
+        variable of its k-th factor.
+
+        Parameters
+        ----------
+        coeffs : numpy array of shape (n_features, p)
+            Coefficients of the basis functions in each of p outputs
+        """
+        n_slots = self._slots.shape[1]
+        p = coeffs.shape[1]
+        table = np.zeros((n_slots, self.n_features, p, self.input_dim))
+        rows = np.arange(self.n_features)
+        for k in range(n_slots):
+            table[k, rows, :, self._slot_vars[:, k]] = coeffs
+        # Constant slots have zero derivative, so their entries never
+        # contribute.
+        return table.reshape((n_slots * self.n_features, p * self.input_dim))
+
+    def linear_jacobian(self, X, coeffs, table=None):
+        """
+        Evaluate a linear combination of the basis functions and its
+        Jacobian.  The Jacobian is a single product of the factor
+        derivatives with the precomputed jacobian_table, which scatters
+        each derivative into its input variable for the whole batch.
+
+        Parameters
+        ----------
+        X : numpy array of shape (N, input_dim)
+            Inputs
+
+        coeffs : numpy array of shape (n_features, p)
+            Coefficients of the basis functions in each of p outputs
+
+        table : numpy array
+            Result of jacobian_table(coeffs). Computed if None.
+
+        Returns
+        -------
+        outputs : numpy array of shape (N, p)
+            Linear combination of the basis functions
+
+        jac : numpy array of shape (N, p, input_dim)
+            Derivatives of the outputs with respect to the inputs
+        """
+        if table is None:
+            table = self.jacobian_table(coeffs)
+        features, dslots = self._slot_derivatives(X)
+        N = features.shape[0]
+        jac = dslots.reshape((N, -1)) @ table
+        return features @ coeffs, jac.reshape((N, coeffs.shape[1],
+            self.input_dim))
+
+def _default_name(term):
+    if len(term) == 0:
+        return "1"
+    parts = []
+    for var, kind, param in term:
+        if kind == "pow":
+            parts.append("{{{}}}".format(var) if param == 1
+                    else "{{{}}}**{}".format(var, param))
+        else:
+            parts.append("{}({} {{{}}})".format(kind, param, var))
+    return " ".join(parts)
+
+def _cross_term_exponents(degree):
+    # Exponent tuples of the polynomial cross terms of a given degree, in
+    # the order of basis_funcs.get_cross_term_basis_funcs.
+    exponents = np.mgrid[tuple(slice(degree) for _ in range(degree))]
+    exponents = exponents.reshape((degree, -1))
+    used_exps = []
+    for exp in exponents.T:
+        if sum(exp) != degree:
+            continue
+        trimmed_exp = tuple(int(e) for e in exp if e > 0)
+        if trimmed_exp not in used_exps:
+            used_exps.append(trimmed_exp)
+    return used_exps
+
+def sindy_library(input_dim, poly_degree=1, poly_cross_terms=False,
+        trig_freq=0, trig_interaction=False):
+    """
+    Returns the SINDy candidate library over the inputs (states followed
+    by controls).  Terms and names are ordered as in SINDy, that is the
+    identity, then for each trig frequency the sine and cosine terms and
+    their interactions, then the polynomial terms and their cross terms.
+
+    Parameters
+    ----------
+    input_dim : int
+        Number of inputs
+
+    poly_degree : int
+        Maximum degree of polynomial terms. Degree 1 adds none.
+
+    poly_cross_terms : bool
+        Whether to include polynomial cross terms.
+
+    trig_freq : int
+        Maximum frequency of trig terms. Zero adds none.
+
+    trig_interaction : bool
+        Whether to include products of inputs with trig terms of
+        other inputs.
+    """
+    terms, names = [], []
+    def add(term, name):
+        terms.append(term)
+        names.append(name)
+
+    for i in range(input_dim):
+        add([(i, "pow", 1)], "{{{}}}".format(i))
+    for freq in range(1, trig_freq+1):
+        for kind in ["sin", "cos"]:
+            for i in range(input_dim):
+                add([(i, kind, freq)], "{}({} {{{}}})".format(kind, freq, i))
+        if not trig_interaction:
+            continue
+        for kind in ["sin", "cos"]:
+            for i, j in combinations(range(input_dim), 2):
+                add([(i, "pow", 1), (j, kind, freq)],
+                        "{{{}}} {}({} {{{}}})".format(i, kind, freq, j))
+            for i, j in combinations(range(input_dim), 2):
+                add([(j, "pow", 1), (i, kind, freq)],
+                        "{{{}}} {}({} {{{}}})".format(j, kind, freq, i))
+    for deg in range(2, poly_degree+1):
+        for i in range(input_dim):
+            add([(i, "pow", deg)], "{{{}}}**{}".format(i, deg))
+    if poly_cross_terms:
+        for deg in range(2, poly_degree+1):
+            for exps in _cross_term_exponents(deg):
+                for c in combinations(range(input_dim), len(exps)):
+                    add([(i, "pow", e) for i, e in zip(c, exps)],
+                            "".join("{{{}}}^{} ".format(i, e)
+                                for i, e in zip(c, exps)))
+    return BasisLibrary(input_dim, terms, names)
+
+def koopman_library(input_dim, poly_degree=1, trig_freq=0,
+        product_terms=False):
+    """
+    Returns the Koopman lifting library over the observations.  The
+    identity, polynomial powers of degree 2 to poly_degree, and sines and
+    cosines of frequency 1 to trig_freq are applied to each observation,
+    optionally followed by the pairwise products of all these terms.
+
+    Parameters
+    ----------
+    input_dim : int
+        Number of observations
+
+    poly_degree : int
+        Maximum degree of polynomial terms. Degree 1 adds none.
+
+    trig_freq : int
+        Maximum frequency of trig terms. Zero adds none.
+
+    product_terms : bool
+        Whether to include pairwise products of the terms.
+    """
+    factors = [("pow", 1)]
+    factors += [("pow", deg) for deg in range(2, poly_degree+1)]
+    for freq in range(1, trig_freq+1):
+        factors += [("sin", freq), ("cos", freq)]
+    terms = [[(i, kind, param)] for kind, param in factors
+            for i in range(input_dim)]
+    if product_terms:
+        terms += [terms[i] + terms[j]
+                for i, j in combinations(range(len(terms)), 2)]
+    return BasisLibrary(input_dim, terms)
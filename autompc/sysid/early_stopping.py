@@ -0,0 +1,156 @@
+# Standard library includes
+import copy
+import math
+import time
+
+# External library includes
+import numpy as np
+import ConfigSpace.hyperparameters as CSH
+import ConfigSpace.conditions as CSC
+
+def split_validation(n_samples, fraction, seed=0):
+    """
+    Randomly split sample indices into a training and a validation set.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples
+
+    fraction : float
+        Fraction of the samples held out for validation, in [0, 1).
+        If 0, all samples are used for training.
+
+    seed : int
+        Seed of the random split
+
+    Returns
+    -------
+    train_idx, val_idx : numpy arrays of int
+        Training and validation indices. val_idx is empty if fraction is 0.
+    """
+    if not 0 <= fraction < 1:
+        raise ValueError("Validation fraction must be in [0, 1)")
+    n_val = int(round(fraction * n_samples))
+    if fraction > 0:
+        n_val = min(max(n_val, 1), n_samples - 1)
+    perm = np.random.default_rng(seed).permutation(n_samples)
+    return np.sort(perm[n_val:]), np.sort(perm[:n_val])
+
+def add_early_stopping_hyperparameters(cs):
+    """
+    Add the early_stopping, patience and validation_fraction
+    hyperparameters to a configuration space.
+    """
+    early_stopping = CSH.CategoricalHyperparameter("early_stopping",
+            choices=["true", "false"], default_value="false")
+    patience = CSH.UniformIntegerHyperparameter("patience",
+            lower=2, upper=50, default_value=10)
+    validation_fraction = CSH.UniformFloatHyperparameter("validation_fraction",
+            lower=0.0, upper=0.5, default_value=0.1)
+    use_patience = CSC.InCondition(child=patience, parent=early_stopping,
+            values=["true"])
+    use_validation_fraction = CSC.InCondition(child=validation_fraction,
+            parent=early_stopping, values=["true"])
+    cs.add_hyperparameters([early_stopping, patience, validation_fraction])
+    cs.add_conditions([use_patience, use_validation_fraction])
+
+class EarlyStopping:
+    """
+    Monitors a training or validation loss once per epoch and decides when
+    to stop training.  Training stops once the loss has not improved by
+    more than min_delta for patience epochs, or when the wall-clock budget
+    max_time is exceeded.  The weights of the epoch with the lowest loss
+    are kept, so they can be restored after training.
+    """
+    def __init__(self, patience=None, min_delta=0.0, max_time=None,
+            restore_best=True):
+        """
+        Parameters
+        ----------
+        patience : int
+            Number of epochs without improvement after which training
+            stops. If None, training is only stopped by max_time.
+
+        min_delta : float
+            Minimum decrease of the loss counted as an improvement.
+
+        max_time : float
+            Wall-clock training budget in seconds. If None, unlimited.
+
+        restore_best : bool
+            Keep a copy of the weights with the lowest loss.
+        """
+        if patience is not None and patience < 1:
+            raise ValueError("patience must be at least 1")
+        self.patience = patience
+        self.min_delta = min_delta
+        self.max_time = max_time
+        self.restore_best = restore_best
+        self.start()
+
+    def start(self):
+        """
+        Reset the monitor and start the training clock.
+        """
+        self._start = time.perf_counter()
+        self.epoch = 0
+        self.best_loss = math.inf
+        self.best_epoch = None
+        self.stop_reason = None
+        self._ref_loss = math.inf
+        self._wait = 0
+        self._best_states = None
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since start.
+        """
+        return time.perf_counter() - self._start
+
+    def update(self, loss, modules):
+        """
+        Record the loss of one epoch.
+
+        Parameters
+        ----------
+        loss : float
+            Monitored loss
+
+        modules : list of torch.nn.Module
+            Modules whose weights are saved if the loss is the lowest so far
+
+        Returns
+        -------
+        stop : bool
+            True if training should stop.
+        """
+        if np.isfinite(loss) and loss < self.best_loss:
+            self.best_loss = loss
+            self.best_epoch = self.epoch
+            if self.restore_best:
+                self._best_states = [copy.deepcopy(module.state_dict())
+                        for module in modules]
+        if np.isfinite(loss) and loss < self._ref_loss - self.min_delta:
+            self._ref_loss = loss
+            self._wait = 0
+        else:
+            self._wait += 1
+        self.epoch += 1
+        if self.patience is not None and self._wait >= self.patience:
+            self.stop_reason = "patience"
+            return True
+        if self.max_time is not None and self.elapsed >= self.max_time:
+            self.stop_reason = "max_time"
+            return True
+        return False
+
+    def restore(self, modules):
+        """
+        Load the saved weights with the lowest loss into modules.
+        """
+        if self._best_states is None:
+            return
+        for module, state in zip(modules, self._best_states):
+            module.load_state_dict(state)
@@ -0,0 +1,116 @@
+# Standard library includes
+import hashlib
+from collections import OrderedDict
+
+# External library includes
+import numpy as np
+
+class FeatureCache:
+    """
+    The FeatureCache memoizes evaluated basis function columns across model
+    trainings in the same process.  Columns are keyed by a fingerprint of
+    the input data and the basis function, so configurations which share
+    basis functions, for instance during tuning, only evaluate the ones
+    they do not have in common.  The least recently used columns are
+    evicted once the cache exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=256*2**20):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the cached columns in bytes. A value of
+            0 disables caching.  Default is 256 MiB.
+        """
+        self.max_bytes = max_bytes
+        self._columns = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(X):
+        """
+        Returns a hash of the contents, shape, and type of an array.
+        """
+        X = np.ascontiguousarray(X)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str((X.shape, X.dtype.str)).encode("utf-8"))
+        h.update(X.data)
+        return h.hexdigest()
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the cached columns in bytes.
+        """
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._columns)
+
+    def clear(self):
+        """
+        Remove all cached columns.
+        """
+        self._columns.clear()
+        self._nbytes = 0
+
+    def _insert(self, key, column):
+        if column.nbytes > self.max_bytes:
+            return
+        self._columns[key] = column
+        self._nbytes += column.nbytes
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._columns.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def evaluate(self, library, X):
+        """
+        Evaluate a BasisLibrary, reusing cached columns.
+
+        Parameters
+        ----------
+        library : BasisLibrary
+            Basis functions to evaluate
+
+        X : numpy array of shape (N, library.input_dim)
+            Inputs
+
+        Returns
+        -------
+        features : numpy array of shape (N, library.n_features)
+            Basis function values
+        """
+        if self.max_bytes <= 0:
+            return library.evaluate(X)
+        X = np.asarray(X, dtype=float)
+        fingerprint = self.fingerprint(X)
+        features = np.empty((X.shape[0], library.n_features))
+        missing = []
+        for i, term in enumerate(library.terms):
+            key = (fingerprint, term)
+            column = self._columns.get(key)
+            if column is None:
+                missing.append(i)
+                continue
+            self._columns.move_to_end(key)
+            features[:, i] = column
+        self.hits += library.n_features - len(missing)
+        self.misses += len(missing)
+        if missing:
+            values = library.subset(missing).evaluate(X)
+            features[:, missing] = values
+            for j, i in enumerate(missing):
+                self._insert((fingerprint, library.terms[i]),
+                        np.ascontiguousarray(values[:, j]))
+        return features
+
+_feature_cache = FeatureCache()
+
+def get_feature_cache():
+    """
+    Returns the process-wide FeatureCache used when training Koopman and
+    SINDy models.  Set its max_bytes to 0 to disable caching.
+    """
+    return _feature_cache
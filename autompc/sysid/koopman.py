@@ -5,7 +5,12 @@ from pdb import set_trace
 from sklearn.linear_model import  Lasso
 
 from .model import Model, ModelFactory
-from .stable_koopman import stabilize_discrete
+from .stable_koopman import StableKoopmanSolver
+from .rls import RecursiveLeastSquares
+from .basis_library import koopman_library
+from .feature_cache import get_feature_cache
+from ..trajectory_set import to_trajectory_set
+from ..trajectory_store import TrajectoryStore
 
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
@@ -27,16 +32,31 @@ class KoopmanFactory(ModelFactory):
 
     Hyperparameters:
 
-    - *method* (Type: str, Choices: ["lstsq", "lasso", "stable"]): Method for training Koopman
-      operator.
+    - *method* (Type: str, Choices: ["lstsq", "lasso", "stable", "normal"]): Method for training
+      Koopman operator. "normal" accumulates the normal equations chunk by chunk and solves them
+      by Cholesky factorization, so its memory use does not grow with the data set size.
     - *lasso_alpha* (Type: float, Low: 10^-10, High: 10^2, Defalt: 1.0): α parameter for Lasso
       regression. (Conditioned on method="lasso").
+    - *ridge_alpha* (Type: float, Low: 10^-10, High: 10^2, Default: 10^-6): Ridge regularization
+      of the normal equations. (Conditioned on method="normal").
     - *poly_basis* (Type: bool): Whether to use polynomial basis functions.
     - *poly_degree* (Type: int, Low: 2, High: 8, Default: 3): Maximum degree of polynomial basis
       functions. (Conditioned on poly_basis="true").
     - *trig_basis* (Type: bool): Whether to use trig basis functions.
     - *trig_freq* (Type: int, Low: 1, High: 8, Default: 1): Maximum frequency of trig functions.
     - *product_terms* (Type: bool): Whether to include cross-product terms.
+    - *reduce_order* (Type: bool, Default: False): Whether to project the lifted state onto
+      its dominant subspace. The observations are kept as the first state coordinates and
+      the remaining basis functions are replaced by their leading principal directions
+      in the training data.
+    - *energy_threshold* (Type: float, Low: 0.9, High: 0.99999, Default: 0.999): Fraction of
+      the energy of the non-identity basis functions retained by the reduction.
+      (Conditioned on reduce_order="true").
+
+    The solver of the "stable" method is configured with the factory keyword arguments
+    *stable_max_iter* (Default: 30), *stable_tol* (relative objective change, Default: 10^-6),
+    *stable_max_time* (seconds, Default: None) and *warm_start*, a tuple (A, B) of a previous
+    solution to start from. The solver progress is stored in the model's stable_history.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,11 +66,15 @@ class KoopmanFactory(ModelFactory):
     def get_configuration_space(self):
         cs = CS.ConfigurationSpace()
         method = CSH.CategoricalHyperparameter("method", choices=["lstsq", "lasso",
-            "stable"])
+            "stable", "normal"])
         lasso_alpha = CSH.UniformFloatHyperparameter("lasso_alpha", 
                 lower=1e-10, upper=1e2, default_value=1.0, log=True)
         use_lasso_alpha = CSC.InCondition(child=lasso_alpha, parent=method, 
                 values=["lasso"])
+        ridge_alpha = CSH.UniformFloatHyperparameter("ridge_alpha",
+                lower=1e-10, upper=1e2, default_value=1e-6, log=True)
+        use_ridge_alpha = CSC.InCondition(child=ridge_alpha, parent=method,
+                values=["normal"])
 
         poly_basis = CSH.CategoricalHyperparameter("poly_basis", 
                 choices=["true", "false"], default_value="false")
@@ -69,16 +93,27 @@ class KoopmanFactory(ModelFactory):
         product_terms = CSH.CategoricalHyperparameter("product_terms",
                 choices=["false"], default_value="false")
 
+        reduce_order = CSH.CategoricalHyperparameter("reduce_order",
+                choices=["true", "false"], default_value="false")
+        energy_threshold = CSH.UniformFloatHyperparameter("energy_threshold",
+                lower=0.9, upper=0.99999, default_value=0.999)
+        use_energy_threshold = CSC.InCondition(child=energy_threshold,
+                parent=reduce_order, values=["true"])
 
         cs.add_hyperparameters([method, poly_basis, poly_degree,
-            trig_basis, trig_freq, product_terms, lasso_alpha])
-        cs.add_conditions([use_poly_degree, use_trig_freq, use_lasso_alpha])
+            trig_basis, trig_freq, product_terms, lasso_alpha, ridge_alpha,
+            reduce_order, energy_threshold])
+        cs.add_conditions([use_poly_degree, use_trig_freq, use_lasso_alpha,
+            use_ridge_alpha, use_energy_threshold])
 
         return cs
 
 class Koopman(Model):
     def __init__(self, system, method, lasso_alpha=None, poly_basis=False,
             poly_degree=1, trig_basis=False, trig_freq=1, product_terms=False,
+            ridge_alpha=None, chunk_size=10000, reduce_order=False,
+            energy_threshold=0.999, max_rank=None, stable_max_iter=30,
+            stable_tol=1e-6, stable_max_time=None, warm_start=None,
             use_cuda=None):
         super().__init__(system)
 
@@ -87,6 +122,19 @@ class Koopman(Model):
             self.lasso_alpha = lasso_alpha
         else:
             self.lasso_alpha = None
+        self.ridge_alpha = ridge_alpha if ridge_alpha is not None else 0.0
+        self.chunk_size = chunk_size
+        if type(reduce_order) == str:
+            reduce_order = True if reduce_order == "true" else False
+        self.reduce_order = reduce_order
+        self.energy_threshold = energy_threshold
+        self.max_rank = max_rank
+        self._proj = None
+        self.stable_max_iter = stable_max_iter
+        self.stable_tol = stable_tol
+        self.stable_max_time = stable_max_time
+        self.warm_start = warm_start
+        self.stable_history = None
         if type(poly_basis) == str:
             poly_basis = True if poly_basis == "true" else False
         self.poly_basis = poly_basis
@@ -96,48 +144,134 @@ class Koopman(Model):
         self.trig_basis = trig_basis
         self.trig_freq = trig_freq
         if type(product_terms) == str:
-            self.product_terms = True if product_terms == "true" else False
+            product_terms = True if product_terms == "true" else False
+        self.product_terms = product_terms
+        self._rls = None
+        self._adapt_on_update = False
 
-        self.basis_funcs = [lambda x: x]
-        if self.poly_basis:
-            self.basis_funcs += [lambda x: x**i for i in range(2, 1+self.poly_degree)]
-        if self.trig_basis:
-            for i in range(1, 1+self.poly_degree):
-                self.basis_funcs += [lambda x: np.sin(i*x), lambda x : np.cos(i*x)]
+        self.library = koopman_library(self.system.obs_dim,
+                poly_degree=self.poly_degree if self.poly_basis else 1,
+                trig_freq=self.trig_freq if self.trig_basis else 0,
+                product_terms=self.product_terms)
 
     def _apply_basis(self, state):
-        tr_state = [b(x) for b in self.basis_funcs for x in state]
-        if self.product_terms:
-            pr_terms = []
-            for i, x in enumerate(tr_state):
-                for j, y in enumerate(tr_state):
-                    if i < j:
-                        pr_terms.append(x*y)
-            tr_state += pr_terms
+        return self._transform_observations(state.reshape((1,-1)))[0]
 
-        return np.array(tr_state)
+    def _transform_observations(self, observations, cache=False):
+        if cache:
+            lifted = get_feature_cache().evaluate(self.library, observations)
+        else:
+            lifted = self.library.evaluate(observations)
+        if self._proj is not None:
+            lifted = lifted @ self._proj
+        return lifted
 
-    def _transform_observations(self, observations):
-        return np.apply_along_axis(self._apply_basis, 1, observations)
+    def _compute_projection(self, gram):
+        # Keep the observations and project the other basis functions onto
+        # the leading eigenvectors of their Gram matrix, i.e. their leading
+        # right singular vectors over the training data.
+        k = self.system.obs_dim
+        evals, evecs = la.eigh(gram[k:, k:])
+        order = np.argsort(evals)[::-1]
+        evals = np.maximum(evals[order], 0.0)
+        evecs = evecs[:, order]
+        energy = np.cumsum(evals) / max(np.sum(evals), 1e-300)
+        rank = min(int(np.searchsorted(energy, self.energy_threshold)) + 1,
+                evals.size)
+        if self.max_rank is not None:
+            rank = min(rank, self.max_rank)
+        proj = np.zeros((gram.shape[0], k + rank))
+        proj[:k, :k] = np.eye(k)
+        proj[k:, k:] = evecs[:, :rank]
+        return proj
 
     def traj_to_state(self, traj):
-        return self._transform_observations(traj.obs[:])[-1,:]
+        return self._apply_basis(traj[-1].obs)
 
     def traj_to_states(self, traj):
         return self._transform_observations(traj.obs[:])
     
     def update_state(self, state, new_ctrl, new_obs):
-        return self._apply_basis(new_obs)
+        newstate = self._apply_basis(new_obs)
+        if self._adapt_on_update:
+            self._observe_lifted(state, new_ctrl, newstate)
+        return newstate
+
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        return self._transform_observations(new_obs)
 
     @property
     def state_dim(self):
-        return len(self.basis_funcs) * self.system.obs_dim
+        if self._proj is not None:
+            return self._proj.shape[1]
+        return self.library.n_features
+
+    def _iter_transition_chunks(self, trajs):
+        # Yields the lifted transitions in blocks of at most chunk_size rows.
+        # TrajectoryStores are read one memory-mapped chunk at a time.
+        if isinstance(trajs, TrajectoryStore):
+            trajsets = trajs.iter_chunks()
+        else:
+            trajsets = [to_trajectory_set(trajs, self.system)]
+        for trajset in trajsets:
+            starts = trajset.get_window_starts(1)
+            for i in range(0, starts.size, self.chunk_size):
+                rows = starts[i:i+self.chunk_size]
+                # Lift each observation once, whether it is used as a
+                # state, a successor, or both. Chunks are not cached, since
+                # streaming exists to bound memory.
+                lo, hi = rows[0], rows[-1] + 2
+                lifted = self._transform_observations(trajset.obs[lo:hi])
+                yield (lifted[rows - lo], trajset.ctrls[rows],
+                        lifted[rows + 1 - lo])
+
+    def _train_normal(self, trajs):
+        self._proj = None
+        n = self.state_dim
+        d = n + self.system.ctrl_dim
+        G = np.zeros((d, d))
+        C = np.zeros((n, d))
+        for X, U, Y in self._iter_transition_chunks(trajs):
+            XU = np.concatenate([X, U], axis=1)
+            G += XU.T @ XU
+            C += Y.T @ XU
+        if self.reduce_order:
+            # Reduce the accumulated normal equations instead of making
+            # a second pass over the data.
+            proj = self._compute_projection(G[:n, :n])
+            P = sla.block_diag(proj, np.eye(self.system.ctrl_dim))
+            G = P.T @ G @ P
+            C = proj.T @ C @ P
+            self._proj = proj
+            n = proj.shape[1]
+            d = n + self.system.ctrl_dim
+        G_reg = G + self.ridge_alpha * np.eye(d)
+        try:
+            AB = sla.cho_solve(sla.cho_factor(G_reg), C.T).T
+        except la.LinAlgError:
+            # Singular without regularization; fall back to least squares
+            AB = sla.lstsq(G_reg, C.T)[0].T
+        self.A, self.B = AB[:, :n], AB[:, n:]
+        self._info_matrix = G
+        self._rls = None
+        self._adapt_on_update = False
 
     def train(self, trajs, silent=False):
-        trans_obs = [self._transform_observations(traj.obs[:]) for traj in trajs]
-        X = np.concatenate([obs[:-1,:] for obs in trans_obs]).T
-        Y = np.concatenate([obs[1:,:] for obs in trans_obs]).T
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs]).T
+        if self.method == "normal":
+            self._train_normal(trajs)
+            return
+        self._proj = None
+        trajset = to_trajectory_set(trajs, self.system)
+        starts = trajset.get_window_starts(1)
+        lifted = self._transform_observations(trajset.obs, cache=True)
+        X = lifted[starts].T
+        Y = lifted[starts + 1].T
+        U = trajset.ctrls[starts].T
+        if self.reduce_order:
+            proj = self._compute_projection(X @ X.T)
+            X = proj.T @ X
+            Y = proj.T @ Y
+            self._proj = proj
         
         n = X.shape[0] # state dimension
         m = U.shape[0] # control dimension    
@@ -157,11 +291,68 @@ class Koopman(Model):
         elif self.method == "stable": # Compute stable A, and B
             print("Compute Stable Koopman")
             # call function
-            A, _, _, _, B, _ = stabilize_discrete(X, U, Y)
+            solver = StableKoopmanSolver(max_iter=self.stable_max_iter,
+                    tol=self.stable_tol, max_time=self.stable_max_time)
+            A, _, _, _, B, _ = solver.solve(X, U, Y,
+                    warm_start=self.warm_start)
+            self.stable_history = solver.history
             A = np.real(A)
             B = np.real(B)
 
         self.A, self.B = A, B
+        self._info_matrix = XU @ XU.T
+        self._rls = None
+        self._adapt_on_update = False
+
+    def enable_online(self, forgetting=1.0, adapt_on_update=True, reg=1e-6):
+        """
+        Enable online adaptation of the trained A and B matrices by
+        recursive least squares.  The estimator is initialized from the
+        information matrix of the lifted training data, so that without
+        forgetting it continues the least-squares fit.  Each observed
+        transition costs O(d^2) for d = state_dim + ctrl_dim.
+
+        Parameters
+        ----------
+        forgetting : float
+            Exponential forgetting factor in (0, 1]. Default is 1.0,
+            meaning no forgetting.
+
+        adapt_on_update : bool
+            If True, update_state calls observe on each transition.
+            Otherwise, transitions must be passed to observe explicitly.
+
+        reg : float
+            Ridge added to the information matrix before inversion.
+        """
+        if not hasattr(self, "_info_matrix"):
+            raise ValueError("Model must be trained before enabling online adaptation")
+        AB = np.concatenate([self.A, self.B], axis=1)
+        self._rls = RecursiveLeastSquares(AB.T, self._info_matrix,
+                forgetting=forgetting, reg=reg)
+        self._adapt_on_update = adapt_on_update
+
+    def disable_online(self):
+        """
+        Disable online adaptation, keeping the current A and B matrices.
+        """
+        self._rls = None
+        self._adapt_on_update = False
+
+    @property
+    def is_online(self):
+        return self._rls is not None
+
+    def observe(self, state, ctrl, new_obs):
+        self._observe_lifted(state, ctrl, self._apply_basis(new_obs))
+
+    def _observe_lifted(self, state, ctrl, newstate):
+        if self._rls is None:
+            raise ValueError("Online adaptation is not enabled")
+        self._rls.update(np.concatenate([state, ctrl]), newstate)
+        n = self.A.shape[0]
+        self.A = self._rls.coeffs[:n].T.copy()
+        self.B = self._rls.coeffs[n:].T.copy()
 
     def pred(self, state, ctrl):
         xpred = self.A @ state + self.B @ ctrl
@@ -181,9 +372,13 @@ class Koopman(Model):
         return np.copy(self.A), np.copy(self.B)
 
     def get_parameters(self):
-        return {"A" : np.copy(self.A),
-                "B" : np.copy(self.B)}
+        params = {"A" : np.copy(self.A),
+                  "B" : np.copy(self.B)}
+        if self._proj is not None:
+            params["proj"] = np.copy(self._proj)
+        return params
 
     def set_parameters(self, params):
         self.A = np.copy(params["A"])
         self.B = np.copy(params["B"])
+        self._proj = np.copy(params["proj"]) if "proj" in params else None
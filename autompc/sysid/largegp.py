@@ -25,6 +25,9 @@ except:
 
 
 from .model import Model, ModelFactory
+from .early_stopping import (EarlyStopping, split_validation,
+        add_early_stopping_hyperparameters)
+from ..trajectory_set import to_trajectory_set
 
 
 def transform_input(xu_means, xu_std, XU):
@@ -43,10 +46,21 @@ def transform_output(xu_means, xu_std, XU):
 class GPytorchGP(Model):
     """Define a base class that can be extended to both scalable and un-scalable case"""
     def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1,
-            use_cuda=True):
+            use_cuda=True, early_stopping=False, patience=10, min_delta=0.0,
+            validation_fraction=0.0, max_train_time=None, restore_best=True):
         super().__init__(system)
         self.niter = niter
         self.lr = lr
+        if type(early_stopping) == str:
+            early_stopping = True if early_stopping == "true" else False
+        self.early_stopping = early_stopping
+        self.patience = patience
+        self.min_delta = min_delta
+        self.validation_fraction = validation_fraction
+        self.max_train_time = max_train_time
+        self.restore_best = restore_best
+        self.stop_reason = None
+        self.train_history = []
         self.device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available()) 
                 else torch.device('cpu'))
         if use_cuda and torch.cuda.is_available():
@@ -60,9 +74,37 @@ class GPytorchGP(Model):
         cs = ConfigurationSpace()
         return cs
 
+    def _split_data(self, XUt, dYt, seed):
+        # Returns the training and validation tensors
+        fraction = self.validation_fraction if self.early_stopping else 0.0
+        train_idx, val_idx = split_validation(XUt.shape[0], fraction, seed)
+        tensors = [torch.from_numpy(A[idx]).to(self.device).contiguous()
+                for idx in [train_idx, val_idx] for A in [XUt, dYt]]
+        return tensors
+
+    def _make_monitor(self):
+        return EarlyStopping(
+                patience=self.patience if self.early_stopping else None,
+                min_delta=self.min_delta, max_time=self.max_train_time,
+                restore_best=self.early_stopping and self.restore_best)
+
+    def _validation_loss(self, likelihood, val_x, val_y):
+        # Mean squared error of the normalized predictive mean
+        self.gpmodel.eval()
+        likelihood.eval()
+        with torch.no_grad(), gpytorch.settings.fast_pred_var():
+            mean = likelihood(self.gpmodel(val_x)).mean
+            loss = torch.mean((mean - val_y)**2).item()
+        self.gpmodel.train()
+        likelihood.train()
+        return loss
+
     def update_state(self, state, new_ctrl, new_obs):
         return np.copy(new_obs)
 
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        return np.copy(new_obs)
+
     def traj_to_state(self, traj):
         return traj[-1].obs[:]
 
@@ -273,12 +315,14 @@ class ApproximateGPytorchModel(gpytorch.models.ApproximateGP):
 
 
 class LargeGaussianProcess(GPytorchGP):
-    def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1):
-        super().__init__(system, mean, kernel, niter, lr)
+    def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1,
+            **kwargs):
+        super().__init__(system, mean, kernel, niter, lr, **kwargs)
         self.gpmodel = BatchIndependentMultitaskGPModel(self.system.obs_dim, mean, kernel).double()
         self.gpmodel = self.gpmodel.to(self.device)
 
-    def train(self, trajs, silent=False):
+    def train(self, trajs, silent=False, seed=100):
+        torch.manual_seed(seed)
         # Initialize kernels
         self.gpmodel.train()
         self.gpmodel.likelihood.train()
@@ -288,9 +332,7 @@ class LargeGaussianProcess(GPytorchGP):
         mll = gpytorch.mlls.ExactMarginalLogLikelihood(self.gpmodel.likelihood, self.gpmodel)
 
         # prepare data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
+        X, U, _, dY = to_trajectory_set(trajs, self.system).get_transitions()
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
         self.xu_means = np.mean(XU, axis=0)
         self.xu_std = np.std(XU, axis=0)
@@ -301,12 +343,11 @@ class LargeGaussianProcess(GPytorchGP):
         dYt = transform_input(self.dy_means, self.dy_std, dY)
 
         # convert into desired tensor
-        train_x = torch.from_numpy(XUt)
-        train_y = torch.from_numpy(dYt)
-        train_x = train_x.to(self.device)
-        train_y = train_y.to(self.device).contiguous()
+        train_x, train_y, val_x, val_y = self._split_data(XUt, dYt, seed)
         self.gpmodel.set_train_data(train_x, train_y, False)
 
+        monitor = self._make_monitor()
+        self.train_history = []
         for i in range(self.niter):
             optimizer.zero_grad()
             output = self.gpmodel(train_x)
@@ -314,6 +355,17 @@ class LargeGaussianProcess(GPytorchGP):
             loss.backward()
             print('Iter %d/%d - Loss: %.3f' % (i + 1, self.niter, loss.item()))
             optimizer.step()
+            entry = {"epoch" : i, "loss" : loss.item()}
+            monitored = entry["loss"]
+            if val_x.shape[0] > 0:
+                monitored = self._validation_loss(self.gpmodel.likelihood,
+                        val_x, val_y)
+                entry["val_loss"] = monitored
+            self.train_history.append(entry)
+            if monitor.update(monitored, [self.gpmodel]):
+                break
+        monitor.restore([self.gpmodel])
+        self.stop_reason = monitor.stop_reason
         # training is finished, now go to eval mode
         self.gpmodel.eval()
         self.gpmodel.likelihood.eval()
@@ -334,17 +386,26 @@ class ApproximateGPModelFactory(ModelFactory):
 
     - *induce_count* (Type: int, Lower: 50, Upper: 200, Default: 100): Number of inducing points
       to include in the gaussian process. 
+
+    Training supports the same *early_stopping*, *patience*, *min_delta*, *validation_fraction*
+    and *max_train_time* options as the MLP, with one epoch per pass over the data. The
+    validation loss is the mean squared error of the predictive mean. If the factory is created
+    with *tune_early_stopping*, the early_stopping, patience and validation_fraction
+    hyperparameters are added to the configuration space.
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, tune_early_stopping=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.Model = ApproximateGPModel
         self.name = "ApproximateGP"
+        self.tune_early_stopping = tune_early_stopping
 
     def get_configuration_space(self):
         cs = ConfigurationSpace()
         induce_count = UniformIntegerHyperparameter("induce_count", lower=50,
                 upper=200, default_value=100)
         cs.add_hyperparameter(induce_count)
+        if self.tune_early_stopping:
+            add_early_stopping_hyperparameters(cs)
         return cs
 
 class ApproximateGPModel(GPytorchGP, Model):
@@ -353,14 +414,13 @@ class ApproximateGPModel(GPytorchGP, Model):
         self.batch_size = batch_size
         self.induce_count = induce_count
 
-    def train(self, trajs, silent=False):
+    def train(self, trajs, silent=False, seed=100):
         """Given collected trajectories, train the GP to approximate the actual dynamics"""
+        torch.manual_seed(seed)
         # extract transfer pairs from data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
+        X, U, _, dY = to_trajectory_set(trajs, self.system).get_transitions()
         num_task = dY.shape[1]
         self.num_task = num_task
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
         self.xu_means = np.mean(XU, axis=0)
         self.xu_std = np.std(XU, axis=0)
@@ -371,10 +431,7 @@ class ApproximateGPModel(GPytorchGP, Model):
         dYt = transform_input(self.dy_means, self.dy_std, dY)
 
         # convert into desired tensor data loader
-        train_x = torch.from_numpy(XUt)
-        train_y = torch.from_numpy(dYt)
-        train_x = train_x.to(self.device)
-        train_y = train_y.to(self.device)
+        train_x, train_y, val_x, val_y = self._split_data(XUt, dYt, seed)
         train_dataset = TensorDataset(train_x, train_y)
         train_loader = DataLoader(train_dataset, batch_size=self.batch_size, shuffle=True)
         # construct the approximate GP instance
@@ -401,8 +458,11 @@ class ApproximateGPModel(GPytorchGP, Model):
             itr = range(self.niter)
         else:
             itr = tqdm.tqdm(range(self.niter))
+        monitor = self._make_monitor()
+        self.train_history = []
         for i in itr:
             # Within each iteration, we will go over each minibatch of data
+            cum_loss = 0.0
             for x_batch, y_batch in train_loader:
                 optimizer.zero_grad()
                 output = self.gpmodel(x_batch)
@@ -410,6 +470,17 @@ class ApproximateGPModel(GPytorchGP, Model):
                 # minibatch_iter.set_postfix(loss=loss.item())
                 loss.backward()
                 optimizer.step()
+                cum_loss += loss.item() * x_batch.shape[0]
+            entry = {"epoch" : i, "loss" : cum_loss / train_x.shape[0]}
+            monitored = entry["loss"]
+            if val_x.shape[0] > 0:
+                monitored = self._validation_loss(likelihood, val_x, val_y)
+                entry["val_loss"] = monitored
+            self.train_history.append(entry)
+            if monitor.update(monitored, [self.gpmodel, likelihood]):
+                break
+        monitor.restore([self.gpmodel, likelihood])
+        self.stop_reason = monitor.stop_reason
 
         self.gpmodel.eval()
         likelihood.eval()
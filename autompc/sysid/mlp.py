@@ -4,11 +4,11 @@ The code is similar to GP / RNN.
 The configuration space has to be carefully considered
 """
 import itertools
+import time
 import numpy as np
 from tqdm import tqdm
 import sys
 import torch
-from torch.utils.data import Dataset, DataLoader
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
 import ConfigSpace.conditions as CSC
@@ -16,6 +16,10 @@ import ConfigSpace.conditions as CSC
 from pdb import set_trace
 
 from .model import Model, ModelFactory
+from .mlp_executor import MLPExecutor
+from .early_stopping import (EarlyStopping, split_validation,
+        add_early_stopping_hyperparameters)
+from ..trajectory_set import to_trajectory_set
 
 def transform_input(xu_means, xu_std, XU):
     XUt = []
@@ -29,6 +33,31 @@ def transform_output(xu_means, xu_std, XU):
         XUt.append((XU[:,i] * xu_std[i]) + xu_means[i])
     return np.vstack(XUt).T
 
+def make_nonlin(nonlintype):
+    if nonlintype == 'relu':
+        return torch.nn.ReLU()
+    elif nonlintype == 'selu':
+        return torch.nn.SELU()
+    elif nonlintype == 'tanh':
+        return torch.nn.Tanh()
+    elif nonlintype == 'sigmoid':
+        return torch.nn.Sigmoid()
+    else:
+        raise NotImplementedError("Currently supported nonlinearity: relu, tanh, sigmoid")
+
+def nonlin_derivative(nonlintype, y, x):
+    """Derivative of the nonlinearity at y, given its output x"""
+    if nonlintype == 'relu':
+        return (y > 0).to(y.dtype)
+    elif nonlintype == 'selu':
+        scale, alpha = 1.0507009873554805, 1.6732632423543772
+        return torch.where(y > 0, torch.full_like(y, scale),
+                x + scale * alpha)
+    elif nonlintype == 'tanh':
+        return 1 - x * x
+    elif nonlintype == 'sigmoid':
+        return x * (1 - x)
+
 class ForwardNet(torch.nn.Module):
     def __init__(self, n_in, n_out, hidden_sizes, nonlintype):
         """Specify the feedforward neuro network size and nonlinearity"""
@@ -41,16 +70,8 @@ class ForwardNet(torch.nn.Module):
             last_n = size
         # the final one
         self.output_layer = torch.nn.Linear(last_n, n_out)
-        if nonlintype == 'relu':
-            self.nonlin = torch.nn.ReLU()
-        elif nonlintype == 'selu':
-            self.nonlin = torch.nn.SELU()
-        elif nonlintype == 'tanh':
-            self.nonlin = torch.nn.Tanh()
-        elif nonlintype == 'sigmoid':
-            self.nonlin = torch.nn.Sigmoid()
-        else:
-            raise NotImplementedError("Currently supported nonlinearity: relu, tanh, sigmoid")
+        self.nonlintype = nonlintype
+        self.nonlin = make_nonlin(nonlintype)
 
     def forward(self, x):
         for i, lyr in enumerate(self.layers):
@@ -58,19 +79,39 @@ class ForwardNet(torch.nn.Module):
             x = self.nonlin(y)
         return self.output_layer(x)
 
+    def forward_jacobian(self, x):
+        """
+        Evaluate the network and its input Jacobian for a batch of inputs.
+        The activation derivatives are recorded during the forward pass and
+        the Jacobian is then accumulated from the output layer back to the
+        input as a chain of weight and derivative products, one matrix
+        product per layer for the whole batch and without autograd.
 
-class SimpleDataset(Dataset):
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        Parameters
+        ----------
+        x : torch tensor of shape (N, n_in)
+            Inputs
 
-    def __len__(self):
-        return len(self.x)
+        Returns
+        -------
+        y : torch tensor of shape (N, n_out)
+            Outputs
 
-    def __getitem__(self, idx):
-        if torch.is_tensor(idx):
-            idx = idx.tolist()
-        return self.x[idx], self.y[idx]
+        jac : torch tensor of shape (N, n_out, n_in)
+            Jacobians of the outputs with respect to the inputs
+        """
+        derivs = []
+        for lyr in self.layers:
+            y = self.layers[lyr](x)
+            x = self.nonlin(y)
+            derivs.append(nonlin_derivative(self.nonlintype, y, x))
+        out = self.output_layer(x)
+        weight = self.output_layer.weight
+        jac = weight.expand(x.shape[0], *weight.shape)
+        for lyr, deriv in zip(reversed(list(self.layers)), reversed(derivs)):
+            jac = torch.matmul(jac * deriv.unsqueeze(1),
+                    self.layers[lyr].weight)
+        return out, jac
 
 
 class MLPFactory(ModelFactory):
@@ -83,6 +124,22 @@ class MLPFactory(ModelFactory):
 
     - *n_batch* (Type: int, Default: 64): Training batch size of the neural net.
     - *n_train_iters* (Type: int, Default: 50): Number of training epochs
+    - *n_threads* (Type: int, Default: None): Number of threads torch uses during training.
+      If None, the torch default is kept. The mean loss, time and samples per second of each
+      training epoch are recorded in the model's train_history.
+    - *numpy_inference* (Type: bool, Default: False): After training, compile the network
+      into a NumPy executor which serves pred, pred_batch and pred_diff without torch.
+      The input and output normalization are folded into the first and last layer.
+    - *numpy_dtype* (Type: numpy dtype, Default: np.float64): Type used by the NumPy
+      executor.
+    - *early_stopping* (Type: bool, Default: False): Stop training once the monitored loss
+      has not decreased by more than *min_delta* (Default: 0) for *patience* (Default: 10)
+      epochs, and restore the weights of the best epoch. The loss is measured on a random
+      *validation_fraction* (Default: 0) of the transitions, which are then not used for
+      training. If 0, the training loss is monitored.
+    - *max_train_time* (Type: float, Default: None): Wall-clock training budget in seconds.
+    - *tune_early_stopping* (Type: bool, Default: False): Add the early stopping options to
+      the configuration space.
 
     Hyperparameters:
 
@@ -98,11 +155,18 @@ class MLPFactory(ModelFactory):
     - *nonlintype* (Type: str, choices: ["relu", "tanh", "sigmoid", "selu"], Default: "relu):
       Type of activation function.
     - *lr* (Type: float, Low: 1e-5, High: 1, Default: 1e-3): Adam learning rate for the network.
+    - *early_stopping* (Type: str, Choices: ["true", "false"], Default: "false"): Whether to
+      stop training early. (Only if tune_early_stopping is set).
+    - *patience* (Type: int, Low: 2, High: 50, Default: 10): Epochs without improvement before
+      stopping. (Conditioned on early_stopping="true").
+    - *validation_fraction* (Type: float, Low: 0, High: 0.5, Default: 0.1): Fraction of the data
+      held out to monitor the loss. (Conditioned on early_stopping="true").
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, tune_early_stopping=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.Model = MLP
         self.name = "MLP"
+        self.tune_early_stopping = tune_early_stopping
 
     def get_configuration_space(self):
         cs = CS.ConfigurationSpace()
@@ -132,6 +196,8 @@ class MLPFactory(ModelFactory):
             hidden_size_2, hidden_size_3, hidden_size_4,
             lr])
         cs.add_conditions([hidden_cond_2, hidden_cond_3, hidden_cond_4])
+        if self.tune_early_stopping:
+            add_early_stopping_hyperparameters(cs)
         return cs
 
 class MLP(Model):
@@ -139,7 +205,10 @@ class MLP(Model):
             nonlintype='relu', n_train_iters=50, n_batch=64, lr=1e-3,
             hidden_size_1=None, hidden_size_2=None, hidden_size_3=None,
             hidden_size_4=None, seed=100,
-            use_cuda=True):
+            use_cuda=True, n_threads=None, numpy_inference=False,
+            numpy_dtype=np.float64, early_stopping=False, patience=10,
+            min_delta=0.0, validation_fraction=0.0, max_train_time=None,
+            restore_best=True):
         Model.__init__(self, system)
         nx, nu = system.obs_dim, system.ctrl_dim
         n_hidden_layers = int(n_hidden_layers)
@@ -163,6 +232,20 @@ class MLP(Model):
         self._device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available()) 
                 else torch.device('cpu'))
         self.net = self.net.double().to(self._device)
+        self.n_threads = n_threads
+        self.train_history = []
+        if type(early_stopping) == str:
+            early_stopping = True if early_stopping == "true" else False
+        self.early_stopping = early_stopping
+        self.patience = patience
+        self.min_delta = min_delta
+        self.validation_fraction = validation_fraction
+        self.max_train_time = max_train_time
+        self.restore_best = restore_best
+        self.stop_reason = None
+        self.numpy_inference = numpy_inference
+        self.numpy_dtype = numpy_dtype
+        self._executor = None
 
     def traj_to_state(self, traj):
         return traj[-1].obs.copy()
@@ -170,6 +253,9 @@ class MLP(Model):
     def update_state(self, state, new_ctrl, new_obs):
         return new_obs.copy()
 
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        return new_obs.copy()
+
     @property
     def state_dim(self):
         return self.system.obs_dim
@@ -177,9 +263,7 @@ class MLP(Model):
     def train(self, trajs, silent=False, seed=100):
         torch.manual_seed(seed)
         n_iter, n_batch, lr = self._train_data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
+        X, U, _, dY = to_trajectory_set(trajs, self.system).get_transitions()
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
         self.xu_means = np.mean(XU, axis=0)
         self.xu_std = np.std(XU, axis=0)
@@ -188,35 +272,98 @@ class MLP(Model):
         self.dy_means = np.mean(dY, axis=0)
         self.dy_std = np.std(dY, axis=0)
         dYt = transform_input(self.dy_means, self.dy_std, dY)
-        # concatenate data
-        feedX = XUt
-        predY = dYt
-        dataset = SimpleDataset(feedX, predY)
-        dataloader = DataLoader(dataset, batch_size=n_batch, shuffle=True)
-        # now I can perform training... using torch default dataset holder
+        # Keep the whole data set resident on the device and draw the
+        # minibatches by slicing a shuffled index.
+        val_fraction = self.validation_fraction if self.early_stopping else 0.0
+        train_idx, val_idx = split_validation(XUt.shape[0], val_fraction, seed)
+        valX = torch.from_numpy(XUt[val_idx]).to(self._device)
+        valY = torch.from_numpy(dYt[val_idx]).to(self._device)
+        feedX = torch.from_numpy(XUt[train_idx])
+        predY = torch.from_numpy(dYt[train_idx])
+        if self._device.type == "cuda":
+            feedX = feedX.pin_memory()
+            predY = predY.pin_memory()
+        feedX = feedX.to(self._device, non_blocking=True)
+        predY = predY.to(self._device, non_blocking=True)
+        n_samples = feedX.shape[0]
+        if self.n_threads is not None:
+            prev_threads = torch.get_num_threads()
+            torch.set_num_threads(self.n_threads)
         self.net.train()
         for param in self.net.parameters():
             param.requires_grad_(True)
         optim = torch.optim.Adam(self.net.parameters(), lr=lr)
         lossfun = torch.nn.SmoothL1Loss()
-        best_loss = float("inf")
-        best_params = None
+        self.train_history = []
+        monitor = EarlyStopping(
+                patience=self.patience if self.early_stopping else None,
+                min_delta=self.min_delta, max_time=self.max_train_time,
+                restore_best=self.early_stopping and self.restore_best)
         print("Training MLP: ", end="")
-        for i in tqdm(range(n_iter), file=sys.stdout):
-            cum_loss = 0.0
-            for i, (x, y) in enumerate(dataloader):
-                optim.zero_grad()
-                x = x.to(self._device)
-                predy = self.net(x)
-                loss = lossfun(predy, y.to(self._device))
-                loss.backward()
-                cum_loss += loss.item()
-                optim.step()
+        try:
+            for epoch in tqdm(range(n_iter), file=sys.stdout):
+                start = time.perf_counter()
+                cum_loss = torch.zeros((), dtype=feedX.dtype,
+                        device=self._device)
+                perm = torch.randperm(n_samples, device=self._device)
+                for i in range(0, n_samples, n_batch):
+                    idx = perm[i:i+n_batch]
+                    optim.zero_grad()
+                    predy = self.net(feedX[idx])
+                    loss = lossfun(predy, predY[idx])
+                    loss.backward()
+                    cum_loss += loss.detach() * idx.shape[0]
+                    optim.step()
+                elapsed = time.perf_counter() - start
+                entry = {"epoch" : epoch,
+                    "loss" : cum_loss.item() / n_samples,
+                    "time" : elapsed,
+                    "samples_per_sec" : n_samples / max(elapsed, 1e-12)}
+                monitored = entry["loss"]
+                if len(val_idx) > 0:
+                    with torch.no_grad():
+                        self.net.eval()
+                        monitored = lossfun(self.net(valX), valY).item()
+                        self.net.train()
+                    entry["val_loss"] = monitored
+                self.train_history.append(entry)
+                if monitor.update(monitored, [self.net]):
+                    break
+            monitor.restore([self.net])
+            self.stop_reason = monitor.stop_reason
+        finally:
+            if self.n_threads is not None:
+                torch.set_num_threads(prev_threads)
         self.net.eval()
         for param in self.net.parameters():
             param.requires_grad_(False)
+        self._executor = None
+        if self.numpy_inference:
+            self.compile_numpy(self.numpy_dtype)
+
+    def compile_numpy(self, dtype=np.float64):
+        """
+        Compile the trained network into an MLPExecutor, which is then
+        used for prediction instead of torch.
+
+        Parameters
+        ----------
+        dtype : numpy dtype
+            Type used for evaluation. Default is np.float64.
+        """
+        layers = [self.net.layers[lyr] for lyr in self.net.layers]
+        layers.append(self.net.output_layer)
+        self._executor = MLPExecutor(
+                [lyr.weight.detach().cpu().numpy() for lyr in layers],
+                [lyr.bias.detach().cpu().numpy() for lyr in layers],
+                self.net.nonlintype, self.xu_means, self.xu_std,
+                self.dy_means, self.dy_std, dtype=dtype)
+        return self._executor
 
     def pred(self, state, ctrl):
+        if self._executor is not None:
+            X = np.concatenate([state, ctrl])[np.newaxis,:]
+            return state + self._executor.evaluate(X)[0]
         X = np.concatenate([state, ctrl])
         X = X[np.newaxis,:]
         Xt = transform_input(self.xu_means, self.xu_std, X)
@@ -228,6 +375,8 @@ class MLP(Model):
 
     def pred_batch(self, state, ctrl):
         X = np.concatenate([state, ctrl], axis=1)
+        if self._executor is not None:
+            return state + self._executor.evaluate(X)
         Xt = transform_input(self.xu_means, self.xu_std, X)
         with torch.no_grad():
             xin = torch.from_numpy(Xt).to(self._device)
@@ -236,75 +385,30 @@ class MLP(Model):
         return state + dy.reshape((state.shape[0], self.state_dim))
 
     def pred_diff(self, state, ctrl):
-        """Use code from https://gist.github.com/sbarratt/37356c46ad1350d4c30aefbd488a4faa .
-        
-        def get_batch_jacobian(net, x, to):
-            # noutputs: total output dim (e.g. net(x).shape(b,1,4,4) noutputs=1*4*4
-            # b: batch
-            # i: in_dim
-            # o: out_dim
-            # ti: total input dim
-            # to: total output dim
-            x_batch = x.shape[0]
-            x_shape = x.shape[1:]
-            x = x.unsqueeze(1)  # b, 1 ,i
-            x = x.repeat(1, to, *(1,)*len(x.shape[2:]))  # b * to,i  copy to o dim
-            x.requires_grad_(True)
-            tmp_shape = x.shape
-            y = net(x.reshape(-1, *tmp_shape[2:]))  # x.shape = b*to,i y.shape = b*to,to
-            y_shape = y.shape[1:]  # y.shape = b*to,to
-            y = y.reshape(x_batch, to, to)  # y.shape = b,to,to
-            input_val = torch.eye(to).reshape(1, to, to).repeat(x_batch, 1, 1)  # input_val.shape = b,to,to  value is (eye)
-            y.backward(input_val)  # y.shape = b,to,to
-            return x.grad.reshape(x_batch, *y_shape, *x_shape).data  # x.shape = b,o,i
-        """
-        X = np.concatenate([state, ctrl])
-        X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        xin = torch.from_numpy(Xt).to(self._device)
-        n_out = self.system.obs_dim
-        xin = xin.repeat(n_out, 1)
-        xin.requires_grad_(True)
-        yout = self.net(xin)
-        # compute gradient...
-        yout.backward(torch.eye(n_out).to(self._device))
-        jac = xin.grad.cpu().data.numpy()
-        # properly scale back...
-        jac = jac / self.xu_std[None] * self.dy_std[:, np.newaxis]
-        n = self.system.obs_dim
-        state_jac = jac[:, :n] + np.eye(n)
-        ctrl_jac = jac[:, n:]
-        out = yout.detach().cpu().numpy()[:1, :]
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
-        return state+dy, state_jac, ctrl_jac
+        pred, state_jac, ctrl_jac = self.pred_diff_batch(
+                state.reshape((1,-1)), ctrl.reshape((1,-1)))
+        return pred[0], state_jac[0], ctrl_jac[0]
 
     def pred_diff_batch(self, state, ctrl):
         """Prediction, but with gradient information"""
         X = np.concatenate([state, ctrl], axis=1)
+        n = self.system.obs_dim
+        if self._executor is not None:
+            dy, jac = self._executor.evaluate_jacobian(X)
+            return state + dy, jac[:, :, :n] + np.eye(n), jac[:, :, n:]
         Xt = transform_input(self.xu_means, self.xu_std, X)
-        obs_dim = state.shape[1]
-        m = state.shape[0]
-        # get the Tensor
-        TsrXt = torch.from_numpy(Xt).to(self._device)
-        TsrXt = TsrXt.repeat(obs_dim, 1, 1).permute(1,0,2).flatten(0,1)
-        TsrXt.requires_grad_(True)
-        predy = self.net(TsrXt)
-        predy.backward(torch.eye(obs_dim).to(self._device).repeat(m,1), retain_graph=True)
-        predy = predy.reshape((m, obs_dim, obs_dim))
-        #predy.backward(retain_graph=True)
-        jac = TsrXt.grad.cpu().data.numpy()
-        jac = jac.reshape((m, obs_dim, TsrXt.shape[-1]))
+        with torch.no_grad():
+            xin = torch.from_numpy(Xt).to(self._device)
+            yout, jac = self.net.forward_jacobian(xin)
+            yout = yout.cpu().numpy()
+            jac = jac.cpu().numpy()
         # properly scale back...
-        jac = jac / np.tile(self.xu_std, (m,obs_dim,1)) * np.tile(self.dy_std, (m,1))[:,:,np.newaxis]
-        # since repeat, y value is the first one...
-        out = predy[:,0,:].cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out)
-        n = self.system.obs_dim
-        state_jacs = jac[:, :, :n] + np.tile(np.eye(n), (m,1,1))
+        jac = jac * (self.dy_std[:, np.newaxis] / self.xu_std[np.newaxis, :])
+        dy = transform_output(self.dy_means, self.dy_std, yout)
+        state_jacs = jac[:, :, :n] + np.eye(n)
         ctrl_jacs = jac[:, :, n:]
         return state + dy, state_jacs, ctrl_jacs
 
-
     def get_parameters(self):
         return {"net_state" : self.net.state_dict(),
                 "xu_means" : self.xu_means,
@@ -319,3 +423,6 @@ class MLP(Model):
         self.dy_means = params["dy_means"]
         self.dy_std = params["dy_std"]
         self.net.load_state_dict(params["net_state"])
+        self._executor = None
+        if self.numpy_inference:
+            self.compile_numpy(self.numpy_dtype)
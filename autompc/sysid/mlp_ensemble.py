@@ -0,0 +1,405 @@
+"""
+Ensemble of multi-layer perceptrons, optionally with Gaussian output heads.
+The member weights are stacked so that all members are evaluated together
+by one chain of batched matrix products.
+"""
+import math
+import sys
+import numpy as np
+from tqdm import tqdm
+import torch
+import ConfigSpace as CS
+import ConfigSpace.hyperparameters as CSH
+
+from .model import Model, ModelFactory
+from .mlp import transform_input, make_nonlin, nonlin_derivative
+from ..trajectory_set import to_trajectory_set
+
+class EnsembleNet(torch.nn.Module):
+    def __init__(self, n_members, n_in, n_out, hidden_sizes, nonlintype,
+            probabilistic=False):
+        """
+        Feedforward networks of identical architecture, whose layer
+        weights are stored as tensors of shape (n_members, n_in, n_out).
+        A probabilistic network predicts a mean and a bounded log variance
+        for each output.
+        """
+        assert len(hidden_sizes) > 0
+        torch.nn.Module.__init__(self)
+        self.n_members = n_members
+        self.n_out = n_out
+        self.probabilistic = probabilistic
+        self.nonlintype = nonlintype
+        self.nonlin = make_nonlin(nonlintype)
+        sizes = [n_in] + list(hidden_sizes) + [2 * n_out if probabilistic
+                else n_out]
+        self.weights = torch.nn.ParameterList()
+        self.biases = torch.nn.ParameterList()
+        for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+            # Same initialization as torch.nn.Linear
+            bound = 1 / math.sqrt(fan_in)
+            self.weights.append(torch.nn.Parameter(torch.empty(n_members,
+                fan_in, fan_out).uniform_(-bound, bound)))
+            self.biases.append(torch.nn.Parameter(torch.empty(n_members,
+                1, fan_out).uniform_(-bound, bound)))
+        if probabilistic:
+            self.max_logvar = torch.nn.Parameter(torch.full((1, 1, n_out), 0.5))
+            self.min_logvar = torch.nn.Parameter(torch.full((1, 1, n_out), -10.0))
+        self._scratch_key = None
+        self._scratch = None
+
+    def _activate_(self, x):
+        if self.nonlintype == 'relu':
+            return x.relu_()
+        elif self.nonlintype == 'tanh':
+            return x.tanh_()
+        elif self.nonlintype == 'sigmoid':
+            return x.sigmoid_()
+        elif self.nonlintype == 'selu':
+            return torch.nn.functional.selu(x, inplace=True)
+
+    def _hidden_inference(self, x):
+        # Without autograd the activations are computed in place in buffers
+        # which are reused across calls, since allocating them for large
+        # batches costs about as much as the matrix products.
+        key = (x.shape[1], x.dtype, x.device)
+        if key != self._scratch_key:
+            self._scratch = [torch.empty(self.n_members, x.shape[1],
+                W.shape[2], dtype=x.dtype, device=x.device)
+                for W in self.weights[:-1]]
+            self._scratch_key = key
+        for W, b, buf in zip(self.weights[:-1], self.biases[:-1],
+                self._scratch):
+            x = self._activate_(torch.baddbmm(b, x, W, out=buf))
+        return x
+
+    def _hidden(self, x):
+        ys, xs = [], []
+        for W, b in zip(self.weights[:-1], self.biases[:-1]):
+            y = torch.baddbmm(b, x, W)
+            x = self.nonlin(y)
+            ys.append(y)
+            xs.append(x)
+        return x, ys, xs
+
+    def _head(self, out):
+        if not self.probabilistic:
+            return out, None
+        mean, logvar = out[..., :self.n_out], out[..., self.n_out:]
+        logvar = self.max_logvar - torch.nn.functional.softplus(
+                self.max_logvar - logvar)
+        logvar = self.min_logvar + torch.nn.functional.softplus(
+                logvar - self.min_logvar)
+        return mean, logvar
+
+    def forward(self, x):
+        """
+        Parameters
+        ----------
+        x : torch tensor of shape (n_members, N, n_in)
+            Input of each member
+
+        Returns
+        -------
+        mean : torch tensor of shape (n_members, N, n_out)
+        logvar : torch tensor of shape (n_members, N, n_out), or None if
+            the network is not probabilistic
+        """
+        if torch.is_grad_enabled():
+            x, _, _ = self._hidden(x)
+        else:
+            x = self._hidden_inference(x)
+        return self._head(torch.baddbmm(self.biases[-1], x, self.weights[-1]))
+
+    def mean_jacobian(self, x):
+        """
+        Evaluate the predicted means and their input Jacobians.
+
+        Parameters
+        ----------
+        x : torch tensor of shape (n_members, N, n_in)
+
+        Returns
+        -------
+        mean : torch tensor of shape (n_members, N, n_out)
+        jac : torch tensor of shape (n_members, N, n_out, n_in)
+        """
+        h, ys, xs = self._hidden(x)
+        mean, _ = self._head(torch.baddbmm(self.biases[-1], h,
+            self.weights[-1]))
+        W = self.weights[-1][:, :, :self.n_out].transpose(1, 2)
+        jac = W.unsqueeze(1).expand(-1, x.shape[1], -1, -1)
+        for Wl, y, a in zip(reversed(self.weights[:-1]), reversed(ys),
+                reversed(xs)):
+            deriv = nonlin_derivative(self.nonlintype, y, a)
+            jac = torch.matmul(jac * deriv.unsqueeze(2),
+                    Wl.transpose(1, 2).unsqueeze(1))
+        return mean, jac
+
+class MLPEnsembleFactory(ModelFactory):
+    """
+    The MLP ensemble model trains several multi-layer perceptrons on bootstrap
+    resamples of the data, optionally with Gaussian output heads which also
+    predict the variance of the state difference.  Predictions average the
+    member means.  All members are evaluated together with batched matrix
+    products, so the ensemble costs about as much as one wider network.
+
+    For uncertainty-aware control, get_batch_sampler assigns each rollout to a
+    member, and samples the Gaussian output if the ensemble is probabilistic.
+    MPPI uses it when created with sample_model=True.
+
+    Parameters
+
+    - *n_batch* (Type: int, Default: 64): Training batch size of each member.
+    - *n_train_iters* (Type: int, Default: 50): Number of training epochs.
+    - *bootstrap* (Type: bool, Default: True): Train each member on a bootstrap resample
+      of the data.
+
+    Hyperparameters:
+
+    - *n_members* (Type: int, Low: 2, High: 10, Default: 5): Number of ensemble members.
+    - *n_hidden_layers* (Type: str, Choices: ["1", "2", "3", "4"], Default: "2"):
+      The number of hidden layers in each network
+    - *hidden_size* (Type int, Low: 16, High: 256, Default: 128): Size of the hidden layers.
+    - *nonlintype* (Type: str, choices: ["relu", "tanh", "sigmoid", "selu"], Default: "relu):
+      Type of activation function.
+    - *lr* (Type: float, Low: 1e-5, High: 1, Default: 1e-3): Adam learning rate for the networks.
+    - *probabilistic* (Type: str, Choices: ["true", "false"], Default: "true"): Whether the
+      members predict a Gaussian distribution, trained by negative log likelihood.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.Model = MLPEnsemble
+        self.name = "MLPEnsemble"
+
+    def get_configuration_space(self):
+        cs = CS.ConfigurationSpace()
+        n_members = CSH.UniformIntegerHyperparameter("n_members",
+                lower=2, upper=10, default_value=5)
+        nonlintype = CSH.CategoricalHyperparameter("nonlintype",
+                choices=["relu", "tanh", "sigmoid", "selu"],
+                default_value="relu")
+        n_hidden_layers = CSH.CategoricalHyperparameter("n_hidden_layers",
+                choices=["1", "2", "3", "4"], default_value="2")
+        hidden_size = CSH.UniformIntegerHyperparameter("hidden_size",
+                lower = 16, upper = 256, default_value=128)
+        lr = CSH.UniformFloatHyperparameter("lr",
+                lower = 1e-5, upper = 1, default_value=1e-3, log=True)
+        probabilistic = CSH.CategoricalHyperparameter("probabilistic",
+                choices=["true", "false"], default_value="true")
+        cs.add_hyperparameters([n_members, nonlintype, n_hidden_layers,
+            hidden_size, lr, probabilistic])
+        return cs
+
+class MLPEnsemble(Model):
+    def __init__(self, system, n_members=5, n_hidden_layers=2, hidden_size=128,
+            nonlintype='relu', n_train_iters=50, n_batch=64, lr=1e-3,
+            probabilistic=True, bootstrap=True, seed=100, use_cuda=True):
+        Model.__init__(self, system)
+        nx, nu = system.obs_dim, system.ctrl_dim
+        if type(probabilistic) == str:
+            probabilistic = True if probabilistic == "true" else False
+        self.n_members = n_members
+        self.probabilistic = probabilistic
+        self.bootstrap = bootstrap
+        self.seed = seed
+        hidden_sizes = [hidden_size] * int(n_hidden_layers)
+        torch.manual_seed(seed)
+        self.net = EnsembleNet(n_members, nx + nu, nx, hidden_sizes,
+                nonlintype, probabilistic)
+        self._train_data = (n_train_iters, n_batch, lr)
+        self._device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available())
+                else torch.device('cpu'))
+        self.net = self.net.double().to(self._device)
+        self.train_history = []
+
+    def traj_to_state(self, traj):
+        return traj[-1].obs.copy()
+
+    def update_state(self, state, new_ctrl, new_obs):
+        return new_obs.copy()
+
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        return new_obs.copy()
+
+    @property
+    def state_dim(self):
+        return self.system.obs_dim
+
+    def _loss(self, x, y):
+        mean, logvar = self.net(x)
+        if not self.probabilistic:
+            return torch.mean((mean - y)**2) * self.n_members
+        # Gaussian negative log likelihood, summed over members
+        inv_var = torch.exp(-logvar)
+        nll = torch.mean((mean - y)**2 * inv_var + logvar, dim=(1, 2)).sum()
+        return nll + 0.01 * torch.sum(self.net.max_logvar - self.net.min_logvar)
+
+    def train(self, trajs, silent=False, seed=None):
+        if seed is None:
+            seed = self.seed
+        torch.manual_seed(seed)
+        n_iter, n_batch, lr = self._train_data
+        X, U, _, dY = to_trajectory_set(trajs, self.system).get_transitions()
+        XU = np.concatenate((X, U), axis = 1) # stack X and U together
+        self.xu_means = np.mean(XU, axis=0)
+        self.xu_std = np.std(XU, axis=0)
+        XUt = transform_input(self.xu_means, self.xu_std, XU)
+        self.dy_means = np.mean(dY, axis=0)
+        self.dy_std = np.std(dY, axis=0)
+        dYt = transform_input(self.dy_means, self.dy_std, dY)
+
+        feedX = torch.from_numpy(XUt).to(self._device)
+        predY = torch.from_numpy(dYt).to(self._device)
+        n_samples = feedX.shape[0]
+        K = self.n_members
+        if self.bootstrap:
+            idx = torch.randint(n_samples, (K, n_samples), device=self._device)
+        else:
+            idx = torch.arange(n_samples, device=self._device).repeat(K, 1)
+
+        self.net.train()
+        for param in self.net.parameters():
+            param.requires_grad_(True)
+        optim = torch.optim.Adam(self.net.parameters(), lr=lr)
+        self.train_history = []
+        itr = range(n_iter)
+        if not silent:
+            print("Training MLP Ensemble: ", end="")
+            itr = tqdm(itr, file=sys.stdout)
+        for epoch in itr:
+            cum_loss = torch.zeros((), dtype=feedX.dtype, device=self._device)
+            # Shuffle each member's samples independently
+            order = torch.argsort(torch.rand(K, n_samples,
+                device=self._device), dim=1)
+            shuffled = torch.gather(idx, 1, order)
+            for i in range(0, n_samples, n_batch):
+                batch = shuffled[:, i:i+n_batch]
+                optim.zero_grad()
+                loss = self._loss(feedX[batch], predY[batch])
+                loss.backward()
+                cum_loss += loss.detach() * batch.shape[1]
+                optim.step()
+            self.train_history.append({"epoch" : epoch,
+                "loss" : cum_loss.item() / n_samples / K})
+        self.net.eval()
+        for param in self.net.parameters():
+            param.requires_grad_(False)
+
+    def _normalize(self, state, ctrl):
+        X = np.concatenate([state, ctrl], axis=1)
+        Xt = (X - self.xu_means) / self.xu_std
+        return torch.from_numpy(Xt).to(self._device)
+
+    def pred_members(self, state, ctrl):
+        """
+        Predict the next state with every ensemble member.
+
+        Parameters
+        ----------
+        state : numpy array of shape (N, state_dim)
+        ctrl : numpy array of shape (N, ctrl_dim)
+
+        Returns
+        -------
+        means : numpy array of shape (n_members, N, state_dim)
+            Predicted next states of each member
+
+        variances : numpy array of shape (n_members, N, state_dim)
+            Predicted variance of each member, or None if the ensemble is
+            not probabilistic
+        """
+        xin = self._normalize(state, ctrl)
+        with torch.no_grad():
+            mean, logvar = self.net(xin.expand(self.n_members, -1, -1))
+        means = state + mean.cpu().numpy() * self.dy_std + self.dy_means
+        if logvar is None:
+            return means, None
+        return means, np.exp(logvar.cpu().numpy()) * self.dy_std**2
+
+    def pred(self, state, ctrl):
+        return self.pred_batch(state[np.newaxis,:], ctrl[np.newaxis,:])[0]
+
+    def pred_batch(self, state, ctrl):
+        means, _ = self.pred_members(state, ctrl)
+        return means.mean(axis=0)
+
+    def pred_diff(self, state, ctrl):
+        pred, state_jac, ctrl_jac = self.pred_diff_batch(
+                state[np.newaxis,:], ctrl[np.newaxis,:])
+        return pred[0], state_jac[0], ctrl_jac[0]
+
+    def pred_diff_batch(self, state, ctrl):
+        xin = self._normalize(state, ctrl)
+        with torch.no_grad():
+            mean, jac = self.net.mean_jacobian(
+                    xin.expand(self.n_members, -1, -1))
+            mean = mean.mean(dim=0).cpu().numpy()
+            jac = jac.mean(dim=0).cpu().numpy()
+        jac = jac * (self.dy_std[:, np.newaxis] / self.xu_std[np.newaxis, :])
+        n = self.system.obs_dim
+        pred = state + mean * self.dy_std + self.dy_means
+        return pred, jac[:, :, :n] + np.eye(n), jac[:, :, n:]
+
+    def get_batch_sampler(self, n_paths, seed=None):
+        """
+        Returns a function which samples next states for a fixed set of
+        rollouts.  Each rollout is assigned to one ensemble member for its
+        whole length, and the members are evaluated together.  If the
+        ensemble is probabilistic, the next state is drawn from the
+        member's Gaussian prediction.
+
+        Parameters
+        ----------
+        n_paths : int
+            Number of rollouts
+
+        seed : int
+            Seed for the member assignment and the output noise
+
+        Returns
+        -------
+        sample : Function (states, ctrls) -> next_states
+            Takes arrays of shape (n_paths, state_dim) and
+            (n_paths, ctrl_dim).
+        """
+        rng = np.random.default_rng(seed)
+        K = self.n_members
+        per_member = -(-n_paths // K)
+        # Spread the rollouts evenly over the members. Each member evaluates
+        # per_member rows, padded with copies whose results are discarded.
+        members = rng.permutation(np.arange(n_paths) % K)
+        rows = np.zeros((K, per_member), dtype=int)
+        valid = np.zeros((K, per_member), dtype=bool)
+        for k in range(K):
+            paths = np.flatnonzero(members == k)
+            rows[k, :len(paths)] = paths
+            valid[k, :len(paths)] = True
+        rows_t = torch.from_numpy(rows).to(self._device)
+        def sample(states, ctrls):
+            xin = self._normalize(states, ctrls)
+            with torch.no_grad():
+                mean, logvar = self.net(xin[rows_t])
+            mean = mean.cpu().numpy()
+            if logvar is not None:
+                std = np.exp(0.5 * logvar.cpu().numpy())
+                mean = mean + std * rng.standard_normal(mean.shape)
+            dy = np.empty((n_paths, self.state_dim))
+            dy[rows[valid]] = mean[valid]
+            return states + dy * self.dy_std + self.dy_means
+        sample.members = members
+        return sample
+
+    def get_parameters(self):
+        return {"net_state" : self.net.state_dict(),
+                "xu_means" : self.xu_means,
+                "xu_std" : self.xu_std,
+                "dy_means" : self.dy_means,
+                "dy_std" : self.dy_std }
+
+    def set_parameters(self, params):
+        self.xu_means = params["xu_means"]
+        self.xu_std = params["xu_std"]
+        self.dy_means = params["dy_means"]
+        self.dy_std = params["dy_std"]
+        self.net.load_state_dict(params["net_state"])
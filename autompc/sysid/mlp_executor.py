@@ -0,0 +1,159 @@
+# External library includes
+import numpy as np
+
+_SELU_SCALE = 1.0507009873554805
+_SELU_ALPHA = 1.6732632423543772
+
+class MLPExecutor:
+    """
+    NumPy evaluation of a trained feed-forward network predicting state
+    differences.  The input and output normalization are folded into the
+    first and last layer, and the activations are computed in preallocated
+    buffers, so small batches are evaluated without torch overhead.
+    """
+    def __init__(self, weights, biases, nonlintype, xu_means, xu_std,
+            dy_means, dy_std, dtype=np.float64):
+        """
+        Parameters
+        ----------
+        weights : list of numpy arrays
+            Layer weights of shape (n_out, n_in), hidden layers first and
+            the output layer last.
+
+        biases : list of numpy arrays
+            Layer biases of shape (n_out,)
+
+        nonlintype : str
+            Activation function, one of "relu", "selu", "tanh" or "sigmoid"
+
+        xu_means, xu_std : numpy arrays
+            Normalization of the network input
+
+        dy_means, dy_std : numpy arrays
+            Normalization of the network output
+
+        dtype : numpy dtype
+            Type used for evaluation, np.float32 or np.float64.
+            Default is np.float64.
+        """
+        if nonlintype not in ["relu", "selu", "tanh", "sigmoid"]:
+            raise ValueError("Unsupported nonlinearity {}".format(nonlintype))
+        self.nonlintype = nonlintype
+        self.dtype = np.dtype(dtype)
+        weights = [np.asarray(w, dtype=np.float64) for w in weights]
+        biases = [np.asarray(b, dtype=np.float64) for b in biases]
+        xu_means = np.asarray(xu_means, dtype=np.float64)
+        xu_std = np.asarray(xu_std, dtype=np.float64)
+        dy_means = np.asarray(dy_means, dtype=np.float64)
+        dy_std = np.asarray(dy_std, dtype=np.float64)
+        # (x - mu) / sd enters the first layer as W (x - mu) / sd + b
+        weights[0], biases[0] = (weights[0] / xu_std,
+                biases[0] - weights[0] @ (xu_means / xu_std))
+        # The output is mapped back by y * sd + mu
+        weights[-1], biases[-1] = (dy_std[:, np.newaxis] * weights[-1],
+                dy_std * biases[-1] + dy_means)
+        self.weights = [np.ascontiguousarray(w, dtype=self.dtype)
+                for w in weights]
+        self.weights_t = [np.ascontiguousarray(w.T) for w in self.weights]
+        self.biases = [np.ascontiguousarray(b, dtype=self.dtype)
+                for b in biases]
+        self._batch_size = None
+        self._buffers = None
+
+    @property
+    def n_in(self):
+        return self.weights[0].shape[1]
+
+    @property
+    def n_out(self):
+        return self.weights[-1].shape[0]
+
+    def _get_buffers(self, batch_size):
+        if batch_size != self._batch_size:
+            self._buffers = [np.empty((batch_size, w.shape[0]),
+                dtype=self.dtype) for w in self.weights[:-1]]
+            self._batch_size = batch_size
+        return self._buffers
+
+    def _activate(self, x):
+        # Applies the nonlinearity in place
+        if self.nonlintype == "relu":
+            np.maximum(x, 0, out=x)
+        elif self.nonlintype == "tanh":
+            np.tanh(x, out=x)
+        elif self.nonlintype == "sigmoid":
+            np.negative(x, out=x)
+            np.exp(x, out=x)
+            x += 1
+            np.reciprocal(x, out=x)
+        elif self.nonlintype == "selu":
+            neg = x < 0
+            x[neg] = _SELU_ALPHA * np.expm1(x[neg])
+            x *= _SELU_SCALE
+
+    def _derivative(self, x):
+        # Derivative of the nonlinearity given its output
+        if self.nonlintype == "relu":
+            return (x > 0).astype(self.dtype)
+        elif self.nonlintype == "tanh":
+            return 1 - x * x
+        elif self.nonlintype == "sigmoid":
+            return x * (1 - x)
+        elif self.nonlintype == "selu":
+            return np.where(x > 0, _SELU_SCALE, x + _SELU_SCALE * _SELU_ALPHA)
+
+    def _hidden(self, xu):
+        buffers = self._get_buffers(xu.shape[0])
+        x = np.asarray(xu, dtype=self.dtype)
+        for wt, b, buf in zip(self.weights_t, self.biases, buffers):
+            np.dot(x, wt, out=buf)
+            buf += b
+            self._activate(buf)
+            x = buf
+        return x
+
+    def evaluate(self, xu):
+        """
+        Evaluate the network.
+
+        Parameters
+        ----------
+        xu : numpy array of shape (N, n_in)
+            Unnormalized states and controls
+
+        Returns
+        -------
+        dy : numpy array of shape (N, n_out)
+            Unnormalized network output
+        """
+        x = self._hidden(xu)
+        out = x @ self.weights_t[-1]
+        out += self.biases[-1]
+        return out
+
+    def evaluate_jacobian(self, xu):
+        """
+        Evaluate the network and its input Jacobian.
+
+        Parameters
+        ----------
+        xu : numpy array of shape (N, n_in)
+            Unnormalized states and controls
+
+        Returns
+        -------
+        dy : numpy array of shape (N, n_out)
+            Unnormalized network output
+
+        jac : numpy array of shape (N, n_out, n_in)
+            Jacobian of dy with respect to xu
+        """
+        x = self._hidden(xu)
+        out = x @ self.weights_t[-1]
+        out += self.biases[-1]
+        jac = np.broadcast_to(self.weights[-1], (x.shape[0],)
+                + self.weights[-1].shape)
+        for w, buf in zip(reversed(self.weights[:-1]),
+                reversed(self._buffers)):
+            jac = (jac * self._derivative(buf)[:, np.newaxis, :]) @ w
+        return out, jac
@@ -29,7 +29,7 @@ class ModelFactory(ABC):
         ----------
             cfg : Configuration
                 Configuration of model hyperparameters
-            train_trajs : List of Trajectory objects
+            train_trajs : List of Trajectory objects or TrajectorySet
                 Model training data set
             silent : bool
                 Whether to produce output during training
@@ -88,6 +88,29 @@ class Model(ABC):
         """
         raise NotImplementedError
 
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        """
+        Update N model states at once.  Depending on the model, this can
+        be much faster than repeatedly calling update_state.
+
+        Parameters
+        ----------
+            states : numpy array of shape (N, self.state_dim)
+                Current model states
+            new_ctrls : numpy array of shape (N, self.system.ctrl_dim)
+                New control inputs
+            new_obs : numpy array of shape (N, self.system.obs_dim)
+                New observations
+        Returns
+        -------
+            states : numpy array of shape (N, self.state_dim)
+                Model states after observation and control
+        """
+        out = np.empty((states.shape[0], self.state_dim))
+        for i in range(states.shape[0]):
+            out[i,:] = self.update_state(states[i,:], new_ctrls[i,:], new_obs[i,:])
+        return out
+
     @abstractmethod
     def pred(self, state, ctrl):
         """
@@ -184,6 +207,23 @@ class Model(ABC):
         return out, state_jacs, ctrl_jacs
 
 
+    def observe(self, state, ctrl, new_obs):
+        """
+        Adapt the model parameters to an observed transition.
+
+        Parameters
+        ----------
+            state : numpy array of size self.state_dim
+                Model state at time t
+            ctrl : numpy array of size self.system.ctrl_dim
+                Control applied at time t
+            new_obs : numpy array of size self.system.obs_dim
+                Observation at time t+1
+        Only implemented for models supporting online adaptation,
+        and only after online adaptation has been enabled.
+        """
+        raise NotImplementedError
+
     def to_linear(self):
         """
         Returns: (A, B, state_func, cost_func)
@@ -196,7 +236,7 @@ class Model(ABC):
         """
         Parameters
         ----------
-            trajs : List of pairs (xs, us)
+            trajs : List of Trajectory or TrajectorySet
                 Training set of trajectories
             silent : bool
                 Silence progress bar output
@@ -236,6 +276,13 @@ class Model(ABC):
         """
         return not self.to_linear.__func__ is Model.to_linear
 
+    @property
+    def is_online(self):
+        """
+        Returns true for models with online adaptation enabled.
+        """
+        return False
+
     @property
     def is_diff(self):
         """
@@ -0,0 +1,67 @@
+# Standard library includes
+
+# Internal library includes
+
+# External library includes
+import numpy as np
+import numpy.linalg as la
+
+class RecursiveLeastSquares:
+    """
+    Recursive least-squares estimator for a linear regression
+    :math:`y = \\theta^T \\phi` with multiple outputs.  The estimator
+    maintains the coefficients and the inverse of the (exponentially
+    weighted) information matrix, so each new sample is incorporated in
+    :math:`O(d^2)` time for d regressors.
+    """
+    def __init__(self, coeffs, info_matrix, forgetting=1.0, reg=1e-6):
+        """
+        Parameters
+        ----------
+        coeffs : numpy array of shape (d, p)
+            Initial coefficients, e.g. from a batch least-squares fit
+
+        info_matrix : numpy array of shape (d, d)
+            Information matrix :math:`\\Phi^T \\Phi` of the data the
+            coefficients were fit to.
+
+        forgetting : float
+            Exponential forgetting factor in (0, 1]. A value of 1
+            weights all samples equally.
+
+        reg : float
+            Ridge added to the information matrix before inversion.
+        """
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting must be in (0, 1]")
+        self.coeffs = np.array(coeffs, dtype=float)
+        d = self.coeffs.shape[0]
+        self.P = la.inv(info_matrix + reg * np.eye(d))
+        self.forgetting = forgetting
+        self.n_updates = 0
+
+    def update(self, phi, y):
+        """
+        Incorporate one sample.
+
+        Parameters
+        ----------
+        phi : numpy array of size d
+            Regressor vector
+
+        y : numpy array of size p
+            Target vector
+
+        Returns
+        -------
+        error : numpy array of size p
+            Prediction error of the sample before the update
+        """
+        Pphi = self.P @ phi
+        gain = Pphi / (self.forgetting + phi @ Pphi)
+        error = y - phi @ self.coeffs
+        self.coeffs += np.outer(gain, error)
+        self.P -= np.outer(gain, Pphi)
+        self.P /= self.forgetting
+        self.n_updates += 1
+        return error
@@ -5,14 +5,53 @@ from pdb import set_trace
 from sklearn.linear_model import  Lasso
 
 from .model import Model, ModelFactory
+from ..trajectory_set import to_trajectory_set
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
 import ConfigSpace.conditions as CSC
 
 import pysindy as ps
 import pysindy.differentiation as psd
+from pysindy.feature_library.base import BaseFeatureLibrary, x_sequence_or_item
+from pysindy.utils import AxesArray, comprehend_axes
 
-from .basis_funcs import *
+from .basis_library import sindy_library
+from .feature_cache import get_feature_cache
+
+class CompiledLibrary(BaseFeatureLibrary):
+    """
+    pysindy feature library evaluating a BasisLibrary.  If cache is True,
+    columns are memoized in the process FeatureCache.
+    """
+    def __init__(self, library, cache=False):
+        super().__init__()
+        self.library = library
+        self.cache = cache
+
+    @x_sequence_or_item
+    def fit(self, x_full, y=None):
+        n_features = x_full[0].shape[x_full[0].ax_coord]
+        if n_features != self.library.input_dim:
+            raise ValueError("x shape does not match library input size")
+        # Older pysindy versions use n_input_features_
+        self.n_features_in_ = n_features
+        self.n_input_features_ = n_features
+        self.n_output_features_ = self.library.n_features
+        return self
+
+    @x_sequence_or_item
+    def transform(self, x_full):
+        xp_full = []
+        for x in x_full:
+            if self.cache:
+                xp = get_feature_cache().evaluate(self.library, np.asarray(x))
+            else:
+                xp = self.library.evaluate(np.asarray(x))
+            xp_full.append(AxesArray(xp, comprehend_axes(xp)))
+        return xp_full
+
+    def get_feature_names(self, input_features=None):
+        return self.library.get_names(input_features)
 
 class FourthOrderFiniteDifference(psd.base.BaseDifferentiation):
     def _differentiate(self, x, t):
@@ -123,34 +162,24 @@ class SINDy(Model):
     def update_state(self, state, new_ctrl, new_obs):
         return new_obs.copy()
 
+    def update_state_batch(self, states, new_ctrls, new_obs):
+        return new_obs.copy()
+
     @property
     def state_dim(self):
         return self.system.obs_dim
 
     def train(self, trajs, xdot=None, silent=False):
+        trajs = to_trajectory_set(trajs, self.system)
         X = [traj.obs for traj in trajs]
         U = [traj.ctrls for traj in trajs]
 
-        #basis_funcs = [get_constant_basis_func(), get_identity_basis_func()]
-        basis_funcs = [get_identity_basis_func()]
-        if self.trig_basis:
-            for freq in range(1,self.trig_freq+1):
-                basis_funcs += get_trig_basis_funcs(freq)
-                if self.trig_interaction:
-                    basis_funcs += get_trig_interaction_terms(freq)
-
-        if self.poly_basis:
-            for deg in range(2,self.poly_degree+1):
-                basis_funcs.append(get_poly_basis_func(deg))
-            if self.poly_cross_terms:
-                for deg in range(2,self.poly_degree+1):
-                    basis_funcs += get_cross_term_basis_funcs(deg)
-
-        library_functions = [basis.func for basis in basis_funcs]
-        function_names = [basis.name_func for basis in basis_funcs]
-        library = ps.CustomLibrary(library_functions=library_functions,
-                function_names=function_names)
-        self.basis_funcs = basis_funcs
+        self.library = sindy_library(self.system.obs_dim + self.system.ctrl_dim,
+                poly_degree=self.poly_degree if self.poly_basis else 1,
+                poly_cross_terms=self.poly_cross_terms,
+                trig_freq=self.trig_freq if self.trig_basis else 0,
+                trig_interaction=self.trig_interaction)
+        library = CompiledLibrary(self.library, cache=True)
 
         if self.time_mode == "continuous":
             sindy_model = ps.SINDy(feature_library=library, 
@@ -164,6 +193,22 @@ class SINDy(Model):
                     optimizer=ps.STLSQ(threshold=self.threshold))
             sindy_model.fit(X, u=U, multiple_trajectories=True)
         self.model = sindy_model
+        self._compile_predictor()
+
+    def _compile_predictor(self):
+        # STLSQ zeroes most coefficients, so prediction only evaluates the
+        # library terms which are active in some output.
+        coeffs = self.model.coefficients()
+        active = np.flatnonzero(np.any(coeffs != 0, axis=0))
+        self.active_library = self.library.subset(active)
+        self.active_coeffs = np.ascontiguousarray(coeffs[:, active].T)
+        # Maps the factor derivatives of the active terms directly to the
+        # model Jacobian
+        self._jac_table = self.active_library.jacobian_table(self.active_coeffs)
+
+    def _pred_features(self, states, ctrls):
+        inputs = np.concatenate([states, ctrls], axis=1)
+        return self.active_library.evaluate(inputs) @ self.active_coeffs
 
     def pred(self, state, ctrl):
         xpred = self.pred_batch(state.reshape((1,state.size)), 
@@ -172,9 +217,9 @@ class SINDy(Model):
 
     def pred_batch(self, states, ctrls):
         if self.time_mode == "discrete":
-            xpreds = self.model.predict(states, ctrls)
+            xpreds = self._pred_features(states, ctrls)
         else:
-            pred_dxs = self.model.predict(states, ctrls)
+            pred_dxs = self._pred_features(states, ctrls)
             xpreds = states + self.system.dt * pred_dxs
         return xpreds
 
@@ -186,61 +231,18 @@ class SINDy(Model):
         ctrl_jac = ctrl_jac[0]
         return pred, state_jac, ctrl_jac
 
-    def compute_gradient(self, states, ctrls, basis, coeff, feat_names):
-        input_dim = self.state_dim + self.system.ctrl_dim
-        idxs = np.mgrid[tuple(slice(input_dim) 
-                                for _ in range(basis.n_args))]
-        idxs = idxs.reshape((basis.n_args, -1))
-        p = states.shape[0]
-        state_jac = np.zeros((p,self.state_dim))
-        ctrl_jac = np.zeros((p,self.system.ctrl_dim))
-        for i in range(idxs.shape[1]):
-            # Find feature
-            var_names = ["x{}".format(j) if j < self.state_dim else 
-                    "u{}".format(j-self.state_dim) for j in idxs[:,i]]
-            feat_name = basis.name_func(*var_names)
-            try:
-                coeff_idx = feat_names.index(feat_name)
-            except ValueError:
-                continue
-
-            # Compute gradient
-            vals = []
-            for j in range(idxs.shape[0]):
-                idx = idxs[j,i]
-                if idx < self.state_dim:
-                    val = states[:,idx]
-                else:
-                    val = ctrls[:,idx-self.state_dim]
-                vals.append(val)
-            grads = basis.grad_func(*vals)
-            grads = np.array(grads)
-            for j in range(idxs.shape[0]):
-                idx = idxs[j,i]
-                if idx < self.state_dim:
-                    state_jac[:,idx] += coeff[coeff_idx] * grads[j]
-                else:
-                    ctrl_jac[:,idx-self.state_dim] += coeff[coeff_idx] * grads[j]
-        return state_jac, ctrl_jac
-
     def pred_diff_batch(self, states, ctrls):
-        xpred = self.pred_batch(states, ctrls)
-        p = states.shape[0]
-        state_jac = np.zeros((p, self.state_dim, self.state_dim))
-        ctrl_jac = np.zeros((p, self.state_dim, self.system.ctrl_dim))
-        coeffs = self.model.coefficients()
-        feat_names = self.model.get_feature_names()
-        for i in range(self.state_dim):
-            for basis in self.basis_funcs:
-                sj, cj = self.compute_gradient(
-                        states, ctrls, basis, coeffs[i,:], feat_names)
-                state_jac[:,i,:] += sj
-                ctrl_jac[:,i,:] += cj
+        inputs = np.concatenate([states, ctrls], axis=1)
+        preds, jac = self.active_library.linear_jacobian(inputs,
+                self.active_coeffs, self._jac_table)
+        state_jac = jac[:, :, :self.state_dim]
+        ctrl_jac = jac[:, :, self.state_dim:]
         if self.time_mode == "continuous":
-            ident = np.array([np.eye(self.state_dim) for _ in
-                range(p)])
-            state_jac = ident + self.system.dt * state_jac
+            xpred = states + self.system.dt * preds
+            state_jac = np.eye(self.state_dim) + self.system.dt * state_jac
             ctrl_jac = self.system.dt * ctrl_jac
+        else:
+            xpred = preds
         return xpred, state_jac, ctrl_jac
 
     # TODO fix this
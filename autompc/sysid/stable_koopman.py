@@ -2,38 +2,20 @@ __author__ = "Giorgos Mamakoukas"
 __copyright__ = "Copyright (C) 2004 Giorgos Mamakoukas"
 
 
-from pdb import set_trace
-
+import time
 import numpy as np
-from scipy.linalg import polar, pinv2, solve_discrete_lyapunov, sqrtm
+import scipy.linalg as sla
+from scipy.linalg import polar, solve_discrete_lyapunov, sqrtm
 import math
-from scipy import io
 
 
 def projectPSD(Q, epsilon = 0, delta = math.inf):
     Q = (Q+Q.T)/2
-    [e, V] = np.linalg.eig(Q)
-    # print(np.diag( np.minimum( delta, np.maximum(e, epsilon) ) ))
-    Q_PSD = V.dot(np.diag( np.minimum( delta, np.maximum(e, epsilon) ) )).dot(V.T)
+    # Q is symmetric, so its eigendecomposition is real and orthogonal
+    [e, V] = np.linalg.eigh(Q)
+    Q_PSD = (V * np.minimum( delta, np.maximum(e, epsilon) )).dot(V.T)
     return Q_PSD
 
-def gradients(Xs, Xu, Y, S, U, B, Bcon):
-    Sinv = np.linalg.inv(S)
-    R = Sinv.dot(U).dot(B).dot(S)
-    # R = np.linalg.multi_dot([Sinv, U, B, S, X])
-    Error = Y - Bcon.dot(Xu)- R.dot(Xs)
-    e = np.linalg.norm(Error, 'fro')
-
-    if len(locals()) >= 2:
-        temp1 = Sinv.T .dot(-Error).dot(Xs.T)
-        S_grad = -temp1.dot(R.T) + B.T.dot(U.T).dot(temp1)
-        U_grad = temp1.dot(S.T).dot(B.T)
-        B_grad = - U.T.dot(-temp1).dot(S.T)
-        Bcon_grad = - Error.dot(Xu.T)
-        return e, S_grad, U_grad, B_grad, Bcon_grad
-    else:
-        return e
-
 def checkdstable(A):
     n = len(A)
     P = solve_discrete_lyapunov(A.T, np.identity(n))
@@ -44,124 +26,282 @@ def checkdstable(A):
     B = projectPSD(B,0,1)
     return P,S,U,B
 
-def stabilize_discrete(Xs, Xu, Y, S = None, U = None, B = None, Bcon = None):
-    n = len(Xs) # number of Koopman basis functions
-#     na2 = np.linalg.norm(Y, 'fro')**2
-    na2 = np.linalg.norm(Y, 'fro')
-    X = np.vstack((Xs, Xu))
-    Nx = np.ma.size(Xs,0) # number of rows
-    Nu = np.ma.size(Xu,0)
-
-    print(S)
-    if S is None:
-        # Initialization of S, U, and B
-        S = np.identity(n)
-        temp = Y.dot(pinv2(X))
-        [U, B] = polar(temp[:Nx,:Nx])
-        B = projectPSD(B, 0, 1)
-        Bcon = temp[:Nx, Nx:]
-
-    # parameters
-    alpha0 = 0.5 # parameter of FGM
-    lsparam = 1.5 # parameter; has to be larger than 1 for convergence
-    lsitermax = 20
-    gradient = 0 # 1 for standard Gradient Descent; 0 for FGM
-    print(S)
-    if np.linalg.cond(S) > 1e12 :
-        print(" Initial S is ill-conditioned")
-
-    # initial step length: 1/L
-    eS,_ = np.linalg.eig(S)
-    L = (np.max(eS)/ np.min(eS))**2
-
-    # Initialization
-    error,_,_,_,_ = gradients(Xs,Xu,Y,S,U,B,Bcon)
-    print("Error is ", error)
-    step = 1/L
-    i = 1
-    alpha0 = 0.5
-    alpha = alpha0
-    Ys = S
-    Yu = U
-    Yb = B
-    Yb_con = Bcon
-    restarti = 1
-
-    max_iter = 30
-    while i < max_iter:
-        # compute gradient
-
-        _, gS, gU, gB, gB_con = gradients(Xs,Xu, Y,S,U,B, Bcon)
-        error_next = math.inf
-        inner_iter = 1
-        step = step * 2
-
-        # print("This is error", error, " at iteration: ", i)
-#         print("error: ", error)
-        # Line Search
-        while ( (error_next > error) and (  ((i == 1) and (inner_iter <= 100)) or (inner_iter <= lsitermax) ) ):
-            Sn = Ys - gS*step
-            Un = Yu - gU*step
-            Bn = Yb - gB*step
-            Bn_con = Yb_con - gB_con * step
-
-            # Project onto feasible set
-            Sn = projectPSD(Sn, 1e-15)
-            Un,_ = polar(Un)
-            Bn = projectPSD(Bn, 0, 1)
-            # print("Projected")
-            # print(Sn)
-            error_next,_,_,_,_ = gradients(Xs,Xu, Y, Sn, Un, Bn, Bn_con)
-            step = step / lsparam
-            inner_iter = inner_iter + 1
-            # print(inner_iter)
-        if (i == 1):
-            inner_iter0 = inner_iter
-
-        # Conjugate with FGM weights, if cost decreased; else, restart FGM
-        alpha_next = (math.sqrt(alpha**4 + 4*alpha**2) - alpha**2 )/2
-        beta = alpha * (1 - alpha) / (alpha**2 + alpha_next)
-
-        if (inner_iter >= lsitermax + 1): # line search failed
-            if restarti == 1:
-            # Restart FGM if not a descent direction
-                restarti = 0
-                alpha_next = alpha0
-                Ys = S
-                Yu = U
-                Yb = B
-                Yb_con = Bcon
-                error_next = error
-                print(" No descent: Restart FGM")
-
-                # Reinitialize step length
-                eS,_ = np.linalg.eig(S)
-                L = (np.max(eS)/ np.min(eS))**2
-                # Use information from the first step: how many steps to decrease
-                step = 1/L/lsparam**inner_iter0
-            elif (restarti == 0): # no previous restart/descent direction
-                error_next = error
+def _solve_left(S, M):
+    # Returns S^{-1} M for the symmetric positive definite S, falling back
+    # to least squares when S is numerically singular.
+    try:
+        return sla.cho_solve(sla.cho_factor(S), M)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(S, M, rcond=None)[0]
+
+class StableKoopmanSolver:
+    """
+    Fast gradient method for fitting a stable discrete-time Koopman
+    operator :math:`A = S^{-1} U B S`, with S positive definite, U
+    orthogonal and B positive semidefinite with eigenvalues at most 1, and
+    an unconstrained control matrix.
+
+    The data only enter the objective and its gradient through the Gram
+    matrices of the regressors, which are computed once, so each iteration
+    costs O(n^3) independently of the number of samples.  The solver stops
+    after max_iter iterations, once the relative change of the objective
+    falls below tol, or when max_time is exceeded.  Progress is recorded
+    in history after each iteration.
+    """
+    def __init__(self, max_iter=30, tol=1e-6, max_time=None, callback=None,
+            verbose=False):
+        """
+        Parameters
+        ----------
+        max_iter : int
+            Maximum number of iterations. Default is 30.
+
+        tol : float
+            Stop when the relative change of the objective in one iteration
+            is below tol. Set to 0 to disable. Default is 1e-6.
+
+        max_time : float
+            Wall-clock budget in seconds. If None, unlimited.
+
+        callback : Function dict -> None
+            Called with the progress entry after each iteration.
+
+        verbose : bool
+            Print progress messages.
+        """
+        self.max_iter = max_iter
+        self.tol = tol
+        self.max_time = max_time
+        self.callback = callback
+        self.verbose = verbose
+        self.history = []
+        self.stop_reason = None
+
+    def _objective(self, S, U, B, Bcon):
+        # Returns the fit error and the quantities needed for its gradient.
+        # A numerically singular S gives an infinite error, which the line
+        # search rejects.
+        with np.errstate(all="ignore"):
+            SinvU = _solve_left(S, U)
+            R = SinvU.dot(B).dot(S)
+            K = np.hstack([R, Bcon])
+            KG = K.dot(self._G)
+            e2 = self._yy - 2 * np.sum(K * self._C) + np.sum(KG * K)
+        if not np.isfinite(e2):
+            return math.inf, None
+        return math.sqrt(max(e2, 0.0)), (S, U, B, R, self._C - KG)
+
+    def _gradients(self, cache):
+        S, U, B, R, M = cache
+        Nx = S.shape[0]
+        # M = Error X^T, so the gradients need not touch the data
+        temp1 = -_solve_left(S, M[:, :Nx])
+        S_grad = -temp1.dot(R.T) + B.T.dot(U.T).dot(temp1)
+        U_grad = temp1.dot(S.T).dot(B.T)
+        B_grad = U.T.dot(temp1).dot(S.T)
+        Bcon_grad = -M[:, Nx:]
+        return S_grad, U_grad, B_grad, Bcon_grad
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    def _warm_start(self, A, Bcon, Nx, Nu):
+        if A.shape != (Nx, Nx) or Bcon.shape != (Nx, Nu):
+            self._log(" Warm start has mismatched shape, ignoring")
+            return None
+        try:
+            _, S, U, B = checkdstable(A)
+        except (np.linalg.LinAlgError, ValueError):
+            self._log(" Warm start is not stable, ignoring")
+            return None
+        if not np.all(np.isfinite(S)):
+            return None
+        return np.real(S), np.real(U), np.real(B), np.copy(Bcon)
+
+    def solve(self, Xs, Xu, Y, S=None, U=None, B=None, Bcon=None,
+            warm_start=None):
+        """
+        Fit the stable Koopman operator.
+
+        Parameters
+        ----------
+        Xs : numpy array of shape (n, N)
+            Lifted states
+
+        Xu : numpy array of shape (m, N)
+            Controls
+
+        Y : numpy array of shape (n, N)
+            Lifted successor states
+
+        S, U, B, Bcon : numpy arrays
+            Initial factorization. Used if all are given.
+
+        warm_start : tuple (A, Bcon)
+            Previous solution to start from, e.g. from an earlier fit on
+            similar data. Ignored if S is given, or if A is not stable or
+            has a different shape.
+
+        Returns
+        -------
+        Kd, S, U, B, Bcon, error
+            Stable operator, its factorization, the control matrix and
+            the final fit error.
+        """
+        start = time.perf_counter()
+        self.history = []
+        self.stop_reason = None
+        X = np.vstack((Xs, Xu))
+        Nx = np.ma.size(Xs,0) # number of rows
+        Nu = np.ma.size(Xu,0)
+        self._G = X.dot(X.T)
+        self._C = Y.dot(X.T)
+        self._yy = np.sum(Y * Y)
+        na2 = math.sqrt(self._yy)
+
+        if S is None and warm_start is not None:
+            init = self._warm_start(np.asarray(warm_start[0]),
+                    np.asarray(warm_start[1]), Nx, Nu)
+            if init is not None:
+                S, U, B, Bcon = init
+        if S is None:
+            # Initialization of S, U, and B from the least squares solution
+            S = np.identity(Nx)
+            temp = sla.lstsq(self._G, self._C.T)[0].T
+            [U, B] = polar(temp[:Nx,:Nx])
+            B = projectPSD(B, 0, 1)
+            Bcon = temp[:Nx, Nx:]
+
+        # parameters
+        alpha0 = 0.5 # parameter of FGM
+        lsparam = 1.5 # parameter; has to be larger than 1 for convergence
+        lsitermax = 20
+        gradient = 0 # 1 for standard Gradient Descent; 0 for FGM
+        if np.linalg.cond(S) > 1e12 :
+            self._log(" Initial S is ill-conditioned")
+
+        # initial step length: 1/L
+        eS = np.linalg.eigvalsh((S + S.T)/2)
+        L = (np.max(eS)/ np.min(eS))**2
+
+        # Initialization
+        error, cache = self._objective(S, U, B, Bcon)
+        self._log("Error is {}".format(error))
+        step = 1/L
+        i = 1
+        alpha = alpha0
+        Ys = S
+        Yu = U
+        Yb = B
+        Yb_con = Bcon
+        restarti = 1
+
+        while i < self.max_iter:
+            # compute gradient, reusing the evaluation of the current iterate
+            gS, gU, gB, gB_con = self._gradients(cache)
+            error_next = math.inf
+            inner_iter = 1
+            step = step * 2
+
+            # Line Search
+            while ( (error_next > error) and (  ((i == 1) and (inner_iter <= 100)) or (inner_iter <= lsitermax) ) ):
+                Sn = Ys - gS*step
+                Un = Yu - gU*step
+                Bn = Yb - gB*step
+                Bn_con = Yb_con - gB_con * step
+
+                # Project onto feasible set
+                Sn = projectPSD(Sn, 1e-15)
+                Un,_ = polar(Un)
+                Bn = projectPSD(Bn, 0, 1)
+                error_next, cache_next = self._objective(Sn, Un, Bn, Bn_con)
+                step = step / lsparam
+                inner_iter = inner_iter + 1
+            if (i == 1):
+                inner_iter0 = inner_iter
+
+            # Conjugate with FGM weights, if cost decreased; else, restart FGM
+            alpha_next = (math.sqrt(alpha**4 + 4*alpha**2) - alpha**2 )/2
+            beta = alpha * (1 - alpha) / (alpha**2 + alpha_next)
+
+            stop = False
+            if (inner_iter >= lsitermax + 1): # line search failed
+                if restarti == 1:
+                # Restart FGM if not a descent direction
+                    restarti = 0
+                    alpha_next = alpha0
+                    Ys = S
+                    Yu = U
+                    Yb = B
+                    Yb_con = Bcon
+                    error_next = error
+                    self._log(" No descent: Restart FGM")
+
+                    # Reinitialize step length
+                    eS = np.linalg.eigvalsh((S + S.T)/2)
+                    L = (np.max(eS)/ np.min(eS))**2
+                    # Use information from the first step: how many steps to decrease
+                    step = 1/L/lsparam**inner_iter0
+                elif (restarti == 0): # no previous restart/descent direction
+                    error_next = error
+                    self.stop_reason = "no_descent"
+                    stop = True
+            else:
+                restarti = 1
+                if (gradient == 1):
+                    beta = 0
+                Ys = Sn + beta * (Sn - S)
+                Yu = Un + beta * (Un - U)
+                Yb = Bn + beta * (Bn - B)
+                Yb_con = Bn_con + beta * (Bn_con - Bcon)
+                # Keep new iterates in memory
+                S = Sn
+                U = Un
+                B = Bn
+                Bcon = Bn_con
+                cache = cache_next
+            rel_change = abs(error - error_next) / max(error, 1e-300)
+            i = i + 1
+            error = error_next
+            alpha = alpha_next
+
+            entry = {"iteration" : i - 1,
+                     "error" : error,
+                     "rel_change" : rel_change,
+                     "step" : step,
+                     "line_search_iters" : inner_iter - 1,
+                     "time" : time.perf_counter() - start}
+            self.history.append(entry)
+            if self.callback is not None:
+                self.callback(entry)
+            if stop:
                 break
-        else:
-            restarti = 1
-            if (gradient == 1):
-                beta = 0
-            Ys = Sn + beta * (Sn - S)
-            Yu = Un + beta * (Un - U)
-            Yb = Bn + beta * (Bn - B)
-            Yb_con = Bn_con + beta * (Bn_con - Bcon)
-            # Keep new iterates in memory
-            S = Sn
-            U = Un
-            B = Bn
-            Bcon = Bn_con
-        i = i + 1
-        error = error_next
-        alpha = alpha_next
-
-        # Check if error is small (1e-6 relative error)
-        if (error < 1e-12*na2):
-            print("The algorithm converged")
-            break
-    Kd = np.linalg.inv(S).dot(U).dot(B).dot(S)
-    return Kd, S, U, B, Bcon, error
+
+            # Check if error is small (1e-6 relative error)
+            if (error < 1e-12*na2):
+                self._log("The algorithm converged")
+                self.stop_reason = "converged"
+                break
+            if restarti == 1 and rel_change < self.tol:
+                self.stop_reason = "tol"
+                break
+            if self.max_time is not None and entry["time"] > self.max_time:
+                self.stop_reason = "max_time"
+                break
+        if self.stop_reason is None:
+            self.stop_reason = "max_iter"
+        Kd = _solve_left(S, U).dot(B).dot(S)
+        return Kd, S, U, B, Bcon, error
+
+def stabilize_discrete(Xs, Xu, Y, S = None, U = None, B = None, Bcon = None,
+        max_iter=30, tol=1e-6, max_time=None, warm_start=None, callback=None,
+        verbose=False):
+    """
+    Fit a stable discrete-time Koopman operator.  See StableKoopmanSolver
+    for the parameters.
+    """
+    solver = StableKoopmanSolver(max_iter=max_iter, tol=tol,
+            max_time=max_time, callback=callback, verbose=verbose)
+    return solver.solve(Xs, Xu, Y, S=S, U=U, B=B, Bcon=Bcon,
+            warm_start=warm_start)
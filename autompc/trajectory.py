@@ -103,6 +103,7 @@ class Trajectory:
 
         self._obs = obs
         self._ctrls = ctrls
+        self._timing = None
 
     def __eq__(self, other):
         return (self._system == other.system
@@ -199,3 +200,146 @@ class Trajectory:
         if ctrls.shape != (self._size, self._system.ctrl_dim):
             raise ValueError("ctrls is wrong shape")
         self._ctrls = ctrls[:]
+
+    @property
+    def timing(self):
+        """
+        StepTimer holding per-step timings of the control loop which
+        produced this trajectory, or None if it was not timed.
+        """
+        # Trajectories pickled before timings were recorded lack _timing
+        return getattr(self, "_timing", None)
+
+    @timing.setter
+    def timing(self, timing):
+        self._timing = timing
+
+class TrajectoryBuilder:
+    """
+    The TrajectoryBuilder incrementally constructs a trajectory one or
+    more time steps at a time.  Observations and controls are stored in
+    preallocated buffers whose capacity doubles whenever they fill up,
+    so appending is amortized O(1), unlike repeated calls to `extend`.
+    """
+    def __init__(self, system, capacity=16):
+        """
+        Parameters
+        ----------
+        system : System
+            System for trajectory
+
+        capacity : int
+            Initial number of time steps to allocate. Default is 16.
+        """
+        self._system = system
+        self._size = 0
+        capacity = max(int(capacity), 1)
+        self._obs = np.zeros((capacity, system.obs_dim))
+        self._ctrls = np.zeros((capacity, system.ctrl_dim))
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size):
+        capacity = self._obs.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        obs = np.zeros((capacity, self._system.obs_dim))
+        ctrls = np.zeros((capacity, self._system.ctrl_dim))
+        obs[:self._size] = self._obs[:self._size]
+        ctrls[:self._size] = self._ctrls[:self._size]
+        self._obs, self._ctrls = obs, ctrls
+
+    def append(self, obs, ctrl=None):
+        """
+        Append a single time step.
+
+        Parameters
+        ----------
+        obs : numpy array of size system.obs_dim
+            New observation
+
+        ctrl : numpy array of size system.ctrl_dim
+            New control. If None, the control is left as zeros
+            and can be filled in later through `ctrls`.
+        """
+        self._reserve(self._size + 1)
+        self._obs[self._size] = obs
+        if ctrl is not None:
+            self._ctrls[self._size] = ctrl
+        self._size += 1
+
+    def extend(self, obs, ctrls):
+        """
+        Append several time steps.
+
+        Parameters
+        ----------
+        obs : numpy array of shape (N, system.obs_dim)
+            New observations
+
+        ctrls : numpy array of shape (N, system.ctrl_dim)
+            New controls
+        """
+        obs = np.asarray(obs)
+        n = obs.shape[0]
+        self._reserve(self._size + n)
+        self._obs[self._size:self._size+n] = obs
+        self._ctrls[self._size:self._size+n] = ctrls
+        self._size += n
+
+    @property
+    def system(self):
+        """
+        Get trajectory System object.
+        """
+        return self._system
+
+    @property
+    def size(self):
+        """
+        Number of time steps appended so far.
+        """
+        return self._size
+
+    @property
+    def capacity(self):
+        """
+        Number of time steps which can be stored before
+        the buffers are reallocated.
+        """
+        return self._obs.shape[0]
+
+    @property
+    def obs(self):
+        """
+        View of the observations appended so far, as a numpy
+        array of shape (size, system.obs_dim).
+        """
+        return self._obs[:self._size]
+
+    @property
+    def ctrls(self):
+        """
+        View of the controls appended so far, as a numpy
+        array of shape (size, system.ctrl_dim).
+        """
+        return self._ctrls[:self._size]
+
+    def view(self):
+        """
+        Returns a Trajectory which shares memory with the builder.
+        Modifying the view modifies the builder's buffers, until the
+        next append causes them to be reallocated.
+        """
+        return Trajectory(self._system, self._size, self.obs, self.ctrls)
+
+    def to_trajectory(self):
+        """
+        Returns a Trajectory holding a compact copy of the time
+        steps appended so far.
+        """
+        return Trajectory(self._system, self._size, self.obs.copy(),
+                self.ctrls.copy())
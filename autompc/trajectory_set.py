@@ -0,0 +1,260 @@
+# Standard library includes
+from collections.abc import Sequence
+
+# Internal library includes
+from .trajectory import Trajectory
+
+# External library includes
+import numpy as np
+
+def to_trajectory_set(trajs, system=None):
+    """
+    Convert a list of trajectories into a TrajectorySet.  If trajs is
+    already a TrajectorySet, it is returned unchanged so that its cached
+    transition matrices are reused.  A TrajectoryStore is loaded into
+    memory once and the loaded set is kept by the store.
+
+    Parameters
+    ----------
+    trajs : List of Trajectory, TrajectorySet, or TrajectoryStore
+        Trajectories to convert
+
+    system : System
+        System for the trajectories. Only needed when trajs is empty.
+    """
+    from .trajectory_store import TrajectoryStore
+    if isinstance(trajs, TrajectorySet):
+        return trajs
+    if isinstance(trajs, TrajectoryStore):
+        return trajs.to_trajectory_set()
+    return TrajectorySet.from_trajs(trajs, system=system)
+
+class TrajectorySet(Sequence):
+    """
+    The TrajectorySet stores a collection of trajectories in columnar
+    form: the observations of all trajectories are concatenated into one
+    contiguous array, as are the controls, and an offsets array marks
+    where each trajectory begins.  Indexing with an integer returns a
+    Trajectory which is a view into the shared arrays, so a TrajectorySet
+    can be used wherever a list of Trajectory is expected.
+
+    Transition matrices and k-step windows are computed on first access
+    and cached, so repeated model training on the same set only pays for
+    their construction once.
+    """
+    def __init__(self, system, obs, ctrls, offsets):
+        """
+        Parameters
+        ----------
+        system : System
+            The corresponding robot system
+
+        obs : numpy array of shape (total_size, system.obs_dim)
+            Concatenated observations of all trajectories
+
+        ctrls : numpy array of shape (total_size, system.ctrl_dim)
+            Concatenated controls of all trajectories
+
+        offsets : numpy array of ints of shape (num_trajs+1,)
+            Trajectory i occupies rows offsets[i]:offsets[i+1].
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if offsets.ndim != 1 or offsets.size < 1 or offsets[0] != 0:
+            raise ValueError("offsets must be a 1-D array starting at 0")
+        if np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must be non-decreasing")
+        total = offsets[-1]
+        if obs.shape != (total, system.obs_dim):
+            raise ValueError("obs is wrong shape")
+        if ctrls.shape != (total, system.ctrl_dim):
+            raise ValueError("ctrls is wrong shape")
+
+        self._system = system
+        self._obs = obs
+        self._ctrls = ctrls
+        self._offsets = offsets
+        self._cache = dict()
+
+    @classmethod
+    def from_trajs(cls, trajs, system=None):
+        """
+        Build a TrajectorySet by copying a list of trajectories.
+
+        Parameters
+        ----------
+        trajs : List of Trajectory
+            Trajectories to copy
+
+        system : System
+            System for the trajectories. Only needed when trajs is empty.
+        """
+        trajs = list(trajs)
+        if system is None:
+            if not trajs:
+                raise ValueError("system must be given for an empty trajectory list")
+            system = trajs[0].system
+        lengths = np.array([len(traj) for traj in trajs], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        obs = np.empty((offsets[-1], system.obs_dim))
+        ctrls = np.empty((offsets[-1], system.ctrl_dim))
+        for traj, start, end in zip(trajs, offsets[:-1], offsets[1:]):
+            obs[start:end] = traj.obs
+            ctrls[start:end] = traj.ctrls
+        return cls(system, obs, ctrls, offsets)
+
+    def __len__(self):
+        return self._offsets.size - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.subset(range(len(self))[idx])
+        if isinstance(idx, (list, np.ndarray)):
+            return self.subset(idx)
+        if idx < -len(self) or idx >= len(self):
+            raise IndexError("Trajectory index out of range.")
+        if idx < 0:
+            idx += len(self)
+        start, end = self._offsets[idx], self._offsets[idx+1]
+        return Trajectory(self._system, end - start, self._obs[start:end],
+                self._ctrls[start:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return "TrajectorySet, num_trajs={}, size={}, system={}".format(
+                len(self), self.size, self._system)
+
+    @property
+    def system(self):
+        """
+        Get trajectory System object.
+        """
+        return self._system
+
+    @property
+    def size(self):
+        """
+        Total number of time steps across all trajectories.
+        """
+        return int(self._offsets[-1])
+
+    @property
+    def obs(self):
+        """
+        Concatenated observations of all trajectories, as a numpy
+        array of shape (size, system.obs_dim).
+        """
+        return self._obs
+
+    @property
+    def ctrls(self):
+        """
+        Concatenated controls of all trajectories, as a numpy
+        array of shape (size, system.ctrl_dim).
+        """
+        return self._ctrls
+
+    @property
+    def offsets(self):
+        """
+        Start index of each trajectory, followed by the total size.
+        """
+        return self._offsets
+
+    @property
+    def lengths(self):
+        """
+        Length of each trajectory.
+        """
+        return np.diff(self._offsets)
+
+    def subset(self, indices):
+        """
+        Returns a new TrajectorySet containing copies of the
+        selected trajectories.
+
+        Parameters
+        ----------
+        indices : List of int
+            Indices of trajectories to select, in order.
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        lengths = self.lengths[indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        rows = np.concatenate([np.arange(self._offsets[i], self._offsets[i+1])
+            for i in indices] + [np.zeros(0, dtype=np.int64)])
+        return TrajectorySet(self._system, self._obs[rows], self._ctrls[rows],
+                offsets)
+
+    def get_window_starts(self, k=1):
+        """
+        Returns the indices (into obs/ctrls) of all time steps t for which
+        t+k lies in the same trajectory.  The result is cached.
+
+        Parameters
+        ----------
+        k : int
+            Window length. Default is 1.
+        """
+        key = ("starts", k)
+        if key not in self._cache:
+            traj_ids = np.repeat(np.arange(len(self)), self.lengths)
+            idxs = np.arange(self.size)
+            valid = idxs + k < self._offsets[traj_ids + 1]
+            self._cache[key] = idxs[valid]
+        return self._cache[key]
+
+    def get_transitions(self):
+        """
+        Returns the one-step transitions of all trajectories.  The
+        result is cached, so callers must not modify the returned arrays.
+
+        Returns
+        -------
+        states : numpy array of shape (N, system.obs_dim)
+            Observation at time t
+
+        ctrls : numpy array of shape (N, system.ctrl_dim)
+            Control at time t
+
+        next_states : numpy array of shape (N, system.obs_dim)
+            Observation at time t+1
+
+        deltas : numpy array of shape (N, system.obs_dim)
+            next_states - states
+        """
+        if "transitions" not in self._cache:
+            starts = self.get_window_starts(1)
+            states = self._obs[starts]
+            ctrls = self._ctrls[starts]
+            next_states = self._obs[starts + 1]
+            deltas = next_states - states
+            self._cache["transitions"] = (states, ctrls, next_states, deltas)
+        return self._cache["transitions"]
+
+    def get_windows(self, k):
+        """
+        Returns all k-step windows of the trajectories.  The result
+        is cached, so callers must not modify the returned arrays.
+
+        Parameters
+        ----------
+        k : int
+            Number of steps in each window
+
+        Returns
+        -------
+        obs_windows : numpy array of shape (N, k+1, system.obs_dim)
+            Observations at times t, ..., t+k
+
+        ctrl_windows : numpy array of shape (N, k, system.ctrl_dim)
+            Controls at times t, ..., t+k-1
+        """
+        key = ("windows", k)
+        if key not in self._cache:
+            starts = self.get_window_starts(k)
+            obs_idxs = starts[:, np.newaxis] + np.arange(k+1)
+            self._cache[key] = (self._obs[obs_idxs], self._ctrls[obs_idxs[:, :-1]])
+        return self._cache[key]
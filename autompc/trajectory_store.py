@@ -0,0 +1,236 @@
+# Standard library includes
+import os
+import json
+from collections.abc import Sequence
+
+# Internal library includes
+from .system import System
+from .trajectory_set import TrajectorySet, to_trajectory_set
+
+# External library includes
+import numpy as np
+
+_INDEX_NAME = "index.json"
+
+class TrajectoryStore(Sequence):
+    """
+    The TrajectoryStore keeps a trajectory data set on disk so that it can
+    be larger than memory.  The store is a directory holding a small
+    index file and a sequence of chunks. Each chunk is a set of .npy files
+    (observations, controls and trajectory offsets) which are opened with
+    memory mapping, so indexing the store returns Trajectory views that
+    are only paged in from disk when accessed.
+
+    Appending trajectories writes a new chunk and updates the index; existing
+    chunks are never rewritten.  Pickling a store only pickles its path and
+    selected indices, so it can be cheaply sent to worker processes.
+
+    to_trajectory_set loads the selection once and keeps it, so a store or
+    subset that is trained on repeatedly, such as the training set of a
+    HoldoutModelEvaluator, is only read from disk once per process and
+    reuses the cached transition matrices of the TrajectorySet.
+    """
+    def __init__(self, path, system=None):
+        """
+        Parameters
+        ----------
+        path : string
+            Directory of the store.  Created if it does not exist.
+
+        system : System
+            System for the trajectories. Required when creating
+            a new store, otherwise read from the index.
+        """
+        self._path = path
+        index_path = os.path.join(path, _INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            stored_system = System(index["observations"], index["controls"],
+                    index["dt"])
+            if system is not None and system != stored_system:
+                raise ValueError("system does not match stored system")
+            self._system = stored_system
+            self._chunk_names = index["chunks"]
+            self._chunk_sizes = index["chunk_sizes"]
+        else:
+            if system is None:
+                raise ValueError("system must be given to create a new store")
+            os.makedirs(path, exist_ok=True)
+            self._system = system
+            self._chunk_names = []
+            self._chunk_sizes = []
+            self._write_index()
+        self._indices = None
+        self._chunks = dict()
+        self._trajset = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_chunks"] = dict()
+        state["_trajset"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_trajset", None)
+        self.__dict__.update(state)
+
+    def _write_index(self):
+        index = {"observations" : self._system.observations,
+                 "controls" : self._system.controls,
+                 "dt" : self._system.dt,
+                 "chunks" : self._chunk_names,
+                 "chunk_sizes" : self._chunk_sizes}
+        index_path = os.path.join(self._path, _INDEX_NAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    def _get_chunk(self, chunk_idx):
+        if chunk_idx not in self._chunks:
+            name = self._chunk_names[chunk_idx]
+            load = lambda suffix: np.load(os.path.join(self._path,
+                "{}_{}.npy".format(name, suffix)), mmap_mode="r")
+            self._chunks[chunk_idx] = TrajectorySet(self._system, load("obs"),
+                    load("ctrls"), np.array(load("offsets")))
+        return self._chunks[chunk_idx]
+
+    def _locate(self, idx):
+        chunk_starts = np.cumsum([0] + self._chunk_sizes)
+        chunk_idx = int(np.searchsorted(chunk_starts, idx, side="right")) - 1
+        return chunk_idx, idx - chunk_starts[chunk_idx]
+
+    def append(self, trajs):
+        """
+        Append trajectories to the store as a new chunk.
+
+        Parameters
+        ----------
+        trajs : List of Trajectory or TrajectorySet
+            Trajectories to append
+        """
+        if self._indices is not None:
+            raise ValueError("Cannot append to a subset of a store")
+        trajset = to_trajectory_set(trajs, self._system)
+        if len(trajset) == 0:
+            return
+        name = "chunk_{:05d}".format(len(self._chunk_names))
+        for suffix, arr in [("obs", trajset.obs), ("ctrls", trajset.ctrls),
+                ("offsets", trajset.offsets)]:
+            np.save(os.path.join(self._path, "{}_{}.npy".format(name, suffix)),
+                    np.ascontiguousarray(arr))
+        self._chunk_names.append(name)
+        self._chunk_sizes.append(len(trajset))
+        self._trajset = None
+        self._write_index()
+
+    def __len__(self):
+        if self._indices is not None:
+            return len(self._indices)
+        return sum(self._chunk_sizes)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.subset(range(len(self))[idx])
+        if isinstance(idx, (list, np.ndarray)):
+            return self.subset(idx)
+        if idx < -len(self) or idx >= len(self):
+            raise IndexError("Trajectory index out of range.")
+        if idx < 0:
+            idx += len(self)
+        if self._indices is not None:
+            idx = self._indices[idx]
+        chunk_idx, local_idx = self._locate(idx)
+        return self._get_chunk(chunk_idx)[int(local_idx)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return "TrajectoryStore, path={}, num_trajs={}, system={}".format(
+                self._path, len(self), self._system)
+
+    @property
+    def system(self):
+        """
+        Get trajectory System object.
+        """
+        return self._system
+
+    @property
+    def path(self):
+        """
+        Directory of the store.
+        """
+        return self._path
+
+    def subset(self, indices):
+        """
+        Returns a store which only contains the selected trajectories.
+        No data is copied; the subset reads from the same chunks.
+
+        Parameters
+        ----------
+        indices : List of int
+            Indices of trajectories to select, in order.
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if self._indices is not None:
+            indices = self._indices[indices]
+        subset = TrajectoryStore.__new__(TrajectoryStore)
+        subset.__dict__.update(self.__dict__)
+        subset._chunk_names = list(self._chunk_names)
+        subset._chunk_sizes = list(self._chunk_sizes)
+        subset._chunks = dict(self._chunks)
+        subset._indices = indices
+        subset._trajset = None
+        return subset
+
+    def iter_chunks(self):
+        """
+        Iterate over the store one chunk at a time.  Each chunk is
+        returned as a TrajectorySet backed by memory-mapped arrays,
+        restricted to the selected trajectories for subsets.
+        """
+        chunk_starts = np.cumsum([0] + self._chunk_sizes)
+        for chunk_idx in range(len(self._chunk_names)):
+            chunk = self._get_chunk(chunk_idx)
+            if self._indices is None:
+                yield chunk
+                continue
+            start, end = chunk_starts[chunk_idx], chunk_starts[chunk_idx+1]
+            local = self._indices[(self._indices >= start)
+                    & (self._indices < end)] - start
+            if local.size > 0:
+                yield chunk.subset(local)
+
+    def to_trajectory_set(self):
+        """
+        Load the selected trajectories into memory as a TrajectorySet.
+        The result is cached, so repeated calls return the same set.
+        """
+        if self._trajset is None:
+            self._trajset = self._load()
+        return self._trajset
+
+    def _load(self):
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return TrajectorySet.from_trajs([], system=self._system)
+        obs = np.concatenate([chunk.obs for chunk in chunks])
+        ctrls = np.concatenate([chunk.ctrls for chunk in chunks])
+        offsets = np.concatenate([[0]] + [chunk.offsets[1:] + start for chunk, start
+            in zip(chunks, np.cumsum([0] + [chunk.size for chunk in chunks[:-1]]))])
+        trajset = TrajectorySet(self._system, obs, ctrls, offsets)
+        if self._indices is None:
+            return trajset
+        # iter_chunks yields the selection grouped by chunk in store
+        # order, so restore the order of the selected indices
+        chunk_starts = np.cumsum([0] + self._chunk_sizes)
+        chunk_ids = np.searchsorted(chunk_starts, self._indices, side="right")
+        order = np.argsort(chunk_ids, kind="stable")
+        if np.array_equal(order, np.arange(order.size)):
+            return trajset
+        return trajset.subset(np.argsort(order, kind="stable"))
@@ -5,7 +5,9 @@ import pickle
 
 # Internal project includes
 from .. import zeros
-from ..utils import simulate
+from ..trajectory_set import TrajectorySet, to_trajectory_set
+from ..trajectory_store import TrajectoryStore
+from ..utils import simulate, EpisodeRunner
 from ..evaluation import HoldoutModelEvaluator
 from .model_tuner import ModelTuner
 from ..sysid import MLPFactory, SINDyFactory, ApproximateGPModelFactory, ARXFactory, KoopmanFactory
@@ -18,7 +20,8 @@ from smac.facade.smac_hpo_facade import SMAC4HPO
 
 PipelineTuneResult = namedtuple("PipelineTuneResult", ["inc_cfg", "cfgs", 
     "inc_cfgs", "costs", "inc_costs", "truedyn_costs", "inc_truedyn_costs", 
-    "surr_trajs", "truedyn_trajs", "surr_tune_result"])
+    "surr_trajs", "truedyn_trajs", "surr_tune_result", "surr_timings",
+    "truedyn_timings"], defaults=(None, None))
 """
 PipelineTuneREsult contains information about a tuning process.
 
@@ -70,6 +73,19 @@ PipelineTuneREsult contains information about a tuning process.
     The ModelTuneResult from tuning the surrogate model, for modes "autotune"
     and "autoselect".  None for other tuning modes.
 
+.. py:attribute:: surr_timings
+
+    Per-step timing summary (see StepTimer.summary) of the surrogate
+    simulation at each tuning iteration.  Deadline misses are counted
+    against the system time step.  None for results pickled before
+    timings were recorded.
+
+.. py:attribute:: truedyn_timings
+
+    Per-step timing summary of the true dynamics simulation at each
+    tuning iteration. Empty if true dynamics are not provided, and None
+    for results pickled before timings were recorded.
+
 """
 
 autoselect_factories = [MLPFactory, SINDyFactory, ApproximateGPModelFactory,
@@ -148,8 +164,49 @@ class PipelineTuner:
             surrogate, surrogate_tune_result = model_tuner.run(rng, n_iters=surrogate_tune_iters) 
         return surrogate, surrogate_tune_result
 
+    def _simulate_episodes(self, task, controller, surrogate, truedyn_controller,
+            truedyn, n_workers, seed):
+        # Submit the surrogate and true dynamics episodes together, so
+        # they are simulated at the same time in worker processes
+        init_obs = np.array([task.get_init_obs()])
+        runners = [EpisodeRunner(controller, task, sim_model=surrogate,
+            n_workers=n_workers, return_trajs=True, timing=True)]
+        if truedyn is not None:
+            runners.append(EpisodeRunner(truedyn_controller, task,
+                dynamics=truedyn, n_workers=n_workers, return_trajs=True,
+                timing=True))
+        try:
+            batches = [runner.run_async(init_obs, seed) for runner in runners]
+            info = dict()
+            try:
+                surr_result = batches[0].get()[0]
+                surr_cost = surr_result.cost
+                print("Surrogate Cost: ", surr_cost)
+                print("Surrogate Final State: ", surr_result.final_obs)
+                info["surr_cost"] = surr_cost
+                info["surr_traj"] = (surr_result.traj[0].tolist(),
+                        surr_result.traj[1].tolist())
+                info["surr_timing"] = surr_result.timing
+            except np.linalg.LinAlgError:
+                surr_cost = np.inf
+                info["surr_cost"] = surr_cost
+                info["surr_traj"] = None
+                info["surr_timing"] = None
+            if truedyn is not None:
+                truedyn_result = batches[1].get()[0]
+                print("True Dynamics Cost: ", truedyn_result.cost)
+                print("True Dynamics Final State: ", truedyn_result.final_obs)
+                info["truedyn_cost"] = truedyn_result.cost
+                info["truedyn_traj"] = (truedyn_result.traj[0].tolist(),
+                        truedyn_result.traj[1].tolist())
+                info["truedyn_timing"] = truedyn_result.timing
+        finally:
+            for runner in runners:
+                runner.close()
+        return surr_cost, info
+
     def run(self, pipeline, task, trajs, n_iters, rng, surrogate=None, truedyn=None, 
-            surrogate_tune_iters=100, special_debug=False):
+            surrogate_tune_iters=100, special_debug=False, n_workers=None):
         """
         Run tuning.
 
@@ -161,7 +218,7 @@ class PipelineTuner:
         task : Task
             Task specification to tune for
 
-        trajs : List of Trajectory
+        trajs : List of Trajectory, TrajectorySet, or TrajectoryStore
             Trajectory training set.
 
         n_iters : int
@@ -182,6 +239,13 @@ class PipelineTuner:
             Number of iterations to use for surrogate tuning. Used for "autotune"
             and "autoselect" modes. Default is 100
 
+        n_workers : int
+            If given, the surrogate and true dynamics episodes of each
+            configuration are simulated at the same time by EpisodeRunners
+            with this many worker processes. Episodes are then seeded as
+            described in EpisodeRunner. If None (default), the episodes are
+            simulated one after another in the calling process.
+
         Returns
         -------
         controller : Controller
@@ -193,10 +257,16 @@ class PipelineTuner:
         # Run surrogate training
         if surrogate is None:
             surr_size = int(self.surrogate_split * len(trajs))
-            shuffled_trajs = trajs[:]
-            rng.shuffle(shuffled_trajs)
-            surr_trajs = shuffled_trajs[:surr_size]
-            sysid_trajs = shuffled_trajs[surr_size:]
+            if isinstance(trajs, (TrajectorySet, TrajectoryStore)):
+                shuffled_idxs = list(range(len(trajs)))
+                rng.shuffle(shuffled_idxs)
+                surr_trajs = trajs.subset(shuffled_idxs[:surr_size])
+                sysid_trajs = trajs.subset(shuffled_idxs[surr_size:])
+            else:
+                shuffled_trajs = trajs[:]
+                rng.shuffle(shuffled_trajs)
+                surr_trajs = shuffled_trajs[:surr_size]
+                sysid_trajs = shuffled_trajs[surr_size:]
 
             print("Surr Traj Last: ", surr_trajs[-1][-1].obs)
             print("Sysid Traj Last: ", sysid_trajs[-1][-1].obs)
@@ -205,6 +275,10 @@ class PipelineTuner:
         else:
             sysid_trajs = trajs
             surr_tune_result = None
+        # Every configuration trains on sysid_trajs, so convert it once
+        # to share the cached transition matrices across evaluations.
+        if not isinstance(sysid_trajs, TrajectoryStore):
+            sysid_trajs = to_trajectory_set(sysid_trajs, pipeline.system)
 
         if special_debug:
             with open("out/2021-09-26/surrogate.pkl", "wb") as f:
@@ -217,26 +291,36 @@ class PipelineTuner:
                 with open("../../out/2021-05-17/con_{}.pkl".format(eval_idx[0]), "wb") as f:
                     pickle.dump(controller, f)
                 eval_idx[0] += 1
+            if n_workers is not None:
+                truedyn_controller = None
+                if truedyn is not None:
+                    truedyn_controller, _, _ = pipeline(cfg, task, sysid_trajs,
+                            model=model)
+                print("Simulating Surrogate and True Dynamics Trajectories: ")
+                return self._simulate_episodes(task, controller, surrogate,
+                        truedyn_controller, truedyn, n_workers, episode_seed)
             print("Simulating Surrogate Trajectory: ")
             try:
                 controller.reset()
                 if task.has_num_steps():
                     surr_traj = simulate(controller, task.get_init_obs(),
                            task.term_cond, sim_model=surrogate, 
-                           max_steps=task.get_num_steps())
+                           max_steps=task.get_num_steps(), timing=True)
                 else:
                     surr_traj = simulate(controller, task.get_init_obs(),
-                           task.term_cond, sim_model=surrogate)
+                           task.term_cond, sim_model=surrogate, timing=True)
                 cost = task.get_cost()
                 surr_cost = cost(surr_traj)
                 print("Surrogate Cost: ", surr_cost)
                 print("Surrogate Final State: ", surr_traj[-1].obs)
                 info["surr_cost"] = surr_cost
                 info["surr_traj"] = (surr_traj.obs.tolist(), surr_traj.ctrls.tolist())
+                info["surr_timing"] = surr_traj.timing.summary()
             except np.linalg.LinAlgError:
                 surr_cost = np.inf
                 info["surr_cost"] = surr_cost
                 info["surr_traj"] = None
+                info["surr_timing"] = None
             
             if not truedyn is None:
                 print("Simulating True Dynamics Trajectory")
@@ -244,20 +328,24 @@ class PipelineTuner:
                 controller.reset()
                 if task.has_num_steps():
                     truedyn_traj = simulate(controller, task.get_init_obs(),
-                       task.term_cond, dynamics=truedyn, max_steps=task.get_num_steps())
+                       task.term_cond, dynamics=truedyn, max_steps=task.get_num_steps(),
+                       timing=True)
                 else:
                     truedyn_traj = simulate(controller, task.get_init_obs(),
-                       task.term_cond, dynamics=truedyn)
+                       task.term_cond, dynamics=truedyn, timing=True)
                 truedyn_cost = cost(truedyn_traj)
                 print("True Dynamics Cost: ", truedyn_cost)
                 print("True Dynamics Final State: ", truedyn_traj[-1].obs)
                 info["truedyn_cost"] = truedyn_cost
                 info["truedyn_traj"] = (truedyn_traj.obs.tolist(), 
                         truedyn_traj.ctrls.tolist())
+                info["truedyn_timing"] = truedyn_traj.timing.summary()
 
             return surr_cost, info
 
         smac_rng = np.random.RandomState(seed=rng.integers(1 << 31))
+        if n_workers is not None:
+            episode_seed = int(rng.integers(1 << 31))
         scenario = Scenario({"run_obj" : "quality",
                              "runcount-limit" : n_iters,
                              "cs" : pipeline.get_configuration_space(),
@@ -271,7 +359,8 @@ class PipelineTuner:
         inc_cfg = smac.optimize()
 
         cfgs, inc_cfgs, costs, inc_costs, truedyn_costs, inc_truedyn_costs, surr_trajs,\
-                truedyn_trajs =  [], [], [], [], [], [], [], []
+                truedyn_trajs, surr_timings, truedyn_timings = [], [], [], [], [], [], [], [],\
+                [], []
         inc_cost = float("inf")
 
         for key, val in smac.runhistory.data.items():
@@ -293,6 +382,7 @@ class PipelineTuner:
                 surr_trajs.append(surr_traj)
             else:
                 surr_trajs.append(None)
+            surr_timings.append(val.additional_info.get("surr_timing"))
             if "truedyn_cost" in val.additional_info:
                 inc_truedyn_costs.append(inc_truedyn_cost)
                 truedyn_costs.append(val.additional_info["truedyn_cost"])
@@ -301,6 +391,7 @@ class PipelineTuner:
                 truedyn_traj.obs[:] = truedyn_obs
                 truedyn_traj.ctrls[:] = truedyn_ctrls
                 truedyn_trajs.append(truedyn_traj)
+                truedyn_timings.append(val.additional_info.get("truedyn_timing"))
 
         tune_result = PipelineTuneResult(inc_cfg = inc_cfg,
                 cfgs = cfgs,
@@ -311,7 +402,9 @@ class PipelineTuner:
                 inc_truedyn_costs = inc_truedyn_costs,
                 surr_trajs = surr_trajs,
                 truedyn_trajs = truedyn_trajs,
-                surr_tune_result = surr_tune_result)
+                surr_tune_result = surr_tune_result,
+                surr_timings = surr_timings,
+                truedyn_timings = truedyn_timings)
 
         # Generate final model and controller
         controller, cost, model = pipeline(inc_cfg, task, sysid_trajs)
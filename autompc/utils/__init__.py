@@ -1,2 +1,5 @@
 from .make_utils import *
-from .simulation import simulate
+from .simulation import simulate, simulate_batch
+from .episode_runner import EpisodeRunner, EpisodeResult, EpisodeBatch
+from .timing import StepTimer
+from .realtime import RealtimeRunner
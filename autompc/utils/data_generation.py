@@ -2,6 +2,7 @@
 
 # Standard library includes
 import sys
+import multiprocessing as mp
 from pdb import set_trace
 
 # External library includes
@@ -10,125 +11,351 @@ import autompc as ampc
 
 # Project includes
 
+# Per-trajectory generation function of the current worker process,
+# installed once per worker by _init_gen_worker.
+_gen_worker = dict()
+
+def _init_gen_worker(gen_traj):
+    _gen_worker["gen_traj"] = gen_traj
+
+def _gen_chunk(items):
+    trajs = [_gen_worker["gen_traj"](i, np.random.default_rng(seed))
+            for i, seed in items]
+    return [(traj.obs, traj.ctrls) for traj in trajs]
+
+def parallel_generate(system, gen_traj, n_trajs, seed, n_workers=None):
+    """
+    Generate trajectories over a pool of worker processes.  Trajectory i
+    is generated by gen_traj(i, rng), where rng is a numpy Generator
+    seeded from the i-th child of a SeedSequence, so the data set depends
+    only on the seed and not on the number of workers.
+
+    Parameters
+    ----------
+    system : System
+        System for the trajectories
+
+    gen_traj : Function int, numpy.random.Generator -> Trajectory
+        Generates a single trajectory. With the default fork start
+        method, it need not be picklable.
+
+    n_trajs : int
+        Number of trajectories to generate
+
+    seed : int, numpy.random.SeedSequence, or numpy.random.Generator
+        Root seed.  A Generator is used to draw the root seed.
+
+    n_workers : int
+        Number of worker processes. Defaults to the number of CPUs.
+        With one worker, trajectories are generated in the calling process.
+
+    Returns
+    -------
+    trajs : TrajectorySet
+        Generated trajectories in a single contiguous data set.
+    """
+    if isinstance(seed, np.random.Generator):
+        seed = int(seed.integers(1 << 62))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    if n_workers is None:
+        n_workers = mp.cpu_count()
+    items = list(enumerate(seed.spawn(n_trajs)))
+    if n_workers == 1:
+        _init_gen_worker(gen_traj)
+        results = _gen_chunk(items)
+    else:
+        chunk_size = max(1, -(-n_trajs // (4 * n_workers)))
+        chunks = [items[i:i+chunk_size] for i in range(0, n_trajs, chunk_size)]
+        with mp.Pool(processes=n_workers, initializer=_init_gen_worker,
+                initargs=(gen_traj,)) as pool:
+            results = [result for chunk_results in pool.map(_gen_chunk, chunks)
+                    for result in chunk_results]
+    lengths = [obs.shape[0] for obs, _ in results]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    obs = np.empty((offsets[-1], system.obs_dim))
+    ctrls = np.empty((offsets[-1], system.ctrl_dim))
+    for (traj_obs, traj_ctrls), start, end in zip(results, offsets[:-1], offsets[1:]):
+        obs[start:end] = traj_obs
+        ctrls[start:end] = traj_ctrls
+    return ampc.TrajectorySet(system, obs, ctrls, offsets)
+
+def _check_modes(dynamics_batch, n_workers):
+    if dynamics_batch is not None and n_workers is not None:
+        raise ValueError("dynamics_batch and n_workers cannot be combined")
+
+def _generate(system, gen_traj, n_trajs, rng, n_workers):
+    # Serial generation uses the same per-trajectory seeding as the
+    # worker pool, so the data set does not depend on n_workers
+    return parallel_generate(system, gen_traj, n_trajs, rng,
+            1 if n_workers is None else n_workers)
+
+def _allocate_dataset(system, n_trajs, traj_len):
+    # Preallocate the concatenated dataset and return (N, T, dim) views
+    # of it, so generated data is written in place.
+    obs = np.zeros((n_trajs * traj_len, system.obs_dim))
+    ctrls = np.zeros((n_trajs * traj_len, system.ctrl_dim))
+    return obs, ctrls, obs.reshape(n_trajs, traj_len, -1), ctrls.reshape(n_trajs,
+            traj_len, -1)
+
+def _sample_init_obs(rng, init_min, init_max, n_trajs):
+    return rng.uniform(np.asarray(init_min, dtype=float),
+            np.asarray(init_max, dtype=float), (n_trajs, len(init_min)))
+
+def _rollout_batch(dynamics_batch, state0, obs, ctrls, abort_if=None):
+    """
+    Advance all trajectories together under the open-loop controls
+    already written in ctrls, filling obs in place.  Returns the
+    trajectory lengths.
+    """
+    n_trajs, traj_len = ctrls.shape[:2]
+    lengths = np.full(n_trajs, traj_len)
+    y = state0
+    for i in range(traj_len):
+        obs[:, i, :] = y
+        y = dynamics_batch(y, ctrls[:, i, :])
+        if abort_if is not None:
+            aborted = np.array([abort_if(yj) for yj in y]) & (lengths == traj_len)
+            lengths[aborted] = i
+    return lengths
+
+def _to_trajectory_set(system, obs, ctrls, lengths, traj_len):
+    n_trajs = lengths.size
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if np.all(lengths == traj_len):
+        return ampc.TrajectorySet(system, obs, ctrls, offsets)
+    rows = (np.arange(traj_len) < lengths[:, np.newaxis]).reshape(-1)
+    return ampc.TrajectorySet(system, obs[rows], ctrls[rows], offsets)
+
+def _uniform_random_generate_batch(system, task, dynamics_batch, rng, init_min,
+        init_max, traj_len, n_trajs):
+    obs, ctrls, obs3, ctrls3 = _allocate_dataset(system, n_trajs, traj_len)
+    state0 = _sample_init_obs(rng, init_min, init_max, n_trajs)
+    umin, umax = task.get_ctrl_bounds().T
+    ctrls3[:] = rng.uniform(umin, umax, ctrls3.shape)
+    lengths = _rollout_batch(dynamics_batch, state0, obs3, ctrls3)
+    return _to_trajectory_set(system, obs, ctrls, lengths, traj_len)
+
+def _prbs_generate_batch(system, task, dynamics_batch, rng, init_min, init_max,
+        traj_len, n_trajs, states, Nswitch):
+    obs, ctrls, obs3, ctrls3 = _allocate_dataset(system, n_trajs, traj_len)
+    # A step starts a new level at t=0 and at every switch time
+    switches = rng.choice(traj_len, (n_trajs, Nswitch))
+    is_switch = np.zeros((n_trajs, traj_len), dtype=bool)
+    is_switch[:, 0] = True
+    is_switch[np.arange(n_trajs)[:, np.newaxis], switches] = True
+    levels = rng.choice(states, (n_trajs, Nswitch + 1))
+    level_idx = np.cumsum(is_switch, axis=1) - 1
+    ctrls3[:] = np.take_along_axis(levels, level_idx, axis=1)[:, :, np.newaxis]
+    state0 = _sample_init_obs(rng, init_min, init_max, n_trajs)
+    lengths = _rollout_batch(dynamics_batch, state0, obs3, ctrls3)
+    return _to_trajectory_set(system, obs, ctrls, lengths, traj_len)
+
+def _random_walk_generate_batch(system, task, dynamics_batch, rng, init_min,
+        init_max, walk_rate, traj_len, n_trajs):
+    obs, ctrls, obs3, ctrls3 = _allocate_dataset(system, n_trajs, traj_len)
+    state0 = _sample_init_obs(rng, init_min, init_max, n_trajs)
+    umin, umax = task.get_ctrl_bounds().T
+    uamp = np.min([umin, umax])
+    step_size = walk_rate * system.dt
+    u = rng.uniform(umin, umax, (n_trajs, system.ctrl_dim))
+    steps = uamp * step_size * rng.uniform(-1, 1,
+            (traj_len, n_trajs, system.ctrl_dim))
+    for i in range(traj_len):
+        u = np.clip(u + steps[i], umin, umax)
+        ctrls3[:, i, :] = u
+    lengths = _rollout_batch(dynamics_batch, state0, obs3, ctrls3)
+    return _to_trajectory_set(system, obs, ctrls, lengths, traj_len)
+
+def _periodic_control_generate_batch(system, task, dynamics_batch, rng, init_min,
+        init_max, U_1, traj_len, n_trajs):
+    periods = np.array(list(range(1, traj_len, max([1, traj_len // n_trajs]))))
+    obs, ctrls, obs3, ctrls3 = _allocate_dataset(system, len(periods), traj_len)
+    state0 = _sample_init_obs(rng, init_min, init_max, len(periods))
+    umin, umax = task.get_ctrl_bounds().T
+    uamp = np.min([umin, umax])
+    phase = 2 * np.pi * np.arange(traj_len) / periods[:, np.newaxis]
+    ctrls3[:] = uamp * U_1 * np.cos(phase)[:, :, np.newaxis]
+    lengths = _rollout_batch(dynamics_batch, state0, obs3, ctrls3)
+    return _to_trajectory_set(system, obs, ctrls, lengths, traj_len)
+
+def _multisine_generate_batch(system, task, dynamics_batch, rng, init_min, init_max,
+        n_freqs, traj_len, n_trajs, abort_if=None):
+    periods = np.array(list(range(1, traj_len, n_freqs)))
+    umin, umax = task.get_ctrl_bounds().T
+    uamp = (umax - umin) / 2
+    umed = (umax + umin) / 2
+    obs, ctrls, obs3, ctrls3 = _allocate_dataset(system, n_trajs, traj_len)
+    # Random partition of unity over the frequencies for each
+    # trajectory and control dimension
+    vals = np.sort(rng.uniform(size=(n_trajs, system.ctrl_dim, len(periods)-1)),
+            axis=2)
+    vals = np.concatenate([np.zeros((n_trajs, system.ctrl_dim, 1)), vals,
+        np.ones((n_trajs, system.ctrl_dim, 1))], axis=2)
+    weights = np.diff(vals, axis=2)
+    phases = rng.uniform(0, 2*np.pi, (n_trajs, len(periods)))
+    state0 = _sample_init_obs(rng, init_min, init_max, n_trajs)
+    # cosines[n, t, j] = cos(2 pi t / period_j + phase_nj)
+    cosines = np.cos(2 * np.pi * np.arange(traj_len)[np.newaxis, :, np.newaxis]
+            / periods + phases[:, np.newaxis, :])
+    ctrls3[:] = uamp * np.einsum("ntj,ncj->ntc", cosines, weights) + umed
+    lengths = _rollout_batch(dynamics_batch, state0, obs3, ctrls3,
+            abort_if=abort_if)
+    return _to_trajectory_set(system, obs, ctrls, lengths, traj_len)
+
 def uniform_random_generate(system, task, dynamics, rng, init_min, init_max, 
-        traj_len, n_trajs):
-    trajs = []
-    for _ in range(n_trajs):
-        state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
-                in zip(init_min, init_max)]
-        y = state0[:]
-        traj = ampc.zeros(system, traj_len)
-        traj.obs[:] = y
-        umin, umax = task.get_ctrl_bounds().T
-        for i in range(traj_len):
-            traj[i].obs[:] = y
-            u = rng.uniform(umin, umax, system.ctrl_dim)
-            y = dynamics(y, u)
-            traj[i].ctrl[:] = u
-        trajs.append(traj)
-    return trajs
+        traj_len, n_trajs, dynamics_batch=None, n_workers=None):
+    _check_modes(dynamics_batch, n_workers)
+    if dynamics_batch is not None:
+        return _uniform_random_generate_batch(system, task, dynamics_batch, rng,
+                init_min, init_max, traj_len, n_trajs)
+    gen_traj = lambda i, traj_rng: _uniform_random_traj(system, task,
+            dynamics, traj_rng, init_min, init_max, traj_len)
+    return _generate(system, gen_traj, n_trajs, rng, n_workers)
+
+def _uniform_random_traj(system, task, dynamics, rng, init_min, init_max,
+        traj_len):
+    state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
+            in zip(init_min, init_max)]
+    y = state0[:]
+    traj = ampc.zeros(system, traj_len)
+    traj.obs[:] = y
+    umin, umax = task.get_ctrl_bounds().T
+    for i in range(traj_len):
+        traj[i].obs[:] = y
+        u = rng.uniform(umin, umax, system.ctrl_dim)
+        y = dynamics(y, u)
+        traj[i].ctrl[:] = u
+    return traj
 
 def prbs_generate(system, task, dynamics, rng, init_min, init_max,
-        traj_len, n_trajs, states, Nswitch):
-    trajs = []
-    for _ in range(n_trajs):
-        # Compute control sequence
-        switches = rng.choice(traj_len, Nswitch)  
-        switches = np.concatenate([[0], switches, [traj_len]])
-        u = np.zeros(traj_len) 
-        for ps, ns in zip(switches[:-1], switches[1:]):
-            u[ps:ns] = rng.choice(states)
-
-        state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
-                in zip(init_min, init_max)]
-        y = state0[:]
-        traj = ampc.zeros(system, traj_len)
-        traj.obs[:] = y
-        for i in range(traj_len):
-            traj[i].obs[:] = y
-            y = dynamics(y, u[i])
-            traj[i].ctrl[:] = u[i]
-        trajs.append(traj)
-    return trajs
+        traj_len, n_trajs, states, Nswitch, dynamics_batch=None, n_workers=None):
+    _check_modes(dynamics_batch, n_workers)
+    if dynamics_batch is not None:
+        return _prbs_generate_batch(system, task, dynamics_batch, rng,
+                init_min, init_max, traj_len, n_trajs, states, Nswitch)
+    gen_traj = lambda i, traj_rng: _prbs_traj(system, task, dynamics,
+            traj_rng, init_min, init_max, traj_len, states, Nswitch)
+    return _generate(system, gen_traj, n_trajs, rng, n_workers)
+
+def _prbs_traj(system, task, dynamics, rng, init_min, init_max, traj_len,
+        states, Nswitch):
+    # Compute control sequence
+    switches = rng.choice(traj_len, Nswitch)  
+    switches = np.concatenate([[0], switches, [traj_len]])
+    u = np.zeros(traj_len) 
+    for ps, ns in zip(switches[:-1], switches[1:]):
+        u[ps:ns] = rng.choice(states)
+
+    state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
+            in zip(init_min, init_max)]
+    y = state0[:]
+    traj = ampc.zeros(system, traj_len)
+    traj.obs[:] = y
+    for i in range(traj_len):
+        traj[i].obs[:] = y
+        y = dynamics(y, u[i])
+        traj[i].ctrl[:] = u[i]
+    return traj
 
 def random_walk_generate(system, task, dynamics, rng, init_min, init_max, walk_rate,
-        traj_len, n_trajs):
-    trajs = []
-    for _ in range(n_trajs):
-        state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
-                in zip(init_min, init_max)]
-        y = state0[:]
-        traj = ampc.zeros(system, traj_len)
-        traj.obs[:] = y
-        umin, umax = task.get_ctrl_bounds().T
-        uamp = np.min([umin, umax])
-        u = rng.uniform(umin, umax, system.ctrl_dim)
-        step_size = walk_rate * system.dt
-        for i in range(traj_len):
-            traj[i].obs[:] = y
-            u += uamp * step_size * rng.uniform(-1, 1, system.ctrl_dim)
-            u = np.clip(u, umin, umax)
-            y = dynamics(y, u)
-            traj[i].ctrl[:] = u
-        trajs.append(traj)
-    return trajs
+        traj_len, n_trajs, dynamics_batch=None, n_workers=None):
+    _check_modes(dynamics_batch, n_workers)
+    if dynamics_batch is not None:
+        return _random_walk_generate_batch(system, task, dynamics_batch, rng,
+                init_min, init_max, walk_rate, traj_len, n_trajs)
+    gen_traj = lambda i, traj_rng: _random_walk_traj(system, task, dynamics,
+            traj_rng, init_min, init_max, walk_rate, traj_len)
+    return _generate(system, gen_traj, n_trajs, rng, n_workers)
+
+def _random_walk_traj(system, task, dynamics, rng, init_min, init_max,
+        walk_rate, traj_len):
+    state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
+            in zip(init_min, init_max)]
+    y = state0[:]
+    traj = ampc.zeros(system, traj_len)
+    traj.obs[:] = y
+    umin, umax = task.get_ctrl_bounds().T
+    uamp = np.min([umin, umax])
+    u = rng.uniform(umin, umax, system.ctrl_dim)
+    step_size = walk_rate * system.dt
+    for i in range(traj_len):
+        traj[i].obs[:] = y
+        u += uamp * step_size * rng.uniform(-1, 1, system.ctrl_dim)
+        u = np.clip(u, umin, umax)
+        y = dynamics(y, u)
+        traj[i].ctrl[:] = u
+    return traj
 
 
 def periodic_control_generate(system, task, dynamics, rng, init_min, init_max, U_1, 
-        traj_len, n_trajs):
-    trajs = []
+        traj_len, n_trajs, dynamics_batch=None, n_workers=None):
+    _check_modes(dynamics_batch, n_workers)
+    if dynamics_batch is not None:
+        return _periodic_control_generate_batch(system, task, dynamics_batch, rng,
+                init_min, init_max, U_1, traj_len, n_trajs)
     periods = list(range(1, traj_len, max([1, traj_len // n_trajs])))
     print("periods=", periods)
-    for period in periods:
-        state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
-                in zip(init_min, init_max)]
-        y = state0[:]
-        traj = ampc.zeros(system, traj_len)
-        traj.obs[:] = y
-        umin, umax = task.get_ctrl_bounds().T
-        uamp = np.min([umin, umax])
-        for i in range(traj_len):
-            traj[i].obs[:] = y
-            u  = uamp * U_1 * np.cos(2 * np.pi * i / period)
-            y = dynamics(y, u)
-            traj[i].ctrl[:] = u
-        trajs.append(traj)
-    return trajs
+    gen_traj = lambda i, traj_rng: _periodic_control_traj(system, task,
+            dynamics, traj_rng, init_min, init_max, U_1, traj_len, periods[i])
+    return _generate(system, gen_traj, len(periods), rng, n_workers)
+
+def _periodic_control_traj(system, task, dynamics, rng, init_min, init_max, U_1,
+        traj_len, period):
+    state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
+            in zip(init_min, init_max)]
+    y = state0[:]
+    traj = ampc.zeros(system, traj_len)
+    traj.obs[:] = y
+    umin, umax = task.get_ctrl_bounds().T
+    uamp = np.min([umin, umax])
+    for i in range(traj_len):
+        traj[i].obs[:] = y
+        u  = uamp * U_1 * np.cos(2 * np.pi * i / period)
+        y = dynamics(y, u)
+        traj[i].ctrl[:] = u
+    return traj
 
 def multisine_generate(system, task, dynamics, rng, init_min, init_max, n_freqs,
-        traj_len, n_trajs, abort_if=None):
-    trajs = []
+        traj_len, n_trajs, abort_if=None, dynamics_batch=None, n_workers=None):
+    _check_modes(dynamics_batch, n_workers)
+    if dynamics_batch is not None:
+        return _multisine_generate_batch(system, task, dynamics_batch, rng,
+                init_min, init_max, n_freqs, traj_len, n_trajs, abort_if)
+    gen_traj = lambda i, traj_rng: _multisine_traj(system, task, dynamics,
+            traj_rng, init_min, init_max, n_freqs, traj_len, abort_if)
+    return _generate(system, gen_traj, n_trajs, rng, n_workers)
+
+def _multisine_traj(system, task, dynamics, rng, init_min, init_max, n_freqs,
+        traj_len, abort_if):
     periods  = list(range(1, traj_len, n_freqs))
     umin, umax = task.get_ctrl_bounds().T
     uamp = (umax - umin) / 2
     umed = (umax + umin) / 2
-        
-    for _ in range(n_trajs):
-        weights = []
-        for i in range(system.ctrl_dim):
-            vals = rng.uniform(size=len(periods)-1)
-            vals = np.concatenate([[0.0], np.sort(vals), [1.0]])
-            weight = vals[1:] - vals[:-1]
-            weights.append(weight)
-        weights = np.array(weights)
-        phases = rng.uniform(0, 2*np.pi, len(periods))
-
-        state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
-                in zip(init_min, init_max)]
-        y = state0[:]
-        traj = ampc.zeros(system, traj_len)
-        traj.obs[:] = y
-        umin, umax = task.get_ctrl_bounds().T
-        for i in range(traj_len):
-            traj[i].obs[:] = y
-            u = np.zeros(system.ctrl_dim)
-            for j, period in enumerate(periods):
-                u += weights[:,j] * np.cos(2 * np.pi * i / period + phases[j])
-            u = uamp * u + umed
-            y = dynamics(y, u)
-            traj[i].ctrl[:] = u
-            if not abort_if is None and abort_if(y):
-                traj = traj[:i]
-                break
-        trajs.append(traj)
-    return trajs
+
+    weights = []
+    for i in range(system.ctrl_dim):
+        vals = rng.uniform(size=len(periods)-1)
+        vals = np.concatenate([[0.0], np.sort(vals), [1.0]])
+        weight = vals[1:] - vals[:-1]
+        weights.append(weight)
+    weights = np.array(weights)
+    phases = rng.uniform(0, 2*np.pi, len(periods))
+
+    state0 = [rng.uniform(minval, maxval, 1)[0] for minval, maxval 
+            in zip(init_min, init_max)]
+    y = state0[:]
+    traj = ampc.zeros(system, traj_len)
+    traj.obs[:] = y
+    for i in range(traj_len):
+        traj[i].obs[:] = y
+        u = np.zeros(system.ctrl_dim)
+        for j, period in enumerate(periods):
+            u += weights[:,j] * np.cos(2 * np.pi * i / period + phases[j])
+        u = uamp * u + umed
+        y = dynamics(y, u)
+        traj[i].ctrl[:] = u
+        if not abort_if is None and abort_if(y):
+            traj = traj[:i]
+            break
+    return traj
@@ -0,0 +1,266 @@
+# Standard library includes
+import copy
+import multiprocessing as mp
+from collections import namedtuple
+
+# Internal library includes
+from .simulation import simulate
+
+# External library includes
+import numpy as np
+
+EpisodeResult = namedtuple("EpisodeResult", ["cost", "final_obs", "length",
+    "traj", "timing"], defaults=(None,))
+"""
+EpisodeResult contains the compact result of one simulated episode.
+
+.. py:attribute:: cost
+
+    Task cost of the episode.
+
+.. py:attribute:: final_obs
+
+    Final observation of the episode.
+
+.. py:attribute:: length
+
+    Number of time steps in the episode.
+
+.. py:attribute:: traj
+
+    Tuple (obs, ctrls) of the simulated trajectory arrays, or None
+    if trajectories were not requested.
+
+.. py:attribute:: timing
+
+    Per-step timing summary (see StepTimer.summary) of the episode, or
+    None if timing was not requested.
+"""
+
+# Simulation setup of the current worker process, installed
+# once per worker by _init_worker.
+_worker_env = dict()
+
+_ENV_KEYS = ["controller", "task", "dynamics", "sim_model", "max_steps",
+        "return_trajs", "timing"]
+
+def _init_worker(*env_args):
+    _worker_env.clear()
+    _worker_env.update(zip(_ENV_KEYS, env_args))
+
+def _run_episode(env, init_obs, seed):
+    rng = np.random.default_rng(seed)
+    # Controllers and dynamics may draw from the global RNG
+    np.random.seed(seed.generate_state(1)[0])
+    if callable(init_obs):
+        init_obs = init_obs(rng)
+    controller = env["controller"]
+    controller.reset()
+    task = env["task"]
+    traj = simulate(controller, init_obs, task.term_cond,
+            dynamics=env["dynamics"], sim_model=env["sim_model"],
+            max_steps=env["max_steps"], silent=True, timing=env["timing"])
+    cost = task.get_cost()(traj)
+    return EpisodeResult(cost=cost, final_obs=np.copy(traj[-1].obs),
+            length=traj.size,
+            traj=(traj.obs, traj.ctrls) if env["return_trajs"] else None,
+            timing=traj.timing.summary() if env["timing"] else None)
+
+def _run_chunk(episodes):
+    return [_run_episode(_worker_env, init_obs, seed)
+            for init_obs, seed in episodes]
+
+class EpisodeBatch:
+    """
+    Handle to episodes submitted with EpisodeRunner.run_async.
+    """
+    def __init__(self, async_result=None, results=None):
+        self._async_result = async_result
+        self._results = results
+
+    def ready(self):
+        """
+        Returns True if all episodes have finished.
+        """
+        return self._async_result is None or self._async_result.ready()
+
+    def get(self):
+        """
+        Wait for the episodes to finish and return their results.  An
+        exception raised while simulating an episode is raised here.
+
+        Returns
+        -------
+        results : List of EpisodeResult
+            Result of each episode, in order.
+        """
+        if self._results is None:
+            self._results = [result for chunk_results
+                    in self._async_result.get() for result in chunk_results]
+        return self._results
+
+class EpisodeRunner:
+    """
+    The EpisodeRunner evaluates a controller on many independent
+    episodes by fanning them out over a persistent pool of worker
+    processes.  The controller, task, and dynamics are sent to each
+    worker once, when the pool is started, and reused for every
+    subsequent call to run.  Only the initial observations and seeds
+    are sent per episode, and only compact EpisodeResults are returned.
+
+    Each episode is seeded from its own child of a SeedSequence and the
+    controller is reset before each episode, so results do not depend on
+    the number of workers.  With the default fork start method, the
+    controller and dynamics need not be picklable.  The pool is started
+    with no more processes than there are chunks of work, and is
+    restarted larger if a later call has more.
+    """
+    def __init__(self, controller, task, dynamics=None, sim_model=None,
+            max_steps=None, n_workers=None, return_trajs=False, timing=False):
+        """
+        Parameters
+        ----------
+        controller : Controller
+            Controller to evaluate
+
+        task : Task
+            Task providing the cost and termination condition
+
+        dynamics : Function obs, control -> newobs
+            Function defining system dynamics
+
+        sim_model : Model
+            Simulation model.  Used when dynamics is None
+
+        max_steps : int
+            Maximum number of simulation steps per episode. Defaults to
+            the task number of steps if set, otherwise 10000.
+
+        n_workers : int
+            Number of worker processes. Defaults to the number of CPUs.
+            With one worker, episodes are run in the calling process.
+
+        return_trajs : bool
+            If True, include the simulated trajectories in the results.
+
+        timing : bool
+            If True, include per-step timing summaries in the results.
+        """
+        if dynamics is None and sim_model is None:
+            raise ValueError("Must specify dynamics function or simulation model")
+        if max_steps is None:
+            max_steps = task.get_num_steps() if task.has_num_steps() else 10000
+        if n_workers is None:
+            n_workers = mp.cpu_count()
+        if n_workers < 1:
+            raise ValueError("n_workers must be positive")
+        self.task = task
+        self.dynamics = dynamics
+        self.sim_model = sim_model
+        self.max_steps = max_steps
+        self.n_workers = n_workers
+        self.return_trajs = return_trajs
+        self.timing = timing
+        self._pool = None
+        self._pool_size = 0
+        self._local_env = None
+        self.set_controller(controller)
+
+    def set_controller(self, controller):
+        """
+        Replace the controller being evaluated.  The worker pool is
+        restarted on the next call to run so that each worker receives
+        the new controller once.
+
+        Parameters
+        ----------
+        controller : Controller
+            Controller to evaluate
+        """
+        self.close()
+        self.controller = controller
+
+    def _get_env_args(self):
+        return (self.controller, self.task, self.dynamics, self.sim_model,
+                self.max_steps, self.return_trajs, self.timing)
+
+    def _get_pool(self, n_chunks):
+        size = min(self.n_workers, n_chunks)
+        if self._pool is not None and self._pool_size < size:
+            self.close()
+        if self._pool is None:
+            self._pool = mp.Pool(processes=size, initializer=_init_worker,
+                    initargs=self._get_env_args())
+            self._pool_size = size
+        return self._pool
+
+    def run(self, init_obs, seed=0):
+        """
+        Simulate one episode per initial observation.  See run_async
+        for the parameters.
+
+        Returns
+        -------
+        results : List of EpisodeResult
+            Result of each episode, in order.
+        """
+        return self.run_async(init_obs, seed).get()
+
+    def run_async(self, init_obs, seed=0):
+        """
+        Submit one episode per initial observation without waiting for
+        the results, so that episodes of several runners can be simulated
+        at the same time.  With one worker, the episodes are simulated
+        in the calling process before returning.
+
+        Parameters
+        ----------
+        init_obs : numpy array of shape (N, system.obs_dim) or List of Function rng -> obs
+            Initial observation of each episode.  A function is called
+            with the episode's numpy.random.Generator to sample the
+            initial observation, and must be picklable.
+
+        seed : int or numpy.random.SeedSequence
+            Root seed.  Episode i is seeded with the i-th child of the
+            root SeedSequence.
+
+        Returns
+        -------
+        batch : EpisodeBatch
+            Handle whose get method returns the result of each episode.
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        seeds = seed.spawn(len(init_obs))
+        episodes = list(zip(init_obs, seeds))
+        if self.n_workers == 1:
+            if self._local_env is None:
+                self._local_env = dict(zip(_ENV_KEYS, self._get_env_args()))
+                self._local_env["controller"] = copy.deepcopy(self.controller)
+            return EpisodeBatch(results=[_run_episode(self._local_env, obs, s)
+                for obs, s in episodes])
+
+        if not episodes:
+            return EpisodeBatch(results=[])
+        chunk_size = max(1, -(-len(episodes) // (4 * self.n_workers)))
+        chunks = [episodes[i:i+chunk_size] for i in range(0, len(episodes),
+            chunk_size)]
+        return EpisodeBatch(async_result=self._get_pool(len(chunks)).map_async(
+            _run_chunk, chunks))
+
+    def close(self):
+        """
+        Shut down the worker pool.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_size = 0
+        self._local_env = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,172 @@
+# Standard library includes
+import time
+
+# Internal library includes
+from ..trajectory import TrajectoryBuilder
+from .timing import StepTimer
+
+# External library includes
+import numpy as np
+
+class RealtimeRunner:
+    """
+    The RealtimeRunner drives a controller at a fixed wall-clock rate
+    against a dynamics function or a simulation model standing in for the
+    robot.  Each control period starts on a fixed schedule.  When
+    Controller.run takes longer than the period, its control arrives too
+    late to be applied and the runner applies the overrun policy instead:
+
+    - "hold": apply the last applied control again.
+    - "shift": apply the next control of the plan the controller reported
+      (see Controller.get_plan) after its last on-time step, falling back
+      to "hold" when no plan is available.
+    - "fallback": apply the control of a fallback controller.
+
+    After an overrun, the controller state is rebuilt from the trajectory
+    so that it reflects the control which was actually applied.
+
+    Timings are recorded in a StepTimer with the stages "controller"
+    (Controller.run), "fallback", and "jitter" (lateness of each period's
+    start relative to its schedule).  The timer is attached to the returned
+    trajectory and the steps at which overruns occurred are available as
+    overrun_steps after each run.
+    """
+    def __init__(self, controller, dynamics=None, sim_model=None, dt=None,
+            overrun_policy="hold", fallback_controller=None, sleep=True):
+        """
+        Parameters
+        ----------
+        controller : Controller
+            Controller to run
+
+        dynamics : Function obs, control -> newobs
+            Function defining system dynamics
+
+        sim_model : Model
+            Simulation model.  Used when dynamics is None
+
+        dt : float
+            Control period in seconds. Defaults to the system time step.
+
+        overrun_policy : string
+            One of "hold", "shift", or "fallback". Default is "hold".
+
+        fallback_controller : Controller
+            Controller used on overruns. Required for the "fallback" policy.
+
+        sleep : bool
+            If True, wait for the start of each control period.  If False,
+            periods start as soon as the previous one finishes, while
+            overruns are still detected against dt.
+        """
+        if dynamics is None and sim_model is None:
+            raise ValueError("Must specify dynamics function or simulation model")
+        if dt is None:
+            dt = controller.system.dt
+        if dt is None or dt <= 0:
+            raise ValueError("A positive control period is required")
+        if overrun_policy not in ["hold", "shift", "fallback"]:
+            raise ValueError("Unknown overrun policy {}".format(overrun_policy))
+        if overrun_policy == "fallback" and fallback_controller is None:
+            raise ValueError("fallback_controller is required for the fallback policy")
+        self.controller = controller
+        self.dynamics = dynamics
+        self.sim_model = sim_model
+        self.dt = dt
+        self.overrun_policy = overrun_policy
+        self.fallback_controller = fallback_controller
+        self.sleep = sleep
+        self.overrun_steps = []
+
+    def _overrun_ctrl(self, traj, last_u, plan, plan_idx):
+        if self.overrun_policy == "shift" and plan is not None \
+                and plan_idx < plan.shape[0]:
+            return plan[plan_idx]
+        if self.overrun_policy == "fallback":
+            fallback = self.fallback_controller
+            u, _ = fallback.run(fallback.traj_to_state(traj), traj[-1].obs)
+            return u
+        return last_u
+
+    def run(self, init_obs, term_cond=None, max_steps=1000):
+        """
+        Run the control loop.
+
+        Parameters
+        ----------
+        init_obs : numpy array of size controller.system.obs_dim
+            Initial observation
+
+        term_cond : Function Trajectory -> bool
+            Function which returns true when termination condition is met.
+
+        max_steps : int
+            Maximum number of control periods. Default is 1000.
+
+        Returns
+        -------
+        traj : Trajectory
+            Trajectory of applied controls, with the StepTimer attached
+            as traj.timing.
+        """
+        system = self.controller.system
+        controller = self.controller
+        timer = StepTimer(deadline=self.dt)
+        self.overrun_steps = []
+
+        builder = TrajectoryBuilder(system, capacity=min(max_steps+1, 1024))
+        x = np.copy(init_obs)
+        builder.append(x)
+        traj = builder.view()
+        constate = controller.traj_to_state(traj)
+        if self.dynamics is None:
+            simstate = self.sim_model.traj_to_state(traj)
+        last_u = np.zeros(system.ctrl_dim)
+        plan, plan_idx = None, 0
+
+        scheduled = time.perf_counter()
+        for step in range(max_steps):
+            start = time.perf_counter()
+            timer.record("jitter", max(start - scheduled, 0.0))
+            u, newstate = controller.run(constate, traj[-1].obs)
+            elapsed = time.perf_counter() - start
+            timer.record("controller", elapsed)
+            if elapsed <= self.dt:
+                constate = newstate
+                plan, plan_idx = controller.get_plan(), 0
+            else:
+                self.overrun_steps.append(step)
+                fb_start = time.perf_counter()
+                u = self._overrun_ctrl(traj, last_u, plan, plan_idx)
+                timer.record("fallback", time.perf_counter() - fb_start)
+                plan_idx += 1
+
+            if self.dynamics is None:
+                simstate = self.sim_model.pred(simstate, u)
+                x = simstate[:system.obs_dim]
+            else:
+                x = self.dynamics(x, u)
+            builder.ctrls[-1] = u
+            builder.append(x)
+            traj = builder.view()
+            last_u = np.copy(u)
+            if elapsed > self.dt:
+                constate = controller.traj_to_state(traj[:-1])
+            if term_cond is not None and term_cond(traj):
+                break
+
+            scheduled += self.dt
+            now = time.perf_counter()
+            if now < scheduled:
+                if self.sleep:
+                    time.sleep(scheduled - now)
+            else:
+                # Start the next period immediately and re-anchor the
+                # schedule rather than trying to catch up.
+                scheduled = now
+            if not self.sleep:
+                scheduled = min(scheduled, time.perf_counter())
+
+        traj = builder.to_trajectory()
+        traj.timing = timer
+        return traj
@@ -1,14 +1,19 @@
 # Standard library library
 import sys
+import copy
+import time
 
 # Internal library includes
-from .. import zeros, extend
+from ..trajectory import Trajectory, TrajectoryBuilder
+from ..control.controller import Controller
+from .timing import StepTimer
 
 # External library includes
 import numpy as np
 from tqdm import tqdm
 
-def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None, max_steps=10000, silent=False):
+def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None, max_steps=10000, silent=False,
+        timing=False):
     """
     Simulate a controller with respect to a dynamics function or simulation model.
 
@@ -34,13 +39,28 @@ def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None
 
     silent : bool
         Suppress output if True.
+
+    timing : bool or StepTimer
+        If True, record the wall-clock time of each controller step,
+        model prediction, dynamics evaluation and loop iteration in a
+        StepTimer whose deadline is the system time step.  A StepTimer
+        may also be passed to record into.  The timer is attached to the
+        returned trajectory as traj.timing.
     """
     if dynamics is None and sim_model is None:
         raise ValueError("Must specify dynamics function or simulation model")
 
-    sim_traj = zeros(controller.system, 1)
+    if isinstance(timing, StepTimer):
+        timer = timing
+    elif timing:
+        timer = StepTimer(deadline=controller.system.dt)
+    else:
+        timer = None
+
+    builder = TrajectoryBuilder(controller.system, capacity=min(max_steps+1, 1024))
     x = np.copy(init_obs)
-    sim_traj[0].obs[:] = x
+    builder.append(x)
+    sim_traj = builder.view()
     
     constate = controller.traj_to_state(sim_traj)
     if dynamics is None:
@@ -50,15 +70,163 @@ def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None
     else:
         itr = tqdm(range(max_steps), file=sys.stdout)
     for _  in itr:
+        if timer is not None:
+            t0 = time.perf_counter()
         u, constate = controller.run(constate, sim_traj[-1].obs)
+        if timer is not None:
+            t1 = time.perf_counter()
+            timer.record("controller", t1 - t0)
         if dynamics is None:
             simstate = sim_model.pred(simstate, u)
             x = simstate[:controller.system.obs_dim]
         else:
             x = dynamics(x, u)
-        sim_traj[-1].ctrl[:] = u
-        sim_traj = extend(sim_traj, [x], 
-                np.zeros((1, controller.system.ctrl_dim)))
-        if term_cond is not None and term_cond(sim_traj):
+        if timer is not None:
+            timer.record("dynamics" if dynamics is not None else "model",
+                    time.perf_counter() - t1)
+        builder.ctrls[-1] = u
+        builder.append(x)
+        sim_traj = builder.view()
+        done = term_cond is not None and term_cond(sim_traj)
+        if timer is not None:
+            timer.record("step", time.perf_counter() - t0)
+        if done:
             break
-    return sim_traj
+    traj = builder.to_trajectory()
+    traj.timing = timer
+    return traj
+
+def _get_episode_controllers(controllers, n):
+    if isinstance(controllers, Controller):
+        if controllers.is_batch:
+            return controllers, None
+        episode_controllers = [copy.deepcopy(controllers) for _ in range(n)]
+    elif callable(controllers):
+        episode_controllers = [controllers() for _ in range(n)]
+    else:
+        episode_controllers = list(controllers)
+        if len(episode_controllers) != n:
+            raise ValueError("Number of controllers must match number of "
+                    + "initial observations")
+    for controller in episode_controllers:
+        controller.reset()
+    return None, episode_controllers
+
+def simulate_batch(controllers, init_obs, term_cond=None, dynamics=None,
+        dynamics_batch=None, sim_model=None, max_steps=10000, silent=False):
+    """
+    Simulate N episodes in lockstep with respect to a dynamics function or
+    simulation model.  Episodes which meet the termination condition stop
+    advancing while the remaining episodes continue.
+
+    Parameters
+    ----------
+    controllers : Controller, List of Controller, or Function () -> Controller
+        Controllers to simulate.  If a single Controller which supports
+        run_batch is passed, it is stepped once per time step for all
+        episodes.  A single Controller without batch support is copied for
+        each episode.  A function is called once per episode to construct
+        its controller.
+
+    init_obs : numpy array of shape (N, system.obs_dim)
+        Initial observation of each episode
+
+    term_cond : Function Trajectory -> bool
+        Function which returns true when termination condition is met.
+        Evaluated separately for each episode.
+
+    dynamics : Function obs, control -> newobs
+        Function defining system dynamics
+
+    dynamics_batch : Function obs[N, n], control[N, m] -> newobs[N, n]
+        Batched dynamics function. Used in place of dynamics when given.
+
+    sim_model : Model
+        Simulation model.  Used when dynamics and dynamics_batch are None.
+        It is advanced using pred_batch.
+
+    max_steps : int
+        Maximum number of simulation steps allowed.  Default is 10000.
+
+    silent : bool
+        Suppress output if True.
+
+    Returns
+    -------
+    trajs : List of Trajectory
+        Simulated trajectory of each episode.
+    """
+    if dynamics is None and dynamics_batch is None and sim_model is None:
+        raise ValueError("Must specify dynamics function or simulation model")
+
+    init_obs = np.array(init_obs, dtype=float, ndmin=2)
+    n_eps = init_obs.shape[0]
+    batch_controller, episode_controllers = _get_episode_controllers(controllers,
+            n_eps)
+    system = (batch_controller or episode_controllers[0]).system
+    obs_dim, ctrl_dim = system.obs_dim, system.ctrl_dim
+
+    capacity = min(max_steps+1, 1024)
+    obs = np.zeros((n_eps, capacity, obs_dim))
+    ctrls = np.zeros((n_eps, capacity, ctrl_dim))
+    obs[:, 0, :] = init_obs
+    x = np.copy(init_obs)
+    size = 1
+
+    init_trajs = [Trajectory(system, 1, obs[i, :1], ctrls[i, :1])
+            for i in range(n_eps)]
+    if batch_controller is not None:
+        constates = np.array([batch_controller.traj_to_state(traj)
+            for traj in init_trajs])
+    else:
+        constates = [controller.traj_to_state(traj) for controller, traj
+                in zip(episode_controllers, init_trajs)]
+    if dynamics is None and dynamics_batch is None:
+        simstates = np.array([sim_model.traj_to_state(traj)
+            for traj in init_trajs])
+
+    active = np.ones(n_eps, dtype=bool)
+    lengths = np.ones(n_eps, dtype=int)
+    if silent:
+        itr = range(max_steps)
+    else:
+        itr = tqdm(range(max_steps), file=sys.stdout)
+    for _ in itr:
+        idxs = np.nonzero(active)[0]
+        if idxs.size == 0:
+            break
+        if batch_controller is not None:
+            u, constates[idxs] = batch_controller.run_batch(constates[idxs],
+                    x[idxs])
+        else:
+            u = np.empty((idxs.size, ctrl_dim))
+            for j, i in enumerate(idxs):
+                u[j], constates[i] = episode_controllers[i].run(constates[i], x[i])
+        if dynamics_batch is not None:
+            x[idxs] = dynamics_batch(x[idxs], u)
+        elif dynamics is not None:
+            for j, i in enumerate(idxs):
+                x[i] = dynamics(x[i], u[j])
+        else:
+            simstates[idxs] = sim_model.pred_batch(simstates[idxs], u)
+            x[idxs] = simstates[idxs, :obs_dim]
+
+        if size == obs.shape[1]:
+            capacity = min(2*size, max_steps+1)
+            obs = np.concatenate([obs, np.zeros((n_eps, capacity-size, obs_dim))],
+                    axis=1)
+            ctrls = np.concatenate([ctrls, np.zeros((n_eps, capacity-size, 
+                ctrl_dim))], axis=1)
+        ctrls[idxs, size-1, :] = u
+        obs[idxs, size, :] = x[idxs]
+        size += 1
+        lengths[idxs] = size
+
+        if term_cond is not None:
+            for i in idxs:
+                traj = Trajectory(system, size, obs[i, :size], ctrls[i, :size])
+                if term_cond(traj):
+                    active[i] = False
+
+    return [Trajectory(system, lengths[i], obs[i, :lengths[i]].copy(),
+        ctrls[i, :lengths[i]].copy()) for i in range(n_eps)]
@@ -0,0 +1,135 @@
+# Standard library includes
+from collections import defaultdict
+
+# External library includes
+import numpy as np
+
+class StepTimer:
+    """
+    The StepTimer records the wall-clock time spent in each stage of
+    a control loop, one sample per time step.  simulate records the
+    stages "controller" (Controller.run), "model" (simulation model
+    prediction), "dynamics" (dynamics function) and "step" (the whole
+    loop iteration).  Samples are compared against a deadline, normally
+    the system time step, to count deadline misses.
+    """
+    def __init__(self, deadline=None):
+        """
+        Parameters
+        ----------
+        deadline : float
+            Per-step deadline in seconds.  If None, deadline misses are
+            not counted.
+        """
+        self.deadline = deadline
+        self._times = defaultdict(list)
+
+    def record(self, stage, seconds):
+        """
+        Record one timing sample.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the timed stage
+
+        seconds : float
+            Elapsed wall-clock time
+        """
+        self._times[stage].append(seconds)
+
+    @property
+    def stages(self):
+        """
+        Names of the stages with recorded samples.
+        """
+        return list(self._times.keys())
+
+    def get_times(self, stage):
+        """
+        Returns the recorded samples of a stage as a numpy array.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the timed stage
+        """
+        return np.array(self._times.get(stage, []))
+
+    def percentiles(self, stage, q=(50, 90, 99)):
+        """
+        Returns percentiles of the recorded samples of a stage.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the timed stage
+
+        q : List of float
+            Percentiles to compute, between 0 and 100.
+
+        Returns
+        -------
+        : numpy array of size len(q)
+            Percentiles in seconds.  NaN if no samples were recorded.
+        """
+        times = self.get_times(stage)
+        if times.size == 0:
+            return np.full(len(q), np.nan)
+        return np.percentile(times, q)
+
+    def histogram(self, stage, bins=20):
+        """
+        Returns a histogram of the recorded samples of a stage.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the timed stage
+
+        bins : int or numpy array
+            Number of bins or bin edges, as for numpy.histogram
+
+        Returns
+        -------
+        counts : numpy array
+            Number of samples in each bin
+
+        edges : numpy array
+            Bin edges in seconds
+        """
+        return np.histogram(self.get_times(stage), bins=bins)
+
+    def deadline_misses(self, stage="controller"):
+        """
+        Returns the number of samples of a stage which exceeded
+        the deadline.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the timed stage. Default is "controller".
+        """
+        if self.deadline is None:
+            return 0
+        return int(np.sum(self.get_times(stage) > self.deadline))
+
+    def summary(self):
+        """
+        Returns a summary of all stages as a dictionary mapping each
+        stage name to a dictionary with the sample count, mean, median,
+        90th and 99th percentile, max and number of deadline misses.
+        All entries are plain Python numbers.
+        """
+        summary = dict()
+        for stage in self.stages:
+            times = self.get_times(stage)
+            p50, p90, p99 = self.percentiles(stage)
+            summary[stage] = {"count" : int(times.size),
+                              "mean" : float(np.mean(times)),
+                              "p50" : float(p50),
+                              "p90" : float(p90),
+                              "p99" : float(p99),
+                              "max" : float(np.max(times)),
+                              "deadline_misses" : self.deadline_misses(stage)}
+        return summary
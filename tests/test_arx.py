@@ -0,0 +1,127 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import ARX
+from autompc.control import FiniteHorizonLQR, InfiniteHorizonLQR
+from autompc.costs import QuadCost
+from autompc.tasks import Task
+
+# External library includes
+import numpy as np
+import numpy.linalg as la
+
+class ARXTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for length in [1, 2, 5, 20]:
+            traj = ampc.zeros(self.system, length)
+            traj.obs[:] = rng.uniform(-1, 1, (length, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (length, 1))
+            self.trajs.append(traj)
+
+    def test_training_matrix(self):
+        for history in [1, 3]:
+            model = ARX(self.system, history=history)
+            matrix, targets = model._get_training_matrix_and_targets(self.trajs)
+            expected_matrix = np.array([model._get_feature_vector(traj, t)
+                for traj in self.trajs for t in range(1, len(traj))])
+            expected_targets = np.array([traj[t].obs for traj in self.trajs
+                for t in range(1, len(traj))])
+            self.assertTrue(np.allclose(matrix, expected_matrix))
+            self.assertTrue(np.allclose(targets, expected_targets))
+            # Rows of one trajectory agree with _get_all_feature_vectors
+            traj = self.trajs[-1]
+            self.assertTrue(np.allclose(matrix[-(len(traj)-1):],
+                model._get_all_feature_vectors(traj)[:-1]))
+
+    def test_train(self):
+        model = ARX(self.system, history=2)
+        model.train(self.trajs)
+        matrix, targets = model._get_training_matrix_and_targets(self.trajs)
+        for i in range(targets.shape[1]):
+            coeffs, _, _, _ = la.lstsq(matrix, targets[:,i], rcond=None)
+            self.assertTrue(np.allclose(model.coeffs[i], coeffs))
+
+    def test_online(self):
+        # Without forgetting, RLS continues the batch least-squares fit
+        rng = np.random.default_rng(1)
+        trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 20)
+            traj.obs[:] = rng.uniform(-1, 1, (20, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (20, 1))
+            trajs.append(traj)
+        model = ARX(self.system, history=2)
+        model.train(trajs[:2])
+        self.assertFalse(model.is_online)
+        model.enable_online(reg=0.0)
+        self.assertTrue(model.is_online)
+        traj = trajs[2]
+        state = model.traj_to_state(traj[:1])
+        for t in range(1, len(traj)):
+            state = model.update_state(state, traj[t-1].ctrl, traj[t].obs)
+        full = ARX(self.system, history=2)
+        full.train(trajs)
+        self.assertTrue(np.allclose(model.coeffs, full.coeffs, atol=1e-6))
+        A, B = model.to_linear()
+        n = self.system.obs_dim
+        self.assertTrue(np.allclose(A[:n], full.A[:n], atol=1e-6))
+        self.assertTrue(np.allclose(B[:n], full.B[:n], atol=1e-6))
+
+    def test_online_forgetting(self):
+        model = ARX(self.system, history=1)
+        model.train(self.trajs)
+        model.enable_online(forgetting=0.9, adapt_on_update=False)
+        # Data from a different linear system; the estimate converges to it
+        A_true = np.array([[0.5, 0.2], [-0.3, 0.4]])
+        B_true = np.array([[1.0], [0.0]])
+        rng = np.random.default_rng(1)
+        state = model.traj_to_state(self.trajs[0])
+        for _ in range(200):
+            u = rng.uniform(-1, 1, 1)
+            obs = A_true @ state[:2] + B_true @ u
+            model.observe(state, u, obs)
+            state = model.update_state(state, u, obs)
+        A, B = model.to_linear()
+        self.assertTrue(np.allclose(A[:2,:2], A_true, atol=1e-6))
+        self.assertTrue(np.allclose(B[:2], B_true, atol=1e-6))
+
+    def check_online_lqr_gain(self, make_controller):
+        model = ARX(self.system, history=1)
+        model.train(self.trajs)
+        task = Task(self.system)
+        task.set_cost(QuadCost(self.system, np.eye(2), np.eye(1), np.eye(2)))
+        task.set_ctrl_bound("u", -20.0, 20.0)
+        model.enable_online(forgetting=0.5)
+        controller = make_controller(task, model)
+        K = np.copy(controller.K)
+        state = controller.traj_to_state(self.trajs[-1])
+        obs = 3.0 * np.ones(2)
+        for _ in range(3):
+            _, state = controller.run(state, obs)
+        # Model adapted, but the gain is only recomputed above the threshold
+        self.assertTrue(np.allclose(controller.K, K))
+        controller.gain_update_threshold = 0.0
+        _, state = controller.run(state, obs)
+        self.assertFalse(np.allclose(controller.K, K))
+        self.assertTrue(np.allclose(controller._A, model.A))
+        # The batched path also refreshes the gain after the model adapts
+        K = np.copy(controller.K)
+        model.observe(state[:-1], np.ones(1), -obs)
+        states = np.tile(state, (2, 1))
+        controller.run_batch(states, np.tile(obs, (2, 1)))
+        self.assertFalse(np.allclose(controller.K, K))
+        self.assertTrue(np.allclose(controller._A, model.A))
+
+    def test_online_lqr_gain(self):
+        self.check_online_lqr_gain(lambda task, model: FiniteHorizonLQR(
+            self.system, task, model, horizon=5,
+            gain_update_threshold=np.inf))
+
+    def test_online_infinite_horizon_lqr_gain(self):
+        self.check_online_lqr_gain(lambda task, model: InfiniteHorizonLQR(
+            self.system, task, model, gain_update_threshold=np.inf))
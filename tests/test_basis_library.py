@@ -0,0 +1,196 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import SINDy, Koopman
+from autompc.sysid.basis_funcs import (get_identity_basis_func,
+        get_poly_basis_func, get_cross_term_basis_funcs, get_trig_basis_funcs,
+        get_trig_interaction_terms)
+from autompc.sysid.basis_library import (BasisLibrary, sindy_library,
+        koopman_library)
+from autompc.sysid.sindy import CompiledLibrary
+
+# External library includes
+import numpy as np
+import pysindy as ps
+
+def numeric_jacobian(library, X, eps=1e-6):
+    jac = np.zeros((X.shape[0], library.n_features, X.shape[1]))
+    for i in range(X.shape[1]):
+        dX = np.zeros_like(X)
+        dX[:, i] = eps
+        jac[:, :, i] = (library.evaluate(X + dX)
+                - library.evaluate(X - dX)) / (2 * eps)
+    return jac
+
+class BasisLibraryTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(-1, 1, (20, 3))
+
+    def test_evaluate(self):
+        library = BasisLibrary(3, [[(0, "pow", 1)], [(1, "pow", 3)],
+            [(2, "sin", 2)], [(0, "pow", 2), (1, "cos", 1)], []])
+        X = self.X
+        expected = np.stack([X[:,0], X[:,1]**3, np.sin(2*X[:,2]),
+            X[:,0]**2 * np.cos(X[:,1]), np.ones(X.shape[0])], axis=1)
+        self.assertTrue(np.allclose(library.evaluate(X), expected))
+        self.assertEqual(library.get_names(["a", "b", "c"]),
+                ["a", "b**3", "sin(2 c)", "a**2 cos(1 b)", "1"])
+
+    def test_jacobian(self):
+        for library in [sindy_library(3, poly_degree=3, poly_cross_terms=True,
+                    trig_freq=2, trig_interaction=True),
+                koopman_library(3, poly_degree=2, trig_freq=1,
+                    product_terms=True)]:
+            features, jac = library.jacobian(self.X)
+            self.assertTrue(np.allclose(features, library.evaluate(self.X)))
+            self.assertTrue(np.allclose(jac, numeric_jacobian(library, self.X),
+                atol=1e-6))
+
+    def test_linear_jacobian(self):
+        library = sindy_library(3, poly_degree=3, poly_cross_terms=True,
+                trig_freq=1, trig_interaction=True)
+        rng = np.random.default_rng(1)
+        coeffs = rng.normal(size=(library.n_features, 2))
+        features, jac = library.jacobian(self.X)
+        outputs, out_jac = library.linear_jacobian(self.X, coeffs)
+        self.assertTrue(np.allclose(outputs, features @ coeffs))
+        self.assertTrue(np.allclose(out_jac,
+            np.einsum("nfd,fp->npd", jac, coeffs)))
+
+    def test_subset(self):
+        library = koopman_library(3, poly_degree=3)
+        sub = library.subset([4, 0])
+        self.assertTrue(np.allclose(sub.evaluate(self.X),
+            library.evaluate(self.X)[:, [4, 0]]))
+
+    def test_sindy_library_matches_custom_library(self):
+        names = ["x0", "x1", "u0"]
+        for degree, cross, freq, interaction in [(1, False, 0, False),
+                (3, True, 2, True)]:
+            basis_funcs = [get_identity_basis_func()]
+            for f in range(1, freq+1):
+                basis_funcs += get_trig_basis_funcs(f)
+                if interaction:
+                    basis_funcs += get_trig_interaction_terms(f)
+            for d in range(2, degree+1):
+                basis_funcs.append(get_poly_basis_func(d))
+            if cross:
+                for d in range(2, degree+1):
+                    basis_funcs += get_cross_term_basis_funcs(d)
+            custom = ps.CustomLibrary(
+                    library_functions=[b.func for b in basis_funcs],
+                    function_names=[b.name_func for b in basis_funcs])
+            custom.fit(self.X)
+            compiled = CompiledLibrary(sindy_library(3, degree, cross, freq,
+                interaction)).fit(self.X)
+            self.assertTrue(np.allclose(np.asarray(custom.transform(self.X)),
+                np.asarray(compiled.transform(self.X))))
+            self.assertEqual(custom.get_feature_names(names),
+                    compiled.get_feature_names(names))
+
+class LibraryModelTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+
+    def test_koopman_state(self):
+        model = Koopman(self.system, method="lstsq", poly_basis="true",
+                poly_degree=3, trig_basis="true", trig_freq=2,
+                product_terms="true")
+        n_terms = 2 * (1 + 2 + 4)
+        self.assertEqual(model.state_dim, n_terms + n_terms*(n_terms-1)//2)
+        traj = self.trajs[0]
+        states = model.traj_to_states(traj)
+        self.assertEqual(states.shape, (len(traj), model.state_dim))
+        self.assertTrue(np.allclose(model.traj_to_state(traj), states[-1]))
+        self.assertTrue(np.allclose(states[:, :2], traj.obs))
+        self.assertTrue(np.allclose(states[:, 2:4], traj.obs**2))
+        self.assertTrue(np.allclose(states[:, 10:12], np.sin(2*traj.obs)))
+
+    def test_sindy_train(self):
+        model = SINDy(self.system, method="lstsq", poly_basis="true",
+                poly_degree=2, poly_cross_terms="true", trig_basis="true",
+                trig_freq=1, trig_interaction="true")
+        model.train(self.trajs)
+        states = np.concatenate([traj.obs[:-1] for traj in self.trajs])
+        ctrls = np.concatenate([traj.ctrls[:-1] for traj in self.trajs])
+        features = model.library.evaluate(np.concatenate([states, ctrls],
+            axis=1))
+        preds = features @ model.model.coefficients().T
+        self.assertTrue(np.allclose(model.pred_batch(states, ctrls), preds))
+
+    def test_sindy_active_terms(self):
+        rng = np.random.default_rng(1)
+        trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            traj.obs[0] = rng.uniform(-1, 1, 2)
+            for t in range(29):
+                x, y = traj.obs[t]
+                traj.obs[t+1] = [x + 0.05*y, y + 0.05*(traj.ctrls[t,0]
+                    - np.sin(x))]
+            trajs.append(traj)
+        for time_mode in ["discrete", "continuous"]:
+            model = SINDy(self.system, method="lstsq", threshold=0.05,
+                    poly_basis="true", poly_degree=3, poly_cross_terms="true",
+                    trig_basis="true", trig_freq=1, time_mode=time_mode)
+            model.train(trajs)
+            coeffs = model.model.coefficients()
+            self.assertEqual(model.active_library.n_features,
+                    np.sum(np.any(coeffs != 0, axis=0)))
+            self.assertLess(model.active_library.n_features, coeffs.shape[1])
+            states = trajs[0].obs
+            ctrls = trajs[0].ctrls
+            expected = model.model.predict(states, ctrls)
+            if time_mode == "continuous":
+                expected = states + self.system.dt * expected
+            self.assertTrue(np.allclose(model.pred_batch(states, ctrls),
+                expected))
+            self.assertTrue(np.allclose(model.pred(states[3], ctrls[3]),
+                expected[3]))
+
+    def test_sindy_pred_diff(self):
+        system = ampc.System(["a", "b", "c"], ["u", "v"], dt=0.05)
+        rng = np.random.default_rng(0)
+        trajs = []
+        for _ in range(5):
+            traj = ampc.zeros(system, 100)
+            traj.obs[:] = rng.uniform(-1, 1, (100, 3))
+            traj.ctrls[:] = rng.uniform(-1, 1, (100, 2))
+            trajs.append(traj)
+        states = rng.uniform(-1, 1, (10, 3))
+        ctrls = rng.uniform(-1, 1, (10, 2))
+        eps = 1e-6
+        for time_mode in ["discrete", "continuous"]:
+            model = SINDy(system, method="lstsq", threshold=1e-3,
+                    poly_basis="true", poly_degree=3, poly_cross_terms="true",
+                    trig_basis="true", trig_freq=2, trig_interaction="true",
+                    time_mode=time_mode)
+            model.train(trajs)
+            preds, state_jac, ctrl_jac = model.pred_diff_batch(states, ctrls)
+            self.assertTrue(np.allclose(preds, model.pred_batch(states, ctrls)))
+            for i in range(3):
+                d = np.zeros(3)
+                d[i] = eps
+                fd = (model.pred_batch(states + d, ctrls)
+                        - model.pred_batch(states - d, ctrls)) / (2 * eps)
+                self.assertTrue(np.allclose(state_jac[:, :, i], fd, atol=1e-5))
+            for i in range(2):
+                d = np.zeros(2)
+                d[i] = eps
+                fd = (model.pred_batch(states, ctrls + d)
+                        - model.pred_batch(states, ctrls - d)) / (2 * eps)
+                self.assertTrue(np.allclose(ctrl_jac[:, :, i], fd, atol=1e-5))
+            pred, sj, cj = model.pred_diff(states[0], ctrls[0])
+            self.assertTrue(np.allclose(sj, state_jac[0]))
+            self.assertTrue(np.allclose(cj, ctrl_jac[0]))
@@ -0,0 +1,104 @@
+# Standard library includes
+import time
+import tempfile
+import unittest
+
+# Internal library includes
+from autompc.benchmarks import (CartpoleSwingupBenchmark,
+        CartpoleSwingupV2Benchmark)
+from autompc.benchmarks import DatasetCache
+from autompc.benchmarks.benchmark import Benchmark
+from autompc import TrajectoryStore
+
+# External library includes
+import numpy as np
+
+class CartpoleDynamicsBatchTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(-1, 1, (10, 4))
+        self.U = rng.uniform(-20, 20, (10, 1))
+
+    def test_matches_looped(self):
+        for benchmark in [CartpoleSwingupBenchmark(),
+                CartpoleSwingupV2Benchmark()]:
+            Xnew = benchmark.dynamics_batch(self.X, self.U)
+            looped = Benchmark.dynamics_batch(benchmark, self.X, self.U)
+            self.assertTrue(np.allclose(Xnew, looped))
+
+    def test_integrators(self):
+        for integrator in ["semi_implicit", "rk4"]:
+            benchmark = CartpoleSwingupBenchmark(integrator=integrator,
+                    n_substeps=4)
+            Xnew = benchmark.dynamics_batch(self.X, self.U)
+            looped = Benchmark.dynamics_batch(benchmark, self.X, self.U)
+            self.assertTrue(np.allclose(Xnew, looped))
+            # Sub-stepped integrators converge to the same solution
+            fine = CartpoleSwingupBenchmark(integrator="euler", n_substeps=1000)
+            self.assertTrue(np.allclose(Xnew, fine.dynamics_batch(self.X,
+                self.U), atol=1e-2))
+
+    def test_unknown_integrator(self):
+        with self.assertRaises(ValueError):
+            CartpoleSwingupBenchmark(integrator="leapfrog")
+
+class DatasetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.benchmark = CartpoleSwingupBenchmark()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hit_matches_generated(self):
+        cache = DatasetCache(self.tmpdir.name)
+        trajs = cache.gen_trajs(self.benchmark, 0, 3, traj_len=20)
+        self.assertIsInstance(trajs, TrajectoryStore)
+        expected = self.benchmark.gen_trajs(0, 3, traj_len=20)
+        for traj, expected_traj in zip(trajs, expected):
+            self.assertTrue(np.array_equal(traj.obs, expected_traj.obs))
+            self.assertTrue(np.array_equal(traj.ctrls, expected_traj.ctrls))
+        hit = cache.gen_trajs(self.benchmark, 0, 3, traj_len=20)
+        self.assertEqual(hit.path, trajs.path)
+        self.assertEqual(len(cache.entries()), 1)
+
+    def test_key(self):
+        cache = DatasetCache(self.tmpdir.name)
+        key = cache.get_key(self.benchmark, 0, 3, 20)
+        self.assertEqual(key, cache.get_key(self.benchmark, 0, 3, 20))
+        self.assertNotEqual(key, cache.get_key(self.benchmark, 1, 3, 20))
+        self.assertNotEqual(key, cache.get_key(self.benchmark, 0, 3, 20,
+            batched=True))
+        rk4 = CartpoleSwingupBenchmark(integrator="rk4")
+        self.assertNotEqual(key, cache.get_key(rk4, 0, 3, 20))
+        self.assertEqual(key, cache.get_key(self.benchmark, 0, 3, 20,
+            n_workers=2))
+        self.assertEqual(key, cache.get_key(self.benchmark, 0, 3, 20,
+            n_workers=4))
+
+    def test_key_distinguishes_benchmarks(self):
+        cache = DatasetCache(self.tmpdir.name)
+        v2 = CartpoleSwingupV2Benchmark()
+        self.assertEqual(v2.name, self.benchmark.name)
+        self.assertNotEqual(cache.get_key(self.benchmark, 0, 3, 20),
+                cache.get_key(v2, 0, 3, 20))
+        trajs = cache.gen_trajs(self.benchmark, 0, 3, traj_len=20)
+        trajs_v2 = cache.gen_trajs(v2, 0, 3, traj_len=20)
+        self.assertNotEqual(trajs.path, trajs_v2.path)
+        self.assertEqual(len(cache.entries()), 2)
+
+    def test_lru_eviction(self):
+        cache = DatasetCache(self.tmpdir.name)
+        cache.gen_trajs(self.benchmark, 0, 3, traj_len=20)
+        entry_size = cache.size()
+        cache.max_bytes = int(2.5 * entry_size)
+        cache.gen_trajs(self.benchmark, 1, 3, traj_len=20)
+        time.sleep(0.01)
+        # Touch the first data set so the second is least recently used
+        cache.gen_trajs(self.benchmark, 0, 3, traj_len=20)
+        time.sleep(0.01)
+        cache.gen_trajs(self.benchmark, 2, 3, traj_len=20)
+        keys = cache.entries()
+        self.assertEqual(len(keys), 2)
+        self.assertNotIn(cache.get_key(self.benchmark, 1, 3, 20), keys)
+        self.assertLessEqual(cache.size(), cache.max_bytes)
@@ -0,0 +1,108 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.tasks import Task
+from autompc.utils.data_generation import (uniform_random_generate,
+        prbs_generate, random_walk_generate, periodic_control_generate,
+        multisine_generate)
+
+# External library includes
+import numpy as np
+
+def doubleint_dynamics(y, u, dt=0.05):
+    return y + dt * np.array([y[1], u[0]])
+
+def doubleint_dynamics_batch(ys, us, dt=0.05):
+    return ys + dt * np.stack([ys[:,1], us[:,0]], axis=1)
+
+class BatchedDataGenerationTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        self.task = Task(self.system)
+        self.task.set_ctrl_bound("u", -2.0, 2.0)
+        self.init_min = -np.ones(2)
+        self.init_max = np.ones(2)
+
+    def _generate(self, method, **kwargs):
+        rng = np.random.default_rng(0)
+        return method(self.system, self.task, doubleint_dynamics, rng,
+                init_min=self.init_min, init_max=self.init_max, traj_len=30,
+                dynamics_batch=doubleint_dynamics_batch, **kwargs)
+
+    def _check_consistent(self, trajs):
+        self.assertIsInstance(trajs, ampc.TrajectorySet)
+        for traj in trajs:
+            if traj.size == 0:
+                continue
+            self.assertTrue(np.all(traj.obs[0] >= self.init_min))
+            self.assertTrue(np.all(traj.obs[0] <= self.init_max))
+            for i in range(traj.size - 1):
+                self.assertTrue(np.allclose(traj[i+1].obs,
+                    doubleint_dynamics(traj[i].obs, traj[i].ctrl)))
+
+    def test_uniform_random(self):
+        trajs = self._generate(uniform_random_generate, n_trajs=5)
+        self.assertEqual(len(trajs), 5)
+        self.assertEqual(trajs.size, 150)
+        self.assertTrue(np.all(np.abs(trajs.ctrls) <= 2.0))
+        self._check_consistent(trajs)
+
+    def test_prbs(self):
+        trajs = self._generate(prbs_generate, n_trajs=5, states=[-1.0, 1.0],
+                Nswitch=4)
+        self.assertTrue(np.all(np.isin(trajs.ctrls, [-1.0, 1.0])))
+        self._check_consistent(trajs)
+
+    def test_random_walk(self):
+        trajs = self._generate(random_walk_generate, n_trajs=5, walk_rate=1.0)
+        self.assertTrue(np.all(np.abs(trajs.ctrls) <= 2.0))
+        self._check_consistent(trajs)
+
+    def test_periodic_control(self):
+        trajs = self._generate(periodic_control_generate, n_trajs=5,
+                U_1=np.ones(1))
+        self.assertTrue(np.allclose(trajs[0].ctrls[:,0], -2.0))
+        self._check_consistent(trajs)
+
+    def test_multisine_abort(self):
+        abort_if = lambda y: abs(y[0]) > 1.0
+        trajs = self._generate(multisine_generate, n_trajs=8, n_freqs=5,
+                abort_if=abort_if)
+        self.assertEqual(len(trajs), 8)
+        self.assertTrue(np.all(trajs.lengths <= 30))
+        for traj in trajs:
+            self.assertFalse(np.any(np.abs(traj.obs[1:,0]) > 1.0))
+        self._check_consistent(trajs)
+
+class ParallelDataGenerationTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        self.task = Task(self.system)
+        self.task.set_ctrl_bound("u", -2.0, 2.0)
+
+    def _generate(self, method, n_workers, **kwargs):
+        rng = np.random.default_rng(3)
+        return method(self.system, self.task, doubleint_dynamics, rng,
+                init_min=-np.ones(2), init_max=np.ones(2), traj_len=20,
+                n_trajs=7, n_workers=n_workers, **kwargs)
+
+    def test_independent_of_workers(self):
+        for method, kwargs in [(uniform_random_generate, {}),
+                (random_walk_generate, {"walk_rate" : 1.0}),
+                (periodic_control_generate, {"U_1" : np.ones(1)}),
+                (multisine_generate, {"n_freqs" : 5})]:
+            serial = self._generate(method, None, **kwargs)
+            self.assertIsInstance(serial, ampc.TrajectorySet)
+            for n_workers in [1, 3]:
+                parallel = self._generate(method, n_workers, **kwargs)
+                self.assertTrue(np.array_equal(serial.obs, parallel.obs))
+                self.assertTrue(np.array_equal(serial.ctrls, parallel.ctrls))
+                self.assertTrue(np.array_equal(serial.offsets,
+                    parallel.offsets))
+
+    def test_cannot_combine_with_batch(self):
+        with self.assertRaises(ValueError):
+            self._generate(uniform_random_generate, 2,
+                    dynamics_batch=doubleint_dynamics_batch)
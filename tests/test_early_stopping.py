@@ -0,0 +1,96 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import MLP, MLPFactory, ApproximateGPModel
+from autompc.sysid.early_stopping import EarlyStopping, split_validation
+
+# External library includes
+import numpy as np
+import torch
+
+class EarlyStoppingTest(unittest.TestCase):
+    def test_patience(self):
+        module = torch.nn.Linear(2, 1)
+        monitor = EarlyStopping(patience=2, min_delta=0.1)
+        losses = [1.0, 0.5, 0.45, 0.42, 0.9]
+        stops = []
+        for loss in losses:
+            with torch.no_grad():
+                module.bias.fill_(loss)
+            stops.append(monitor.update(loss, [module]))
+        # 0.45 and 0.42 do not improve by more than min_delta
+        self.assertEqual(stops, [False, False, False, True, True])
+        self.assertEqual(monitor.stop_reason, "patience")
+        self.assertEqual(monitor.best_epoch, 3)
+        monitor.restore([module])
+        self.assertAlmostEqual(module.bias.item(), 0.42)
+
+    def test_max_time(self):
+        monitor = EarlyStopping(max_time=0.0)
+        self.assertTrue(monitor.update(1.0, []))
+        self.assertEqual(monitor.stop_reason, "max_time")
+
+    def test_split_validation(self):
+        train_idx, val_idx = split_validation(100, 0.2)
+        self.assertEqual(len(val_idx), 20)
+        self.assertEqual(sorted(np.concatenate([train_idx, val_idx])),
+                list(range(100)))
+        train_idx, val_idx = split_validation(10, 0.0)
+        self.assertEqual(len(train_idx), 10)
+        self.assertEqual(len(val_idx), 0)
+        with self.assertRaises(ValueError):
+            split_validation(10, 1.0)
+
+class ModelEarlyStoppingTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+
+    def test_mlp(self):
+        model = MLP(self.system, n_hidden_layers=1, hidden_size=16,
+                n_train_iters=500, lr=1e-2, use_cuda=False,
+                early_stopping="true", patience=3, validation_fraction=0.2)
+        model.train(self.trajs)
+        self.assertEqual(model.stop_reason, "patience")
+        self.assertLess(len(model.train_history), 500)
+        val_losses = [entry["val_loss"] for entry in model.train_history]
+        best = int(np.argmin(val_losses))
+        self.assertEqual(len(val_losses) - best - 1, 3)
+
+    def test_mlp_configuration_space(self):
+        cs = MLPFactory(self.system).get_configuration_space()
+        self.assertNotIn("early_stopping", cs.get_hyperparameter_names())
+        factory = MLPFactory(self.system, tune_early_stopping=True,
+                n_train_iters=5, use_cuda=False)
+        cs = factory.get_configuration_space()
+        self.assertIn("patience", cs.get_hyperparameter_names())
+        cfg = cs.get_default_configuration()
+        cfg["early_stopping"] = "true"
+        model = factory(cfg, self.trajs)
+        self.assertTrue(model.early_stopping)
+        self.assertEqual(model.patience, 10)
+
+    def test_approximate_gp(self):
+        model = ApproximateGPModel(self.system, niter=200, batch_size=32,
+                induce_count=20, use_cuda=False, early_stopping=True,
+                patience=2, min_delta=1e-1, max_train_time=30)
+        model.train(self.trajs, silent=True)
+        self.assertIsNotNone(model.stop_reason)
+        self.assertLess(len(model.train_history), 200)
+
+    def test_gp_split_seed(self):
+        model = ApproximateGPModel(self.system, use_cuda=False,
+                early_stopping=True, validation_fraction=0.2)
+        XUt, dYt = np.arange(60.0).reshape(20, 3), np.zeros((20, 2))
+        for seed in [0, 7]:
+            _, val_idx = split_validation(20, 0.2, seed)
+            val_x = model._split_data(XUt, dYt, seed)[2]
+            self.assertTrue(np.array_equal(val_x.numpy(), XUt[val_idx]))
@@ -0,0 +1,110 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import SINDy, Koopman
+from autompc.sysid.basis_library import sindy_library, koopman_library
+from autompc.sysid.feature_cache import FeatureCache, get_feature_cache
+
+# External library includes
+import numpy as np
+
+class FeatureCacheTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(-1, 1, (50, 3))
+
+    def test_matches_library(self):
+        cache = FeatureCache()
+        library = sindy_library(3, poly_degree=3, poly_cross_terms=True,
+                trig_freq=2, trig_interaction=True)
+        features = cache.evaluate(library, self.X)
+        self.assertTrue(np.allclose(features, library.evaluate(self.X)))
+        self.assertEqual(cache.misses, library.n_features)
+        self.assertEqual(cache.hits, 0)
+        features = cache.evaluate(library, self.X)
+        self.assertTrue(np.allclose(features, library.evaluate(self.X)))
+        self.assertEqual(cache.hits, library.n_features)
+
+    def test_shared_terms(self):
+        cache = FeatureCache()
+        small = koopman_library(3, poly_degree=2, trig_freq=0)
+        large = koopman_library(3, poly_degree=3, trig_freq=1)
+        cache.evaluate(small, self.X)
+        features = cache.evaluate(large, self.X)
+        self.assertTrue(np.allclose(features, large.evaluate(self.X)))
+        self.assertEqual(cache.hits, small.n_features)
+        self.assertEqual(cache.misses, large.n_features)
+        # Different data does not reuse the columns
+        cache.evaluate(small, self.X + 1.0)
+        self.assertEqual(cache.hits, small.n_features)
+
+    def test_eviction(self):
+        library = koopman_library(3, poly_degree=2, trig_freq=0)
+        column_bytes = self.X.shape[0] * 8
+        cache = FeatureCache(max_bytes=2 * column_bytes)
+        cache.evaluate(library, self.X)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+        # Only the most recently inserted columns are kept
+        cache.evaluate(library.subset([library.n_features - 1]), self.X)
+        self.assertEqual(cache.hits, 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_disabled(self):
+        cache = FeatureCache(max_bytes=0)
+        library = koopman_library(3, poly_degree=2, trig_freq=1)
+        features = cache.evaluate(library, self.X)
+        self.assertTrue(np.allclose(features, library.evaluate(self.X)))
+        self.assertEqual(len(cache), 0)
+
+class FeatureCacheModelTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+        self.cache = get_feature_cache()
+        self.max_bytes = self.cache.max_bytes
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.max_bytes = self.max_bytes
+        self.cache.clear()
+
+    def train_koopman(self, **kwargs):
+        model = Koopman(self.system, method="lstsq", poly_basis="true",
+                product_terms="false", **kwargs)
+        model.train(self.trajs)
+        return model
+
+    def test_koopman_reuse(self):
+        self.train_koopman(poly_degree=2)
+        hits = self.cache.hits
+        model = self.train_koopman(poly_degree=3)
+        self.assertGreater(self.cache.hits, hits)
+        self.cache.max_bytes = 0
+        self.cache.clear()
+        uncached = self.train_koopman(poly_degree=3)
+        self.assertTrue(np.allclose(model.A, uncached.A))
+        self.assertTrue(np.allclose(model.B, uncached.B))
+
+    def test_sindy_reuse(self):
+        def train():
+            model = SINDy(self.system, method="lstsq", poly_basis="true",
+                    poly_degree=2)
+            model.train(self.trajs)
+            return model
+        first = train()
+        hits = self.cache.hits
+        second = train()
+        self.assertGreater(self.cache.hits, hits)
+        self.assertTrue(np.allclose(first.active_coeffs,
+            second.active_coeffs))
@@ -0,0 +1,237 @@
+# Standard library includes
+import shutil
+import tempfile
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import Koopman, KoopmanFactory
+from autompc.sysid.stable_koopman import StableKoopmanSolver
+
+# External library includes
+import numpy as np
+
+class KoopmanOnlineTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(4):
+            traj = ampc.zeros(self.system, 20)
+            traj.obs[:] = rng.uniform(-1, 1, (20, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (20, 1))
+            self.trajs.append(traj)
+
+    def test_online_matches_batch(self):
+        model = Koopman(self.system, method="lstsq", poly_basis="true",
+                poly_degree=2, product_terms="false")
+        model.train(self.trajs[:3])
+        self.assertFalse(model.is_online)
+        model.enable_online(reg=0.0)
+        traj = self.trajs[3]
+        state = model.traj_to_state(traj[:1])
+        for t in range(1, len(traj)):
+            state = model.update_state(state, traj[t-1].ctrl, traj[t].obs)
+        full = Koopman(self.system, method="lstsq", poly_basis="true",
+                poly_degree=2, product_terms="false")
+        full.train(self.trajs)
+        A, B = model.to_linear()
+        self.assertTrue(np.allclose(A, full.A, atol=1e-6))
+        self.assertTrue(np.allclose(B, full.B, atol=1e-6))
+
+    def test_observe_requires_online(self):
+        model = Koopman(self.system, method="lstsq", product_terms="false")
+        model.train(self.trajs)
+        state = model.traj_to_state(self.trajs[0])
+        with self.assertRaises(ValueError):
+            model.observe(state, np.zeros(1), np.zeros(2))
+
+class KoopmanNormalTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for length in [20, 35, 1, 50]:
+            traj = ampc.zeros(self.system, length)
+            traj.obs[:] = rng.uniform(-1, 1, (length, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (length, 1))
+            self.trajs.append(traj)
+
+    def make_model(self, method, **kwargs):
+        return Koopman(self.system, method=method, poly_basis="true",
+                poly_degree=2, trig_basis="true", trig_freq=1,
+                product_terms="false", **kwargs)
+
+    def test_matches_lstsq(self):
+        lstsq = self.make_model("lstsq")
+        lstsq.train(self.trajs)
+        for chunk_size in [7, 10000]:
+            normal = self.make_model("normal", ridge_alpha=0.0,
+                    chunk_size=chunk_size)
+            normal.train(self.trajs)
+            self.assertTrue(np.allclose(normal.A, lstsq.A, atol=1e-6))
+            self.assertTrue(np.allclose(normal.B, lstsq.B, atol=1e-6))
+
+    def test_ridge(self):
+        small = self.make_model("normal", ridge_alpha=1e-8)
+        small.train(self.trajs)
+        large = self.make_model("normal", ridge_alpha=1e3)
+        large.train(self.trajs)
+        self.assertLess(np.linalg.norm(large.A), np.linalg.norm(small.A))
+
+    def test_trajectory_store(self):
+        path = tempfile.mkdtemp()
+        try:
+            store = ampc.TrajectoryStore(path, system=self.system)
+            store.append(self.trajs[:2])
+            store.append(self.trajs[2:])
+            from_store = self.make_model("normal", chunk_size=16)
+            from_store.train(store)
+            in_memory = self.make_model("normal")
+            in_memory.train(self.trajs)
+            self.assertTrue(np.allclose(from_store.A, in_memory.A))
+            self.assertTrue(np.allclose(from_store.B, in_memory.B))
+        finally:
+            shutil.rmtree(path)
+
+    def test_configuration_space(self):
+        factory = KoopmanFactory(self.system)
+        cs = factory.get_configuration_space()
+        cfg = cs.get_default_configuration()
+        cfg["method"] = "normal"
+        cfg["ridge_alpha"] = 1e-4
+        model = factory(cfg, self.trajs)
+        self.assertAlmostEqual(model.ridge_alpha, 1e-4)
+        self.assertEqual(model.A.shape, (model.state_dim, model.state_dim))
+
+class KoopmanReductionTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(5):
+            traj = ampc.zeros(self.system, 40)
+            traj.ctrls[:] = rng.uniform(-1, 1, (40, 1))
+            traj.obs[0] = rng.uniform(-1, 1, 2)
+            for t in range(39):
+                x, y = traj.obs[t]
+                traj.obs[t+1] = [0.9*x + 0.1*y, 0.8*y - 0.1*x**2
+                        + 0.1*traj.ctrls[t,0]]
+            self.trajs.append(traj)
+
+    def make_model(self, method="lstsq", **kwargs):
+        return Koopman(self.system, method=method, poly_basis="true",
+                poly_degree=3, trig_basis="true", trig_freq=2,
+                product_terms=True, **kwargs)
+
+    def test_reduced_state(self):
+        full = self.make_model()
+        full.train(self.trajs)
+        model = self.make_model(reduce_order="true", energy_threshold=0.99)
+        model.train(self.trajs)
+        self.assertLess(model.state_dim, full.state_dim)
+        A, B = model.to_linear()
+        self.assertEqual(A.shape, (model.state_dim, model.state_dim))
+        self.assertEqual(B.shape, (model.state_dim, 1))
+        traj = self.trajs[0]
+        state = model.traj_to_state(traj)
+        self.assertEqual(state.shape, (model.state_dim,))
+        self.assertTrue(np.allclose(state[:2], traj[-1].obs))
+        states = model.traj_to_states(traj)
+        self.assertTrue(np.allclose(states[-1], state))
+        preds = model.pred_batch(states[:-1], traj.ctrls[:-1])
+        self.assertLess(np.abs(preds[:, :2] - traj.obs[1:]).max(), 0.05)
+        newstate = model.update_state(state, traj[-1].ctrl, traj[-1].obs)
+        self.assertTrue(np.allclose(newstate, state))
+
+    def test_max_rank(self):
+        model = self.make_model(reduce_order=True, energy_threshold=0.99999,
+                max_rank=3)
+        model.train(self.trajs)
+        self.assertEqual(model.state_dim, 2 + 3)
+
+    def test_normal_matches_lstsq(self):
+        lstsq = self.make_model(reduce_order=True, energy_threshold=0.99)
+        lstsq.train(self.trajs)
+        normal = self.make_model("normal", ridge_alpha=0.0, chunk_size=50,
+                reduce_order=True, energy_threshold=0.99)
+        normal.train(self.trajs)
+        self.assertEqual(normal.state_dim, lstsq.state_dim)
+        states = lstsq.traj_to_states(self.trajs[0])
+        # Projections agree up to the signs of the singular vectors, so
+        # compare predicted observations
+        self.assertTrue(np.allclose(
+            normal.pred_batch(normal.traj_to_states(self.trajs[0]),
+                self.trajs[0].ctrls)[:, :2],
+            lstsq.pred_batch(states, self.trajs[0].ctrls)[:, :2], atol=1e-5))
+
+class StableKoopmanTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n, m, N = 6, 2, 500
+        A = rng.normal(size=(n, n)) * 0.2
+        B = rng.normal(size=(n, m))
+        self.X = rng.normal(size=(n, N))
+        self.U = rng.normal(size=(m, N))
+        self.Y = A @ self.X + B @ self.U + 0.01*rng.normal(size=(n, N))
+
+    def test_gradients(self):
+        # Gram-based objective and gradients agree with the data-based ones
+        solver = StableKoopmanSolver()
+        solver.solve(self.X, self.U, self.Y)
+        rng = np.random.default_rng(1)
+        n, m = self.X.shape[0], self.U.shape[0]
+        S = np.eye(n) + 0.1*rng.normal(size=(n, n))
+        S = S @ S.T
+        U, _ = np.linalg.qr(rng.normal(size=(n, n)))
+        B = np.diag(rng.uniform(0, 1, n))
+        Bcon = rng.normal(size=(n, m))
+        error, cache = solver._objective(S, U, B, Bcon)
+        # Objective and gradients computed directly from the data
+        Sinv = np.linalg.inv(S)
+        R = Sinv @ U @ B @ S
+        Error = self.Y - Bcon @ self.U - R @ self.X
+        temp1 = -Sinv.T @ Error @ self.X.T
+        expected = [-temp1 @ R.T + B.T @ U.T @ temp1, temp1 @ S.T @ B.T,
+                U.T @ temp1 @ S.T, -Error @ self.U.T]
+        self.assertAlmostEqual(error, np.linalg.norm(Error, "fro"))
+        for grad, expected_grad in zip(solver._gradients(cache), expected):
+            self.assertTrue(np.allclose(grad, expected_grad))
+
+    def test_solve(self):
+        solver = StableKoopmanSolver(max_iter=30, tol=0.0)
+        A, S, U, B, Bcon, error = solver.solve(self.X, self.U, self.Y)
+        self.assertLessEqual(np.abs(np.linalg.eigvals(A)).max(), 1.0 + 1e-8)
+        errors = [entry["error"] for entry in solver.history]
+        self.assertTrue(all(e1 >= e2 - 1e-9 for e1, e2 in zip(errors, errors[1:])))
+        self.assertAlmostEqual(errors[-1], error)
+
+    def test_stopping(self):
+        solver = StableKoopmanSolver(max_iter=1000, tol=1e-2)
+        solver.solve(self.X, self.U, self.Y)
+        self.assertIn(solver.stop_reason, ["tol", "converged", "no_descent"])
+        self.assertLess(len(solver.history), 1000)
+        solver = StableKoopmanSolver(max_iter=1000, tol=0.0, max_time=0.0)
+        solver.solve(self.X, self.U, self.Y)
+        self.assertEqual(len(solver.history), 1)
+        self.assertEqual(solver.stop_reason, "max_time")
+
+    def test_warm_start(self):
+        solver = StableKoopmanSolver(tol=0.0)
+        A, _, _, _, Bcon, error = solver.solve(self.X, self.U, self.Y)
+        warm = StableKoopmanSolver(max_iter=2)
+        _, _, _, _, _, warm_error = warm.solve(self.X, self.U, self.Y,
+                warm_start=(A, Bcon))
+        self.assertLessEqual(warm_error, error * (1 + 1e-6))
+
+    def test_koopman_stable(self):
+        system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        traj = ampc.zeros(system, 100)
+        traj.obs[:] = self.X[:2, :100].T
+        traj.ctrls[:] = self.U[:1, :100].T
+        model = Koopman(system, method="stable", product_terms="false",
+                stable_max_iter=5)
+        model.train([traj])
+        self.assertLessEqual(len(model.stable_history), 4)
+        self.assertLessEqual(np.abs(np.linalg.eigvals(model.A)).max(),
+                1.0 + 1e-8)
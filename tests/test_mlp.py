@@ -0,0 +1,138 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import MLP
+from autompc.sysid.mlp import ForwardNet
+
+# External library includes
+import numpy as np
+import torch
+
+class MLPJacobianTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+        self.states = rng.uniform(-1, 1, (5, 2))
+        self.ctrls = rng.uniform(-1, 1, (5, 1))
+
+    def test_forward_jacobian(self):
+        torch.manual_seed(0)
+        x = torch.randn(6, 3, dtype=torch.double)
+        for nonlintype in ["relu", "selu", "tanh", "sigmoid"]:
+            net = ForwardNet(3, 2, [16, 8], nonlintype).double()
+            y, jac = net.forward_jacobian(x)
+            self.assertTrue(torch.allclose(y, net(x)))
+            for i in range(x.shape[0]):
+                expected = torch.autograd.functional.jacobian(net, x[i])
+                self.assertTrue(torch.allclose(jac[i], expected))
+
+    def test_pred_diff(self):
+        model = MLP(self.system, n_hidden_layers=2, hidden_size=16,
+                nonlintype="tanh", n_train_iters=2, use_cuda=False)
+        model.train(self.trajs)
+        preds, state_jacs, ctrl_jacs = model.pred_diff_batch(self.states,
+                self.ctrls)
+        self.assertEqual(state_jacs.shape, (5, 2, 2))
+        self.assertEqual(ctrl_jacs.shape, (5, 2, 1))
+        self.assertTrue(np.allclose(preds,
+            model.pred_batch(self.states, self.ctrls)))
+        eps = 1e-6
+        for i in range(2):
+            d = np.zeros(2)
+            d[i] = eps
+            fd = (model.pred_batch(self.states + d, self.ctrls)
+                    - model.pred_batch(self.states - d, self.ctrls)) / (2*eps)
+            self.assertTrue(np.allclose(state_jacs[:, :, i], fd, atol=1e-6))
+        fd = (model.pred_batch(self.states, self.ctrls + eps)
+                - model.pred_batch(self.states, self.ctrls - eps)) / (2*eps)
+        self.assertTrue(np.allclose(ctrl_jacs[:, :, 0], fd, atol=1e-6))
+        pred, state_jac, ctrl_jac = model.pred_diff(self.states[0],
+                self.ctrls[0])
+        self.assertTrue(np.allclose(pred, preds[0]))
+        self.assertTrue(np.allclose(state_jac, state_jacs[0]))
+        self.assertTrue(np.allclose(ctrl_jac, ctrl_jacs[0]))
+
+class MLPTrainTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+
+    def test_train_history(self):
+        n_threads = torch.get_num_threads()
+        model = MLP(self.system, n_hidden_layers=1, hidden_size=16,
+                n_train_iters=20, n_batch=16, lr=1e-2, use_cuda=False,
+                n_threads=1)
+        model.train(self.trajs)
+        self.assertEqual(torch.get_num_threads(), n_threads)
+        self.assertEqual(len(model.train_history), 20)
+        for entry in model.train_history:
+            self.assertGreater(entry["samples_per_sec"], 0)
+        self.assertLess(model.train_history[-1]["loss"],
+                model.train_history[0]["loss"])
+
+class MLPExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+        self.states = rng.uniform(-1, 1, (5, 2))
+        self.ctrls = rng.uniform(-1, 1, (5, 1))
+
+    def test_matches_torch(self):
+        for nonlintype in ["relu", "selu", "tanh", "sigmoid"]:
+            model = MLP(self.system, n_hidden_layers=2, hidden_size=16,
+                    nonlintype=nonlintype, n_train_iters=2, use_cuda=False)
+            model.train(self.trajs)
+            preds = model.pred_batch(self.states, self.ctrls)
+            pred = model.pred(self.states[0], self.ctrls[0])
+            diff = model.pred_diff_batch(self.states, self.ctrls)
+            model.compile_numpy()
+            self.assertTrue(np.allclose(model.pred_batch(self.states,
+                self.ctrls), preds))
+            self.assertTrue(np.allclose(model.pred(self.states[0],
+                self.ctrls[0]), pred))
+            for a, b in zip(model.pred_diff_batch(self.states, self.ctrls),
+                    diff):
+                self.assertTrue(np.allclose(a, b))
+            # Buffers are reallocated for a new batch size
+            self.assertTrue(np.allclose(model.pred_batch(self.states[:2],
+                self.ctrls[:2]), preds[:2]))
+
+    def test_float32(self):
+        model = MLP(self.system, n_hidden_layers=2, hidden_size=16,
+                nonlintype="tanh", n_train_iters=2, use_cuda=False)
+        model.train(self.trajs)
+        preds = model.pred_batch(self.states, self.ctrls)
+        model.compile_numpy(np.float32)
+        self.assertTrue(np.allclose(model.pred_batch(self.states,
+            self.ctrls), preds, atol=1e-5))
+
+    def test_numpy_inference(self):
+        model = MLP(self.system, n_hidden_layers=1, hidden_size=16,
+                n_train_iters=2, use_cuda=False, numpy_inference=True)
+        model.train(self.trajs)
+        self.assertIsNotNone(model._executor)
+        other = MLP(self.system, n_hidden_layers=1, hidden_size=16,
+                use_cuda=False, numpy_inference=True)
+        other.set_parameters(model.get_parameters())
+        self.assertTrue(np.allclose(other.pred_batch(self.states, self.ctrls),
+            model.pred_batch(self.states, self.ctrls)))
@@ -0,0 +1,109 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import MLPEnsemble, MLPEnsembleFactory
+from autompc.control import MPPI
+from autompc.costs import QuadCost
+from autompc.tasks import Task
+
+# External library includes
+import numpy as np
+import torch
+
+class MLPEnsembleTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for _ in range(3):
+            traj = ampc.zeros(self.system, 30)
+            traj.obs[:] = rng.uniform(-1, 1, (30, 2))
+            traj.ctrls[:] = rng.uniform(-1, 1, (30, 1))
+            self.trajs.append(traj)
+        self.states = rng.uniform(-1, 1, (7, 2))
+        self.ctrls = rng.uniform(-1, 1, (7, 1))
+
+    def make_model(self, **kwargs):
+        model = MLPEnsemble(self.system, n_members=3, n_hidden_layers=2,
+                hidden_size=16, nonlintype="tanh", n_train_iters=3,
+                use_cuda=False, **kwargs)
+        model.train(self.trajs, silent=True)
+        return model
+
+    def test_stacked_members(self):
+        model = self.make_model()
+        net = model.net
+        x = torch.randn(7, 3, dtype=torch.double)
+        mean, logvar = net(x.expand(3, -1, -1))
+        for k in range(3):
+            h = x
+            for W, b in zip(net.weights[:-1], net.biases[:-1]):
+                h = torch.tanh(h @ W[k] + b[k])
+            out = h @ net.weights[-1][k] + net.biases[-1][k]
+            self.assertTrue(torch.allclose(mean[k], out[:, :2]))
+        self.assertEqual(logvar.shape, (3, 7, 2))
+        # Inference reuses activation buffers
+        with torch.no_grad():
+            for _ in range(2):
+                mean_ng, logvar_ng = net(x.expand(3, -1, -1))
+                self.assertTrue(torch.allclose(mean_ng, mean))
+                self.assertTrue(torch.allclose(logvar_ng, logvar))
+        self.assertTrue(torch.all(logvar <= net.max_logvar))
+
+    def test_pred(self):
+        model = self.make_model()
+        means, variances = model.pred_members(self.states, self.ctrls)
+        self.assertEqual(means.shape, (3, 7, 2))
+        self.assertTrue(np.all(variances > 0))
+        preds = model.pred_batch(self.states, self.ctrls)
+        self.assertTrue(np.allclose(preds, means.mean(axis=0)))
+        self.assertTrue(np.allclose(model.pred(self.states[0],
+            self.ctrls[0]), preds[0]))
+
+    def test_pred_diff(self):
+        model = self.make_model(probabilistic="false")
+        preds, state_jacs, ctrl_jacs = model.pred_diff_batch(self.states,
+                self.ctrls)
+        self.assertTrue(np.allclose(preds,
+            model.pred_batch(self.states, self.ctrls)))
+        eps = 1e-6
+        for i in range(2):
+            d = np.zeros(2)
+            d[i] = eps
+            fd = (model.pred_batch(self.states + d, self.ctrls)
+                    - model.pred_batch(self.states - d, self.ctrls)) / (2*eps)
+            self.assertTrue(np.allclose(state_jacs[:, :, i], fd, atol=1e-6))
+        fd = (model.pred_batch(self.states, self.ctrls + eps)
+                - model.pred_batch(self.states, self.ctrls - eps)) / (2*eps)
+        self.assertTrue(np.allclose(ctrl_jacs[:, :, 0], fd, atol=1e-6))
+
+    def test_batch_sampler(self):
+        model = self.make_model(probabilistic="false")
+        sample = model.get_batch_sampler(7, seed=0)
+        self.assertEqual(sorted(np.bincount(sample.members)), [2, 2, 3])
+        means, _ = model.pred_members(self.states, self.ctrls)
+        expected = means[sample.members, np.arange(7)]
+        self.assertTrue(np.allclose(sample(self.states, self.ctrls),
+            expected))
+
+    def test_mppi(self):
+        model = self.make_model()
+        task = Task(self.system)
+        task.set_cost(QuadCost(self.system, np.eye(2), np.eye(1), np.eye(2)))
+        task.set_ctrl_bound("u", -1.0, 1.0)
+        controller = MPPI(self.system, task, model, horizon=5, num_path=20,
+                sample_model=True)
+        state = controller.traj_to_state(self.trajs[0])
+        ctrl, state = controller.run(state, self.trajs[0][-1].obs)
+        self.assertEqual(ctrl.shape, (1,))
+        self.assertTrue(np.all(np.isfinite(ctrl)))
+
+    def test_factory(self):
+        factory = MLPEnsembleFactory(self.system, n_train_iters=1,
+                use_cuda=False)
+        cfg = factory.get_configuration_space().get_default_configuration()
+        model = factory(cfg, self.trajs, silent=True)
+        self.assertEqual(model.n_members, 5)
+        self.assertTrue(model.probabilistic)
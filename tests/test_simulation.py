@@ -0,0 +1,215 @@
+# Standard library includes
+import time
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import ARX
+from autompc.costs import QuadCost
+from autompc.tasks import Task
+from autompc.control import ZeroController, FiniteHorizonLQR
+
+# External library includes
+import numpy as np
+
+def doubleint_dynamics(y, u, dt=0.05):
+    return y + dt * np.array([y[1], u[0]])
+
+def doubleint_dynamics_batch(ys, us, dt=0.05):
+    return ys + dt * np.stack([ys[:,1], us[:,0]], axis=1)
+
+def sample_init_obs(rng):
+    return rng.uniform(-1, 1, 2)
+
+class SimulateBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        cost = QuadCost(self.system, np.eye(2), np.eye(1), np.eye(2),
+                goal=[-1,0])
+        self.task = Task(self.system)
+        self.task.set_cost(cost)
+        self.task.set_ctrl_bound("u", -20.0, 20.0)
+
+        rng = np.random.default_rng(0)
+        trajs = []
+        for _ in range(20):
+            traj = ampc.zeros(self.system, 50)
+            y = rng.uniform(-1, 1, 2)
+            for i in range(50):
+                traj[i].obs[:] = y
+                traj[i].ctrl[:] = rng.uniform(-1, 1, 1)
+                y = doubleint_dynamics(y, traj[i].ctrl)
+            trajs.append(traj)
+        self.model = ARX(self.system, history=1)
+        self.model.train(trajs, silent=True)
+        self.init_obs = rng.uniform(-1, 1, (5, 2))
+
+    def _check_matches(self, trajs, controller_fn, **kwargs):
+        self.assertEqual(len(trajs), self.init_obs.shape[0])
+        for traj, x0 in zip(trajs, self.init_obs):
+            ref = ampc.simulate(controller_fn(), x0, silent=True, **kwargs)
+            self.assertEqual(traj.size, ref.size)
+            self.assertTrue(np.allclose(traj.obs, ref.obs))
+            self.assertTrue(np.allclose(traj.ctrls, ref.ctrls))
+
+    def test_batch_controller(self):
+        controller_fn = lambda: FiniteHorizonLQR(self.system, self.task,
+                self.model, horizon=10)
+        controller = controller_fn()
+        self.assertTrue(controller.is_batch)
+        trajs = ampc.simulate_batch(controller, self.init_obs,
+                dynamics_batch=doubleint_dynamics_batch, max_steps=30,
+                silent=True)
+        self._check_matches(trajs, controller_fn, dynamics=doubleint_dynamics,
+                max_steps=30)
+
+    def test_sim_model(self):
+        controller_fn = lambda: ZeroController(self.system, self.task, self.model)
+        trajs = ampc.simulate_batch(controller_fn, self.init_obs,
+                sim_model=self.model, max_steps=20, silent=True)
+        self._check_matches(trajs, controller_fn, sim_model=self.model,
+                max_steps=20)
+
+    def test_term_cond(self):
+        controller_fn = lambda: FiniteHorizonLQR(self.system, self.task,
+                self.model, horizon=10)
+        term_cond = lambda traj: abs(traj[-1].obs[0]) > 0.8
+        controllers = [controller_fn() for _ in range(self.init_obs.shape[0])]
+        trajs = ampc.simulate_batch(controllers, self.init_obs,
+                term_cond=term_cond, dynamics=doubleint_dynamics,
+                max_steps=40, silent=True)
+        self._check_matches(trajs, controller_fn, term_cond=term_cond,
+                dynamics=doubleint_dynamics, max_steps=40)
+
+class EpisodeRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        cost = QuadCost(self.system, np.eye(2), np.eye(1), np.eye(2),
+                goal=[-1,0])
+        self.task = Task(self.system)
+        self.task.set_cost(cost)
+        self.task.set_num_steps(20)
+        self.controller = ZeroController(self.system, self.task, None)
+
+    def test_matches_simulate(self):
+        init_obs = np.random.default_rng(0).uniform(-1, 1, (6, 2))
+        with ampc.EpisodeRunner(self.controller, self.task,
+                dynamics=doubleint_dynamics, n_workers=2,
+                return_trajs=True) as runner:
+            results = runner.run(init_obs)
+        self.assertEqual(len(results), 6)
+        for result, x0 in zip(results, init_obs):
+            traj = ampc.simulate(self.controller, x0, self.task.term_cond,
+                    dynamics=doubleint_dynamics, max_steps=20, silent=True)
+            self.assertAlmostEqual(result.cost, self.task.get_cost()(traj))
+            self.assertTrue(np.allclose(result.final_obs, traj[-1].obs))
+            self.assertEqual(result.length, traj.size)
+            self.assertTrue(np.allclose(result.traj[0], traj.obs))
+
+    def test_seeding_independent_of_workers(self):
+        def noisy_dynamics(y, u):
+            return doubleint_dynamics(y, u) + 0.01 * np.random.randn(2)
+        costs = []
+        for n_workers in [1, 3]:
+            with ampc.EpisodeRunner(self.controller, self.task,
+                    dynamics=noisy_dynamics, n_workers=n_workers) as runner:
+                costs.append([result.cost for result
+                    in runner.run([sample_init_obs] * 7, seed=5)])
+        self.assertTrue(np.allclose(costs[0], costs[1]))
+        self.assertEqual(len(set(costs[0])), 7)
+
+    def test_run_async(self):
+        init_obs = np.array([[0.5, 0.0]])
+        with ampc.EpisodeRunner(self.controller, self.task,
+                dynamics=doubleint_dynamics, n_workers=2,
+                timing=True) as runner, ampc.EpisodeRunner(self.controller,
+                self.task, dynamics=doubleint_dynamics, n_workers=1) as local:
+            batches = [runner.run_async(init_obs), local.run_async(init_obs)]
+            results = [batch.get()[0] for batch in batches]
+            # One episode only needs one worker process
+            self.assertEqual(runner._pool_size, 1)
+            self.assertEqual(len(runner.run(np.zeros((8, 2)))), 8)
+            self.assertEqual(runner._pool_size, 2)
+        self.assertAlmostEqual(results[0].cost, results[1].cost)
+        self.assertGreater(results[0].timing["controller"]["count"], 0)
+        self.assertIsNone(results[1].timing)
+
+class StepTimerTest(unittest.TestCase):
+    def test_statistics(self):
+        timer = ampc.utils.StepTimer(deadline=0.05)
+        for t in [0.01, 0.02, 0.03, 0.06, 0.1]:
+            timer.record("controller", t)
+        self.assertEqual(timer.deadline_misses("controller"), 2)
+        self.assertTrue(np.allclose(timer.percentiles("controller", [50, 100]),
+            [0.03, 0.1]))
+        counts, edges = timer.histogram("controller", bins=3)
+        self.assertEqual(counts.sum(), 5)
+        summary = timer.summary()["controller"]
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["deadline_misses"], 2)
+        self.assertAlmostEqual(summary["max"], 0.1)
+
+    def test_simulate_timing(self):
+        system = ampc.System(["x", "y"], ["u"], dt=0.05)
+        task = Task(system)
+        controller = ZeroController(system, task, None)
+        traj = ampc.simulate(controller, np.zeros(2), dynamics=doubleint_dynamics,
+                max_steps=10, silent=True, timing=True)
+        self.assertEqual(traj.timing.deadline, 0.05)
+        for stage in ["controller", "dynamics", "step"]:
+            self.assertEqual(traj.timing.get_times(stage).size, 10)
+        untimed = ampc.simulate(controller, np.zeros(2),
+                dynamics=doubleint_dynamics, max_steps=10, silent=True)
+        self.assertIsNone(untimed.timing)
+        self.assertEqual(traj, untimed)
+
+class SlowPlanningController(ZeroController):
+    """
+    Outputs the control 1 and plans the controls 2, 3, ...  Sleeps
+    during the steps listed in slow_steps.
+    """
+    def __init__(self, system, task, model, slow_steps, delay):
+        super().__init__(system, task, model)
+        self.slow_steps = slow_steps
+        self.delay = delay
+        self.step = 0
+
+    def run(self, state, new_obs):
+        if self.step in self.slow_steps:
+            time.sleep(self.delay)
+        self.step += 1
+        return np.ones(self.system.ctrl_dim), state
+
+    def get_plan(self):
+        return np.arange(2, 12, dtype=float).reshape(-1, 1)
+
+class RealtimeRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"], dt=0.01)
+        self.task = Task(self.system)
+
+    def _run(self, policy, **kwargs):
+        controller = SlowPlanningController(self.system, self.task, None,
+                slow_steps=[2, 3], delay=0.03)
+        runner = ampc.utils.RealtimeRunner(controller,
+                dynamics=doubleint_dynamics, overrun_policy=policy, **kwargs)
+        traj = runner.run(np.zeros(2), max_steps=6)
+        self.assertEqual(runner.overrun_steps, [2, 3])
+        self.assertEqual(traj.timing.deadline_misses("controller"), 2)
+        self.assertEqual(traj.timing.get_times("jitter").size, 6)
+        return traj
+
+    def test_hold(self):
+        traj = self._run("hold")
+        self.assertTrue(np.array_equal(traj.ctrls[:6,0], [1, 1, 1, 1, 1, 1]))
+
+    def test_shift(self):
+        traj = self._run("shift")
+        self.assertTrue(np.array_equal(traj.ctrls[:6,0], [1, 1, 2, 3, 1, 1]))
+
+    def test_fallback(self):
+        fallback = ZeroController(self.system, self.task, None)
+        traj = self._run("fallback", fallback_controller=fallback)
+        self.assertTrue(np.array_equal(traj.ctrls[:6,0], [1, 1, 0, 0, 1, 1]))
@@ -0,0 +1,166 @@
+# Standard library includes
+import os
+import pickle
+import tempfile
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc import TrajectoryBuilder
+
+# External library includes
+import numpy as np
+
+class TrajectoryBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+
+    def test_append_grows(self):
+        builder = TrajectoryBuilder(self.system, capacity=2)
+        for i in range(10):
+            builder.append([i, -i], [2*i])
+        self.assertEqual(len(builder), 10)
+        self.assertGreaterEqual(builder.capacity, 10)
+        traj = builder.to_trajectory()
+        self.assertEqual(traj.size, 10)
+        self.assertTrue(np.array_equal(traj.obs[:,0], np.arange(10)))
+        self.assertTrue(np.array_equal(traj.ctrls[:,0], 2*np.arange(10)))
+
+    def test_view_shares_memory(self):
+        builder = TrajectoryBuilder(self.system, capacity=4)
+        builder.extend(np.ones((3, 2)), np.zeros((3, 1)))
+        view = builder.view()
+        view[-1].ctrl[:] = 5.0
+        self.assertEqual(builder.ctrls[-1, 0], 5.0)
+        self.assertEqual(view.size, 3)
+
+    def test_matches_extend(self):
+        builder = TrajectoryBuilder(self.system, capacity=1)
+        traj = ampc.zeros(self.system, 1)
+        builder.append(np.zeros(2))
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            obs = rng.normal(size=(1,2))
+            ctrl = rng.normal(size=(1,1))
+            traj = ampc.extend(traj, obs, ctrl)
+            builder.extend(obs, ctrl)
+        self.assertEqual(builder.view(), traj)
+
+    def test_unpickle_without_timing(self):
+        traj = ampc.zeros(self.system, 3)
+        # Trajectories pickled before timings were recorded lack _timing
+        del traj._timing
+        traj = pickle.loads(pickle.dumps(traj))
+        self.assertIsNone(traj.timing)
+
+class TrajectorySetTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for length in [5, 1, 8, 3]:
+            traj = ampc.zeros(self.system, length)
+            traj.obs[:] = rng.normal(size=(length, 2))
+            traj.ctrls[:] = rng.normal(size=(length, 1))
+            self.trajs.append(traj)
+        self.trajset = ampc.TrajectorySet.from_trajs(self.trajs)
+
+    def test_views(self):
+        self.assertEqual(len(self.trajset), 4)
+        self.assertEqual(self.trajset.size, 17)
+        for traj, view in zip(self.trajs, self.trajset):
+            self.assertEqual(traj, view)
+        self.assertEqual(self.trajset[-1], self.trajs[-1])
+        self.assertTrue(np.shares_memory(self.trajset[2].obs, self.trajset.obs))
+
+    def test_transitions(self):
+        states, ctrls, next_states, deltas = self.trajset.get_transitions()
+        X = np.concatenate([traj.obs[:-1] for traj in self.trajs])
+        U = np.concatenate([traj.ctrls[:-1] for traj in self.trajs])
+        Y = np.concatenate([traj.obs[1:] for traj in self.trajs])
+        self.assertTrue(np.array_equal(states, X))
+        self.assertTrue(np.array_equal(ctrls, U))
+        self.assertTrue(np.array_equal(next_states, Y))
+        self.assertTrue(np.allclose(deltas, Y - X))
+        self.assertIs(self.trajset.get_transitions()[0], states)
+
+    def test_windows(self):
+        obs_windows, ctrl_windows = self.trajset.get_windows(2)
+        expected = [traj.obs[t:t+3] for traj in self.trajs 
+                for t in range(len(traj) - 2)]
+        self.assertEqual(obs_windows.shape, (len(expected), 3, 2))
+        self.assertEqual(ctrl_windows.shape, (len(expected), 2, 1))
+        self.assertTrue(np.array_equal(obs_windows, np.array(expected)))
+
+    def test_subset(self):
+        subset = self.trajset.subset([2, 0])
+        self.assertEqual(len(subset), 2)
+        self.assertEqual(subset[0], self.trajs[2])
+        self.assertEqual(subset[1], self.trajs[0])
+        self.assertEqual(len(self.trajset[1:3]), 2)
+
+class TrajectoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.1
+        rng = np.random.default_rng(0)
+        self.trajs = []
+        for length in [5, 2, 8, 3, 4]:
+            traj = ampc.zeros(self.system, length)
+            traj.obs[:] = rng.normal(size=(length, 2))
+            traj.ctrls[:] = rng.normal(size=(length, 1))
+            self.trajs.append(traj)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "store")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_and_reopen(self):
+        store = ampc.TrajectoryStore(self.path, self.system)
+        store.append(self.trajs[:2])
+        store.append(self.trajs[2:])
+        self.assertEqual(len(store), 5)
+
+        reopened = ampc.TrajectoryStore(self.path)
+        self.assertEqual(reopened.system, self.system)
+        for traj, stored in zip(self.trajs, reopened):
+            self.assertEqual(traj, stored)
+        self.assertIsInstance(reopened[3].obs, np.memmap)
+
+    def test_subset_and_load(self):
+        store = ampc.TrajectoryStore(self.path, self.system)
+        store.append(self.trajs[:3])
+        store.append(self.trajs[3:])
+        subset = store.subset([4, 1])
+        self.assertEqual(subset[0], self.trajs[4])
+        self.assertEqual(subset[1], self.trajs[1])
+        self.assertEqual(sum(len(chunk) for chunk in subset.iter_chunks()), 2)
+
+        trajset = ampc.to_trajectory_set(store)
+        self.assertEqual(trajset.size, sum(len(traj) for traj in self.trajs))
+        for traj, loaded in zip(self.trajs, trajset):
+            self.assertEqual(traj, loaded)
+
+        unpickled = pickle.loads(pickle.dumps(subset))
+        self.assertEqual(unpickled[0], self.trajs[4])
+
+    def test_subset_load_is_cached(self):
+        store = ampc.TrajectoryStore(self.path, self.system)
+        store.append(self.trajs[:3])
+        store.append(self.trajs[3:])
+        indices = [4, 1, 3, 0, 1]
+        subset = store.subset(indices)
+        trajset = ampc.to_trajectory_set(subset)
+        self.assertEqual(len(trajset), len(indices))
+        for i, loaded in zip(indices, trajset):
+            self.assertEqual(loaded, self.trajs[i])
+        self.assertIs(ampc.to_trajectory_set(subset), trajset)
+        self.assertIsNone(pickle.loads(pickle.dumps(subset))._trajset)
+
+        # A subset does not share the chunk list of its parent
+        store.append(self.trajs[:1])
+        self.assertEqual(len(store), 6)
+        self.assertEqual(len(store.subset([5])), 1)
+        self.assertEqual(len(subset._chunk_names), 2)
+        self.assertEqual(len(ampc.to_trajectory_set(store)), 6)